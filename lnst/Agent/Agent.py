@@ -15,22 +15,30 @@ import importlib.machinery
 import signal
 import logging
 import os, stat
+import io
 import sys
+import pickle
 import datetime
+import select
 import socket
 import ctypes
 import multiprocessing
 import types
-from time import sleep
+import hashlib
+import functools
+import zlib
+from time import sleep, monotonic
 from inspect import isclass
 from tempfile import NamedTemporaryFile
 from lnst.Common.Logs import log_exc_traceback
+from lnst.Common.LoggingHandler import unpack_log_batch
 from lnst.Common.PacketCapture import PacketCapture
-from lnst.Common.Utils import die_when_parent_die
+from lnst.Common.Utils import die_when_parent_die, sha256sum_prefix
 from lnst.Common.ExecCmd import exec_cmd, ExecCmdFail
 from lnst.Common.ResourceCache import ResourceCache
 from lnst.Common.Utils import check_process_running
 from lnst.Common.Utils import is_installed
+from lnst.Common.Utils import concurrency_safe, is_concurrency_safe
 from lnst.Common.ConnectionHandler import send_data
 from lnst.Common.ConnectionHandler import ConnectionHandler
 from lnst.Common.DeviceRef import DeviceRef
@@ -40,14 +48,21 @@ from lnst.Common.DeviceError import DeviceConfigValueError
 from lnst.Common.Parameters import Parameters
 from lnst.Common.Version import lnst_version
 from lnst.Agent.Job import Job, JobContext
+from lnst.Agent.JobWorkerPool import JobWorkerPool
 from lnst.Agent.InterfaceManager import InterfaceManager
+from lnst.Agent.DeviceStateManager import DeviceStateManager
 from lnst.Agent.BridgeTool import BridgeTool
 from lnst.Agent.AgentSecSocket import AgentSecSocket, SecSocketException
+from lnst.Agent.RpcDispatcher import RpcDispatcher
 
 # maximum time the server should block on select -- forces frequent Netlink
 # checks
 MAX_SERVER_HANG = 5
 
+# how long a network namespace process waits for the direct controller
+# connection before it keeps relaying through the root namespace process
+NETNS_ACCEPT_TIMEOUT = 60
+
 Devices = types.ModuleType("Devices")
 Devices.__path__ = ["lnst.Devices"]
 
@@ -76,6 +91,7 @@ class RemoteMethods:
                  server_handler, agent_config, agent_server):
         self._packet_captures = {}
         self._if_manager = None
+        self._device_state = None
         self._job_context = job_context
         self._log_ctl = log_ctl
         self._net_namespaces = net_namespaces
@@ -86,15 +102,17 @@ class RemoteMethods:
         self._capture_files = {}
         self._copy_targets = {}
         self._copy_sources = {}
+        self._copy_digests = {}
         self._system_config = {}
 
-        self._cache = ResourceCache(agent_config.get_option("cache", "dir"),
-                                    agent_config.get_option("cache", "expiration_period"))
+        self._cache = None
+        self._init_cache(agent_config.get_option("cache", "dir"))
 
         self._dynamic_modules = {}
         self._dynamic_classes = {}
         self._dynamic_objects = {}
 
+    @concurrency_safe
     def hello(self):
         logging.info("Recieved a controller connection.")
 
@@ -129,12 +147,7 @@ class RemoteMethods:
             logging.warning("NetworkManager is running on a agent machine!")
             logging.warning("=============================================")
 
-        for device in self._if_manager.get_devices():
-            try:
-                device.down()
-                device.store_cleanup_data()
-            except DeviceDisabled:
-                pass
+        self._device_state.snapshot(self._if_manager.get_devices())
 
         return True
 
@@ -158,6 +171,15 @@ class RemoteMethods:
 
     def load_cached_module(self, module_name, res_hash):
         self._cache.renew_entry(res_hash)
+        self._load_module(module_name, res_hash)
+
+    def load_cached_modules(self, modules):
+        """Loads a list of (module_name, res_hash) tuples in order"""
+        self._cache.renew_entries([res_hash for _, res_hash in modules])
+        for module_name, res_hash in modules:
+            self._load_module(module_name, res_hash)
+
+    def _load_module(self, module_name, res_hash):
         if module_name in self._dynamic_modules:
             return
         module_path = self._cache.get_path(res_hash)
@@ -177,6 +199,9 @@ class RemoteMethods:
 
     def init_if_manager(self):
         self._if_manager = InterfaceManager(self._server_handler)
+        self._device_state = DeviceStateManager(
+            self._if_manager,
+            self._agent_config.get_option("environment", "device_workers"))
         for cls_name in dir(Devices):
             cls = getattr(Devices, cls_name)
             if isclass(cls):
@@ -231,6 +256,20 @@ class RemoteMethods:
         dev = self._if_manager.get_device(ifindex)
         return setattr(dev, name, value)
 
+    @concurrency_safe
+    def get_rpc_stats(self):
+        return self._agent_server.get_rpc_stats()
+
+    def get_device_timings(self):
+        if self._device_state is None:
+            return None
+        return self._device_state.get_timings()
+
+    def get_if_manager_stats(self):
+        if self._if_manager is None:
+            return None
+        return self._if_manager.get_stats()
+
     def get_devices(self):
         devices = self._if_manager.get_devices()
         result = {}
@@ -285,12 +324,17 @@ class RemoteMethods:
             return
 
         devices = self._if_manager.get_devices()
+        # the original configuration is restored for all the devices at
+        # once after they're deconfigured
+        held = self._device_state.hold_restore(devices)
         for dev in devices:
             try:
                 dev.destroy()
             except (DeviceDisabled, DeviceDeleted, DeviceConfigValueError):
                 pass
-            self._if_manager.rescan_devices()
+            self._if_manager.sync_devices()
+
+        self._device_state.restore(held)
 
     # def add_route(self, if_id, dest):
         # dev = self._if_manager.get_mapped_device(if_id)
@@ -389,7 +433,7 @@ class RemoteMethods:
         job_instance = Job(job, self._log_ctl)
         self._job_context.add_job(job_instance)
 
-        res = job_instance.run()
+        res = job_instance.run(self._job_context.get_worker_pool())
 
         return res
 
@@ -410,11 +454,15 @@ class RemoteMethods:
     def machine_cleanup(self):
         logging.info("Performing machine cleanup.")
         self._job_context.kill_all_jobs()
+        self._job_context.get_worker_pool().shutdown()
 
         self.restore_system_config()
 
         if self._if_manager is not None:
             self._if_manager.deconfigure_all()
+            self._if_manager.close_ipr()
+            self._if_manager.close_ethtool()
+            self._device_state.shutdown()
 
         for netns in list(self._net_namespaces.keys()):
             self.del_namespace(netns)
@@ -435,72 +483,133 @@ class RemoteMethods:
         self._dynamic_classes = {}
         self._dynamic_modules = {}
         self._if_manager = None
+        self._device_state = None
         self._server_handler.set_if_manager(None)
         self._cache.del_old_entries()
         self._remove_capture_files()
         return True
 
+    @concurrency_safe
     def has_resource(self, res_hash):
         if self._cache.query(res_hash):
             return True
 
         return False
 
-    def add_resource_to_cache(self, res_type, local_path, name):
+    @concurrency_safe
+    def has_resources(self, res_hashes):
+        """Returns a {hash: bool} dict of the cached state of the resources"""
+        return self._cache.query_many(res_hashes)
+
+    def add_resource_to_cache(self, res_type, local_path, name, keep=()):
+        """Adds a resource to the cache
+
+        keep lists the hashes of the cached resources the controller syncs
+        along with this one, they aren't evicted to make room for it.
+        """
         if res_type == "file":
-            self._cache.add_file_entry(local_path, name)
+            self._cache.add_file_entry(local_path, name, keep)
             return True
         else:
             raise Exception("Unknown resource type")
 
-    def start_copy_to(self, filepath=None):
+    def add_resource_bundle_to_cache(self, local_path, names, keep=()):
+        """Adds the files of a tar archive to the cache
+
+        names maps the archive member names (file digests) to resource names,
+        the archive itself is removed afterwards. keep is the same as for
+        add_resource_to_cache.
+        """
+        try:
+            self._cache.add_archive_entries(local_path, names, keep)
+        finally:
+            os.remove(local_path)
+        return True
+
+    def start_copy_to(self, filepath=None, offset=0):
         if filepath in self._copy_targets:
             return ""
 
         if filepath:
-            self._copy_targets[filepath] = open(filepath, "w+b")
+            if offset and os.path.isfile(filepath):
+                target = open(filepath, "r+b")
+                target.truncate(offset)
+                target.seek(offset)
+            else:
+                target = open(filepath, "w+b")
+            self._copy_targets[filepath] = target
         else:
             tmpfile = NamedTemporaryFile("w+b", delete=False)
             filepath = tmpfile.name
             self._copy_targets[filepath] = tmpfile
 
+        self._copy_digests[("to", filepath)] = hashlib.sha256()
         return filepath
 
-    def copy_part_to(self, filepath, data):
+    def copy_part_to(self, filepath, data, compressed=False):
         if self._copy_targets[filepath]:
+            if compressed:
+                data = zlib.decompress(data)
             self._copy_targets[filepath].write(data)
+            self._copy_digests[("to", filepath)].update(data)
             return True
 
         return False
 
-    def finish_copy_to(self, filepath):
+    def finish_copy_to(self, filepath, digest=None):
+        """Closes the target file
+
+        If digest is provided it's compared to the sha256 of the data written
+        since start_copy_to, returns False on mismatch.
+        """
         if self._copy_targets[filepath]:
             self._copy_targets[filepath].close()
 
             del self._copy_targets[filepath]
-            return True
+            written = self._copy_digests.pop(("to", filepath))
+            return digest is None or digest == written.hexdigest()
 
         return False
 
-    def start_copy_from(self, filepath):
+    def start_copy_from(self, filepath, offset=0):
         if filepath in self._copy_sources or not os.path.exists(filepath):
             return False
 
         self._copy_sources[filepath] = open(filepath, "rb")
+        self._copy_sources[filepath].seek(offset)
+        self._copy_digests[("from", filepath)] = hashlib.sha256()
         return True
 
-    def copy_part_from(self, filepath, buffsize):
+    def copy_part_from(self, filepath, buffsize, compress=False):
         data = self._copy_sources[filepath].read(buffsize)
+        self._copy_digests[("from", filepath)].update(data)
+        if compress:
+            data = zlib.compress(data, 1)
         return data
 
     def finish_copy_from(self, filepath):
+        """Closes the source file
+
+        Returns the sha256 hexdigest of the data read since start_copy_from.
+        """
         if filepath in self._copy_sources:
             self._copy_sources[filepath].close()
             del self._copy_sources[filepath]
-            return True
+            return self._copy_digests.pop(("from", filepath)).hexdigest()
 
         return False
 
+    @concurrency_safe
+    def get_file_digest(self, filepath, length=None):
+        """Used to check whether a partial transfer can be resumed
+
+        Returns a (hashed_length, hexdigest) tuple of the first length bytes
+        of the file or None if the file doesn't exist.
+        """
+        if not os.path.isfile(filepath):
+            return None
+        return sha256sum_prefix(filepath, length)
+
     def reset_file_transfers(self):
         for file_handle in self._copy_targets.values():
             file_handle.close()
@@ -509,13 +618,32 @@ class RemoteMethods:
         for file_handle in self._copy_sources.values():
             file_handle.close()
         self._copy_sources = {}
+        self._copy_digests = {}
+
+    def _init_cache(self, cache_dir):
+        self._cache = ResourceCache(
+            cache_dir,
+            self._agent_config.get_option("cache", "expiration_period"),
+            self._agent_config.get_option("cache", "size_limit"))
 
-    def add_namespace(self, netns):
+    def add_namespace(self, netns, direct=False):
+        """Creates the network namespace netns served by a forked process
+
+        With direct=True the controller connects to the namespace process
+        directly instead of relaying through this process, the port to
+        connect to is returned.
+        """
         if netns in self._net_namespaces:
             logging.debug("Network namespace %s already exists." % netns)
         else:
             logging.debug("Creating network namespace %s." % netns)
+            listener = None
+            if direct:
+                # created before the fork so that it stays reachable in the
+                # root network namespace
+                listener = self._server_handler.create_netns_listener()
             read_pipe, write_pipe = multiprocessing.Pipe()
+            self._log_ctl.flush_connection()
             pid = os.fork()
             if pid != 0:
                 self._net_namespaces[netns] = {"pid": pid,
@@ -526,6 +654,10 @@ class RemoteMethods:
                 if result["result"] != True:
                     raise Exception("Namespace creation failed")
 
+                if listener is not None:
+                    port = listener.getsockname()[1]
+                    listener.close()
+                    return port
                 return True
             elif pid == 0:
                 self._agent_server.set_netns_sighandlers()
@@ -598,6 +730,8 @@ class RemoteMethods:
 
                 self._server_handler.set_netns(netns)
                 self._server_handler.set_ctl_sock((write_pipe, "root_netns"))
+                if listener is not None:
+                    self._server_handler.set_netns_listener(listener)
 
                 self._log_ctl.disable_logging()
                 self._log_ctl.set_origin_name(netns)
@@ -605,6 +739,13 @@ class RemoteMethods:
 
                 self.init_if_manager()
 
+                # the namespace process gets a cache of its own, sharing the
+                # index with the parent would let either of them evict
+                # files the other one still references
+                self._init_cache(os.path.join(
+                    self._agent_config.get_option("cache", "dir"),
+                    "netns", netns))
+
                 logging.debug("Created network namespace %s" % netns)
                 return True
             else:
@@ -641,7 +782,7 @@ class RemoteMethods:
 
     def set_dev_netns(self, dev, dst):
         exec_cmd("ip link set %s netns %s" % (dev.name, dst))
-        self._if_manager.rescan_devices()
+        self._if_manager.sync_devices()
         #TODO check if device appeared in the destination namespace
         return True
 
@@ -757,8 +898,9 @@ class RemoteMethods:
         return True
 
 class ServerHandler(ConnectionHandler):
-    def __init__(self, addr, agent_config):
+    def __init__(self, addr, agent_config, log_ctl):
         super(ServerHandler, self).__init__()
+        self._log_ctl = log_ctl
         self._netns_con_mapping = {}
         try:
             self._s_socket = socket.socket()
@@ -771,6 +913,9 @@ class ServerHandler(ConnectionHandler):
 
         self._netns = None
         self._c_socket = None
+        self._netns_listener = None
+        self._netns_listener_deadline = None
+        self._root_netns_sock = None
 
         self._if_manager = None
 
@@ -793,6 +938,64 @@ class ServerHandler(ConnectionHandler):
         self.add_connection(self._c_socket[1], self._c_socket[0])
         return self._c_socket
 
+    def create_netns_listener(self):
+        """Creates the socket a network namespace process accepts a direct
+        controller connection on, has to be called in the root namespace"""
+        listener = socket.socket(self._s_socket.family)
+        listener.bind((self._s_socket.getsockname()[0], 0))
+        listener.listen(1)
+        return listener
+
+    def set_netns_listener(self, listener):
+        self._netns_listener = listener
+        self._netns_listener_deadline = monotonic() + NETNS_ACCEPT_TIMEOUT
+
+    def has_netns_listener(self):
+        return self._netns_listener is not None
+
+    def netns_connection_ready(self):
+        """Polls the netns listener without blocking, the pipe to the root
+        namespace process is served until the controller connects. Once
+        NETNS_ACCEPT_TIMEOUT passes the listener is closed and the pipe
+        stays the controller connection."""
+        rl, _, _ = select.select([self._netns_listener], [], [], 0)
+        if rl:
+            return True
+
+        if monotonic() > self._netns_listener_deadline:
+            logging.warning("No direct connection received, relaying "
+                            "through the root network namespace process.")
+            self.close_netns_listener()
+        return False
+
+    def close_netns_listener(self):
+        self._netns_listener.close()
+        self._netns_listener = None
+        self._netns_listener_deadline = None
+
+    def accept_netns_connection(self):
+        """Replaces the pipe to the root namespace process with a direct
+        controller connection, the pipe stays open for the root process"""
+        raw_socket, addr = self._netns_listener.accept()
+        c_socket = AgentSecSocket(raw_socket)
+        logging.info("Recieved direct connection from %s" % addr[0])
+
+        # a stalled peer mustn't keep the pipe from being served
+        raw_socket.settimeout(NETNS_ACCEPT_TIMEOUT)
+        try:
+            c_socket.handshake(self._security)
+        except:
+            c_socket.close()
+            raise
+        raw_socket.settimeout(None)
+
+        self.close_netns_listener()
+
+        self._root_netns_sock = self._c_socket
+        self._c_socket = (c_socket, addr[0])
+        self.add_connection(self._c_socket[1], self._c_socket[0])
+        return self._c_socket
+
     def get_ctl_sock(self):
         try:
             return self._c_socket[0]
@@ -838,6 +1041,10 @@ class ServerHandler(ConnectionHandler):
         if self.get_connection(addr) == None:
             logging.info("Lost controller connection.")
             self.close_c_sock()
+            if self._root_netns_sock is not None:
+                # fall back to relaying through the root namespace process
+                self._c_socket = self._root_netns_sock
+                self._root_netns_sock = None
         return messages
 
     def get_messages_from_con(self, con_id):
@@ -851,12 +1058,14 @@ class ServerHandler(ConnectionHandler):
 
     def send_data_to_ctl(self, data):
         if self._c_socket != None:
-            if self._netns != None:
+            if self._root_netns_sock is not None:
+                data = dict(data, netns=self._netns)
+            elif self._netns != None:
                 data = {"type": "from_netns",
                         "netns": self._netns,
                         "data": data}
             data = device_to_deviceref(data)
-            return send_data(self._c_socket[0], data)
+            return self._log_ctl.send_data(self._c_socket[0], data)
         else:
             return False
 
@@ -957,15 +1166,57 @@ def deviceref_to_device(if_manager, obj):
         return obj
 
 
+# calls that don't change the state inherited by the job workers
+JOB_STATE_NEUTRAL_METHODS = ("run_job", "kill_job", "dev_getattr",
+                             "get_device", "get_devices",
+                             "get_devices_by_devname", "get_devices_by_hwaddr",
+                             "get_devices_by_params", "get_if_manager_stats",
+                             "get_device_timings")
+
+class _JobPickler(pickle.Pickler):
+    """Pickles the devices of a job for a job worker as their ifindexes"""
+    def persistent_id(self, obj):
+        Device = getattr(Devices, "Device", None)
+        if Device is not None and isinstance(obj, Device):
+            return obj.ifindex
+        return None
+
+def dump_job(what):
+    data = io.BytesIO()
+    _JobPickler(data, pickle.HIGHEST_PROTOCOL).dump(what)
+    return data.getvalue()
+
+def load_job(if_manager, data):
+    unpickler = pickle.Unpickler(io.BytesIO(data))
+    unpickler.persistent_load = if_manager.get_device
+    return unpickler.load()
+
+
+def _copy_request_id(request, response):
+    # the controller matches responses to its requests by this id, it's
+    # absent for messages sent by older controllers
+    if "request_id" in request:
+        response["request_id"] = request["request_id"]
+
+
 class Agent:
     def __init__(self, log_ctl, agent_config):
         self._agent_config = agent_config
         die_when_parent_die()
 
-        self._job_context = JobContext()
+        # changed by the calls that may change the state the job workers
+        # inherit from this process, see JobWorkerPool
+        self._job_state = 0
+        self._job_context = JobContext(JobWorkerPool(
+            log_ctl,
+            agent_config.get_option("environment", "job_workers"),
+            self._get_job_state,
+            dump_job,
+            lambda data: load_job(self._methods._if_manager, data),
+            self._after_job_fork))
         port = agent_config.get_option("environment", "rpcport")
         logging.info("Using RPC port %d." % port)
-        self._server_handler = ServerHandler(("", port), agent_config)
+        self._server_handler = ServerHandler(("", port), agent_config, log_ctl)
 
         self._net_namespaces = {}
 
@@ -973,6 +1224,9 @@ class Agent:
                                       self._net_namespaces,
                                       self._server_handler, agent_config,
                                       self)
+        self._rpc_dispatcher = RpcDispatcher(
+            self._server_handler,
+            agent_config.get_option("environment", "rpc_workers"))
 
         self.register_die_signal(signal.SIGHUP)
         self.register_die_signal(signal.SIGINT)
@@ -994,7 +1248,20 @@ class Agent:
                         continue
                     self._log_ctl.set_connection(self._server_handler.get_ctl_sock())
 
+                if (self._server_handler.has_netns_listener() and
+                        self._server_handler.netns_connection_ready()):
+                    try:
+                        self._server_handler.accept_netns_connection()
+                    except (socket.error, SecSocketException):
+                        continue
+                    self._log_ctl.set_connection(self._server_handler.get_ctl_sock())
+
+                self._job_context.get_worker_pool().prefork()
+
+                ctl_sock = self._server_handler.get_ctl_sock()
                 msgs = self._server_handler.get_messages()
+                if self._server_handler.get_ctl_sock() not in (ctl_sock, None):
+                    self._log_ctl.set_connection(self._server_handler.get_ctl_sock())
 
                 for msg in msgs:
                     self._process_msg(msg[1])
@@ -1003,6 +1270,19 @@ class Agent:
 
         self._methods.machine_cleanup()
 
+    def _after_job_fork(self):
+        # the netlink sockets of the InterfaceManager must not be shared
+        # with the Agent, replies could be read by the wrong process
+        if self._methods._if_manager is not None:
+            self._methods._if_manager.reopen_after_fork()
+
+    def _get_job_state(self):
+        if_manager = self._methods._if_manager
+        if if_manager is None:
+            return (self._job_state, None, None)
+        return (self._job_state, id(if_manager),
+                if_manager.get_stats()["events"])
+
     def wait_for_result(self, id):
         result = None
         while result == None:
@@ -1029,26 +1309,28 @@ class Agent:
                     args = msg["args"]
                     kwargs = msg["kwargs"]
 
-                try:
-                    result = method(*args, **kwargs)
-                except LnstError as e:
-                    log_exc_traceback()
-                    response = {"type": "exception", "Exception": e}
-
-                    self._server_handler.send_data_to_ctl(response)
-                    return
-
-                response = {"type": "result", "result": result}
-                response = device_to_deviceref(response)
-                self._server_handler.send_data_to_ctl(response)
+                safe = self._is_concurrency_safe(msg["method_name"], method,
+                                                 args)
+                if (not safe and
+                        msg["method_name"] not in JOB_STATE_NEUTRAL_METHODS):
+                    self._job_state += 1
+                self._rpc_dispatcher.dispatch(
+                    msg["method_name"],
+                    functools.partial(self._call_method, msg, method, args,
+                                      kwargs, safe),
+                    self._server_handler.send_data_to_ctl,
+                    safe)
             else:
                 err = LnstError("Method '%s' not supported." % msg["method_name"])
                 response = {"type": "exception", "Exception": err}
+                _copy_request_id(msg, response)
                 self._server_handler.send_data_to_ctl(response)
-        elif msg["type"] == "log":
+        elif msg["type"] == "rpc_completed":
+            self._rpc_dispatcher.process_completed()
+        elif msg["type"] == "log_batch":
             logger = logging.getLogger()
-            record = logging.makeLogRecord(msg["record"])
-            logger.handle(record)
+            for log_record in unpack_log_batch(msg):
+                logger.handle(logging.makeLogRecord(log_record))
         elif msg["type"] == "exception":
             if msg["cmd_id"] != None:
                 logging.debug("Recieved an exception from command with id: %s"
@@ -1064,6 +1346,8 @@ class Agent:
             job = self._job_context.pop_job(msg["job_id"])
             job.join()
 
+            # the pipe of a job worker is reused by its next job
+            self._server_handler.remove_connection_by_id(msg["job_id"])
             job.set_finished(msg["result"])
             self._server_handler.send_data_to_ctl(msg)
 
@@ -1077,6 +1361,7 @@ class Agent:
             except LnstError as e:
                 log_exc_traceback()
                 response = {"type": "exception", "Exception": e}
+                _copy_request_id(msg["data"], response)
 
                 self._server_handler.send_data_to_ctl(response)
                 return
@@ -1086,6 +1371,40 @@ class Agent:
         pipes = self._job_context.get_parent_pipes()
         self._server_handler.update_connections(pipes)
 
+    def _call_method(self, msg, method, args, kwargs, in_worker=False):
+        try:
+            result = method(*args, **kwargs)
+        except Exception as e:
+            # unexpected exceptions of calls in the event loop are fatal as
+            # they always were, a worker has to report them
+            if not isinstance(e, LnstError) and not in_worker:
+                raise
+            log_exc_traceback()
+            if not isinstance(e, LnstError):
+                e = LnstError(e)
+            response = {"type": "exception", "Exception": e}
+            _copy_request_id(msg, response)
+            return response
+
+        response = {"type": "result", "result": result}
+        _copy_request_id(msg, response)
+        return device_to_deviceref(response)
+
+    def _is_concurrency_safe(self, method_name, method, args):
+        if method_name == "dev_method":
+            # only the class of the device matters, no need to refresh it
+            try:
+                dev = self._methods._if_manager.get_cached_device(args[0])
+            except Exception:
+                return False
+            if dev is None:
+                return False
+            method = getattr(type(dev), args[1], None)
+        return is_concurrency_safe(method)
+
+    def get_rpc_stats(self):
+        return self._rpc_dispatcher.get_stats()
+
     def register_die_signal(self, signum):
         signal.signal(signum, self._signal_die_handler)
 
@@ -15,7 +15,7 @@ import os
 import hashlib
 import logging
 from lnst.Common.SecureSocket import SecureSocket
-from lnst.Common.SecureSocket import DH_GROUP, SRP_GROUP
+from lnst.Common.SecureSocket import DH_GROUP, SRP_GROUP, WIRE_VERSIONS
 from lnst.Common.SecureSocket import SecSocketException
 from lnst.Common.Utils import not_imported
 
@@ -65,9 +65,16 @@ class AgentSecSocket(SecureSocket):
         self._ctl_random = ctl_hello["ctl_random"]
         self._agent_random = os.urandom(28)
 
+        # controllers not supporting the negotiation only know version 1
+        common_versions = (set(ctl_hello.get("wire_versions", [1])) &
+                           set(WIRE_VERSIONS))
+        wire_version = max(common_versions, default=1)
+
         agent_hello = {"type": "agent_hello",
-                       "agent_random": self._agent_random}
+                       "agent_random": self._agent_random,
+                       "wire_version": wire_version}
         self.send_msg(agent_hello)
+        self._set_wire_version(wire_version)
 
         if sec_params["auth_types"] == "none":
             logging.warning("===================================")
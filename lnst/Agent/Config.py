@@ -23,11 +23,31 @@ class AgentConfig(Config):
                 "additive" : False,
                 "action" : self.optionPath,
                 "name" : "log_dir"}
+        self._options['environment']['log_store_size'] = {\
+                "value" : 256*1024*1024, # 256 MiB
+                "additive" : False,
+                "action" : self.optionSize,
+                "name" : "log_store_size"}
         self._options['environment']['rpcport'] = {\
                 "value" : DefaultRPCPort,
                 "additive" : False,
                 "action" : self.optionPort,
                 "name" : "rpcport"}
+        self._options['environment']['rpc_workers'] = {\
+                "value" : 4,
+                "additive" : False,
+                "action" : self.optionInt,
+                "name" : "rpc_workers"}
+        self._options['environment']['job_workers'] = {\
+                "value" : 4,
+                "additive" : False,
+                "action" : self.optionInt,
+                "name" : "job_workers"}
+        self._options['environment']['device_workers'] = {\
+                "value" : 8,
+                "additive" : False,
+                "action" : self.optionInt,
+                "name" : "device_workers"}
 
         self._options['cache'] = dict()
         self._options['cache']['dir'] = {\
@@ -43,6 +63,12 @@ class AgentConfig(Config):
                 "action" : self.optionTimeval,
                 "name" : "expiration_period"}
 
+        self._options['cache']['size_limit'] = {\
+                "value" : 1024*1024*1024, # 1 GiB
+                "additive" : False,
+                "action" : self.optionSize,
+                "name" : "size_limit"}
+
         self._options['security'] = dict()
         self._options['security']['auth_types'] = {\
                 "value" : "none",
@@ -0,0 +1,145 @@
+"""
+Defines the DeviceStateManager class used by the Agent to store and restore
+the original configuration of its devices.
+
+Copyright 2024 Red Hat, Inc.
+Licensed under the GNU General Public License, version 2 as
+published by the Free Software Foundation; see COPYING for details.
+"""
+
+import os
+import time
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from lnst.Common.DeviceError import DeviceDisabled, DeviceDeleted
+
+
+class DeviceStateManager(object):
+    """
+    Stores and restores the original configuration of all the devices at
+    once.
+
+    The devices store and restore their configuration themselves
+    (Device.store_cleanup_data and Device.restore_original_data), this runs
+    it for the devices concurrently in a pool of worker threads so that
+    a slow driver only delays its own devices. Every worker uses netlink
+    handles of its own (InterfaceManager.get_ipr and get_ethtool are per
+    thread). The link changes made by the workers are refreshed together in
+    the event loop thread, within an InterfaceManager.netlink_batch block.
+
+    Restoring is split from the device cleanup: hold_restore takes the
+    stored configuration from the devices before they're deconfigured and
+    restore puts it back and restores it afterwards.
+
+    The time spent on every device is recorded, see get_timings.
+    """
+    def __init__(self, if_manager, max_workers=8):
+        self._if_manager = if_manager
+        self._max_workers = max_workers
+
+        self._pid = None
+        self._pool = None
+
+        self._timings_lock = threading.Lock()
+        self._timings = {}
+
+    def _get_pool(self):
+        if self._pid != os.getpid():
+            # the threads don't survive a fork into a network namespace
+            self._pid = os.getpid()
+            self._pool = ThreadPoolExecutor(max_workers=self._max_workers,
+                                            thread_name_prefix="dev-worker")
+        return self._pool
+
+    def shutdown(self):
+        if self._pool is not None and self._pid == os.getpid():
+            self._pool.shutdown()
+        self._pool = None
+        self._pid = None
+
+    def snapshot(self, devices):
+        """Sets the devices down and stores their configuration"""
+        with self._if_manager.netlink_batch():
+            for device in devices:
+                try:
+                    device.down()
+                except DeviceDisabled:
+                    pass
+
+        self._run("snapshot", devices,
+                  lambda device: device.store_cleanup_data())
+
+    def hold_restore(self, devices):
+        """Takes the stored configuration from the devices
+
+        Their cleanup then doesn't restore it, returns what's to be passed
+        to restore.
+        """
+        held = []
+        for device in devices:
+            try:
+                cleanup_data = device._cleanup_data
+                device._cleanup_data = None
+            except DeviceDeleted:
+                continue
+            if cleanup_data:
+                held.append((device, cleanup_data))
+        return held
+
+    def restore(self, held):
+        """Restores the configuration taken by hold_restore"""
+        devices = []
+        for device, cleanup_data in held:
+            try:
+                device._cleanup_data = cleanup_data
+            except DeviceDeleted:
+                continue
+            devices.append(device)
+
+        self._run("restore", devices,
+                  lambda device: device.restore_original_data())
+
+    def _run(self, phase, devices, func):
+        if not devices:
+            return
+
+        pool = self._get_pool()
+        with self._if_manager.netlink_batch():
+            futures = [(device, pool.submit(self._timed, phase, device, func))
+                       for device in devices]
+            errors = [future.exception() for _, future in futures]
+
+        error = None
+        for (device, _), e in zip(futures, errors):
+            if e is None or isinstance(e, (DeviceDisabled, DeviceDeleted)):
+                continue
+            logging.error("Device {} {} failed: {}".format(
+                self._timings.get(device.ifindex, {}).get("name"), phase, e))
+            if error is None:
+                error = e
+
+        if error is not None:
+            raise error
+
+    def _timed(self, phase, device, func):
+        timing = {"name": device.name, "driver": device.driver}
+
+        start = time.monotonic()
+        try:
+            func(device)
+        finally:
+            timing[phase] = time.monotonic() - start
+            logging.debug("Device {} ({}) {} took {:.3f}s".format(
+                timing["name"], timing["driver"], phase, timing[phase]))
+
+            with self._timings_lock:
+                self._timings.setdefault(device.ifindex, {}).update(timing)
+
+    def get_timings(self):
+        """Returns the duration of the last snapshot and restore of every
+        device as a dictionary indexed by the ifindex, with the device name
+        and driver, in seconds"""
+        with self._timings_lock:
+            return {ifindex: dict(timing)
+                    for ifindex, timing in self._timings.items()}
@@ -13,14 +13,21 @@ olichtne@redhat.com (Ondrej Lichtner)
 """
 
 import re
+import errno
 import select
 import socket
+import logging
+import threading
+import pyroute2
 from collections import deque
+from contextlib import contextmanager
 from lnst.Common.ExecCmd import exec_cmd
 from lnst.Common.DeviceError import (DeviceNotFound, DeviceConfigError,
         DeviceError)
 from lnst.Common.InterfaceManagerError import InterfaceManagerError
+from lnst.Common.EthtoolNetlink import EthtoolNetlink
 from pyroute2 import IPRSocket
+from pyroute2.netlink import NLMSG_ERROR
 from pyroute2.netlink import NLM_F_REQUEST, NLM_F_DUMP
 from pyroute2.netlink.rtnl import RTMGRP_IPV4_IFADDR
 from pyroute2.netlink.rtnl import RTMGRP_IPV6_IFADDR
@@ -32,6 +39,10 @@ from pyroute2.netlink.rtnl import RTM_NEWADDR
 from pyroute2.netlink.rtnl import RTM_GETADDR
 from pyroute2.netlink.rtnl import RTM_DELADDR
 
+# errors of a netlink socket that is unusable, the request wasn't processed
+IPR_BROKEN_ERRNOS = (errno.EBADF, errno.ENOTSOCK, errno.ENOTCONN,
+                     errno.EPIPE, errno.ECONNRESET)
+
 NL_GROUPS = RTMGRP_IPV4_IFADDR | RTMGRP_IPV6_IFADDR | RTMGRP_LINK
 PF_BRIDGE = 7
 
@@ -46,6 +57,30 @@ class InterfaceManager(object):
 
         self._msg_queue = deque()
 
+        # long lived handles used by Device objects to configure links and
+        # addresses, created lazily so that they're opened in the right
+        # netns, one per thread as the devices can be configured
+        # concurrently (see DeviceStateManager) and an IPRoute handle isn't
+        # safe for concurrent use
+        self._ipr = threading.local()
+        self._ipr_handles = []
+        self._ipr_lock = threading.Lock()
+        # same for the ethtool netlink clients
+        self._ethtool = threading.local()
+        self._ethtool_clients = []
+        self._ethtool_available = True
+        self._ethtool_lock = threading.Lock()
+        self._batch_depth = 0
+        self._batch_refresh = set()
+
+        # the device database is kept current from the netlink multicast
+        # groups, these count how often a full dump was still needed
+        self._stats = {"full_dumps": 0,
+                       "resyncs": 0,
+                       "targeted_requests": 0,
+                       "dumps_avoided": 0,
+                       "events": 0}
+
         #TODO split DevlinkManager away from the InterfaceManager
         #self._dl_manager = DevlinkManager()
 
@@ -68,8 +103,144 @@ class InterfaceManager(object):
         self._nl_socket = IPRSocket()
         self._nl_socket.bind(groups=NL_GROUPS)
 
+        # events could have been lost (e.g. socket overrun), resync the
+        # whole device database
+        self._stats["resyncs"] += 1
         self.rescan_devices()
 
+    def get_stats(self):
+        return dict(self._stats)
+
+    def get_ipr(self):
+        """Returns the IPRoute handle of the calling thread"""
+        ipr = getattr(self._ipr, "handle", None)
+        if ipr is None:
+            ipr = pyroute2.IPRoute()
+            self._ipr.handle = ipr
+            with self._ipr_lock:
+                self._ipr_handles.append(ipr)
+        return ipr
+
+    def close_ipr(self):
+        with self._ipr_lock:
+            for ipr in self._ipr_handles:
+                try:
+                    ipr.close()
+                except OSError:
+                    pass
+            self._ipr_handles = []
+            self._ipr = threading.local()
+
+    def _close_thread_ipr(self):
+        ipr = getattr(self._ipr, "handle", None)
+        if ipr is None:
+            return
+
+        self._ipr.handle = None
+        with self._ipr_lock:
+            if ipr in self._ipr_handles:
+                self._ipr_handles.remove(ipr)
+        try:
+            ipr.close()
+        except OSError:
+            pass
+
+    def get_ethtool(self):
+        """Returns the EthtoolNetlink client of the calling thread, None if
+        the kernel doesn't provide the ethtool netlink family"""
+        client = getattr(self._ethtool, "client", None)
+        if client is None and self._ethtool_available:
+            try:
+                client = EthtoolNetlink()
+            except (OSError, pyroute2.NetlinkError) as e:
+                logging.debug("ethtool netlink not available, falling "
+                              "back to the ethtool command: {}".format(e))
+                self._ethtool_available = False
+                return None
+
+            self._ethtool.client = client
+            with self._ethtool_lock:
+                self._ethtool_clients.append(client)
+        return client
+
+    def close_ethtool(self):
+        with self._ethtool_lock:
+            for client in self._ethtool_clients:
+                try:
+                    client.close()
+                except OSError:
+                    pass
+            self._ethtool_clients = []
+            self._ethtool = threading.local()
+            self._ethtool_available = True
+
+    def reopen_after_fork(self):
+        """Drops the netlink handles inherited by a forked process, they're
+        reopened on their next use
+
+        Closing them only closes the copies of the file descriptors, the
+        sockets of the parent process stay usable.
+        """
+        self.close_ipr()
+        self.close_ethtool()
+
+    def ipr_call(self, ifindex, obj_name, op_name, args, kwargs):
+        """Runs a pyroute2.IPRoute operation on the persistent handle of the
+        calling thread
+
+        The handle is reopened and the operation retried once if the netlink
+        socket itself broke. Other errors are raised, the operations aren't
+        idempotent so they can't be retried blindly. Afterwards the affected
+        device is refreshed, or only marked for refresh when called within a
+        netlink_batch block.
+        """
+        try:
+            ret_val = self._ipr_op(obj_name, op_name, args, kwargs)
+        except OSError as e:
+            if e.errno not in IPR_BROKEN_ERRNOS:
+                raise
+            logging.debug("IPRoute handle failed, reconnecting: %s" % e)
+            # the handles of the other threads are still fine
+            self._close_thread_ipr()
+            ret_val = self._ipr_op(obj_name, op_name, args, kwargs)
+
+        # every operation used to be followed by a full dump
+        self._stats["dumps_avoided"] += 1
+        if self._batch_depth > 0:
+            self._batch_refresh.add(ifindex)
+        elif ifindex is not None:
+            self.refresh_device(ifindex)
+        else:
+            self.handle_netlink_msgs()
+        return ret_val
+
+    def _ipr_op(self, obj_name, op_name, args, kwargs):
+        obj = getattr(self.get_ipr(), obj_name)
+        if op_name is not None:
+            return obj(op_name, *args, **kwargs)
+        else:
+            return obj(*args, **kwargs)
+
+    @contextmanager
+    def netlink_batch(self):
+        """Defers the device refresh of ipr_call operations
+
+        All link and address changes done within the block are refreshed
+        together in a single netlink request/response cycle when the
+        outermost block exits.
+        """
+        self._batch_depth += 1
+        try:
+            yield
+        finally:
+            self._batch_depth -= 1
+            if self._batch_depth == 0:
+                ifindexes = self._batch_refresh
+                self._batch_refresh = set()
+                self.refresh_devices(
+                    [i for i in ifindexes if i is not None]
+                )
+
     def get_nl_socket(self):
         return self._nl_socket
 
@@ -79,15 +250,47 @@ class InterfaceManager(object):
                 rl, wl, xl = select.select([self._nl_socket], [], [], 0)
                 if not len(rl):
                     break
-                self._msg_queue.extend(self._nl_socket.get())
+                self._msg_queue.extend(self._nl_socket.get(noraise=True))
         except socket.error:
             self.reconnect_netlink()
             return []
 
     def rescan_devices(self):
+        """Resynchronizes the whole device database with a netlink dump
+
+        Only needed on initialization or when netlink events could have been
+        lost, otherwise sync_devices or refresh_device are sufficient.
+        """
+        self._stats["full_dumps"] += 1
         self.request_netlink_dump()
         self.handle_netlink_msgs()
 
+    def sync_devices(self):
+        """Processes the pending netlink events
+
+        Device creation, deletion, link and address changes are all
+        delivered through the multicast groups the netlink socket is bound
+        to, so processing them keeps the device database current.
+        """
+        # callers used to request a full dump here
+        self._stats["dumps_avoided"] += 1
+        self.handle_netlink_msgs()
+
+    def refresh_device(self, ifindex):
+        """Requests the current link state of a single device
+
+        Link statistics aren't reported through netlink events, the targeted
+        request makes sure that these are also up to date.
+        """
+        self.refresh_devices([ifindex])
+
+    def refresh_devices(self, ifindexes):
+        for ifindex in ifindexes:
+            self._stats["targeted_requests"] += 1
+            self._nl_socket.put({"index": ifindex}, RTM_GETLINK,
+                                msg_flags=NLM_F_REQUEST)
+        self.handle_netlink_msgs()
+
     def request_netlink_dump(self):
         self._nl_socket.put(
             None, RTM_GETLINK, msg_flags=NLM_F_REQUEST | NLM_F_DUMP
@@ -109,6 +312,12 @@ class InterfaceManager(object):
             # device._set_devlink(dl_port)
 
     def _handle_netlink_msg(self, msg):
+        if msg['header']['type'] == NLMSG_ERROR:
+            # e.g. a targeted request for a device that was just removed,
+            # the removal itself is handled through the RTM_DELLINK event
+            return
+
+        self._stats["events"] += 1
         if msg['header']['type'] in [RTM_NEWLINK, RTM_NEWADDR, RTM_DELADDR]:
             if msg['index'] in self._devices:
                 self._devices[msg['index']]._update_netlink(msg)
@@ -161,32 +370,51 @@ class InterfaceManager(object):
             del self._devices[dev.ifindex]
 
     def get_device(self, ifindex):
-        self.rescan_devices()
+        if ifindex in self._devices:
+            self.refresh_device(ifindex)
+        else:
+            self.handle_netlink_msgs()
+
+        if ifindex in self._devices:
+            self._stats["dumps_avoided"] += 1
+        else:
+            self.rescan_devices()
+
         if ifindex in self._devices:
             return self._devices[ifindex]
         else:
             raise DeviceNotFound()
 
+    def get_cached_device(self, ifindex):
+        """Returns the tracked device without refreshing it over netlink,
+        None if the device isn't tracked"""
+        return self._devices.get(ifindex, None)
+
     def get_devices(self):
-        self.rescan_devices()
+        self.sync_devices()
         return list(self._devices.values())
 
-    def get_device_by_hwaddr(self, hwaddr):
-        self.rescan_devices()
+    def _find_device(self, match):
+        self.handle_netlink_msgs()
         for dev in list(self._devices.values()):
-            if dev.hwaddr == hwaddr:
+            if match(dev):
+                self._stats["dumps_avoided"] += 1
                 return dev
-        raise DeviceNotFound()
 
-    def get_device_by_name(self, name):
         self.rescan_devices()
         for dev in list(self._devices.values()):
-            if dev.name == name:
+            if match(dev):
                 return dev
         raise DeviceNotFound()
 
+    def get_device_by_hwaddr(self, hwaddr):
+        return self._find_device(lambda dev: dev.hwaddr == hwaddr)
+
+    def get_device_by_name(self, name):
+        return self._find_device(lambda dev: dev.name == name)
+
     def get_device_by_params(self, params):
-        self.rescan_devices()
+        self.sync_devices()
         matched = None
         for dev in list(self._devices.values()):
             matched = dev
@@ -216,23 +444,35 @@ class InterfaceManager(object):
         device._create()
         device._bulk_enabled = False
 
-        self.request_netlink_dump()
+        # the RTM_NEWLINK event of the new device should already be queued,
+        # a full dump is only requested if it was missed
+        device_found = self._claim_created_device(device)
+        if not device_found:
+            self._stats["full_dumps"] += 1
+            self.request_netlink_dump()
+            device_found = self._claim_created_device(device)
+        else:
+            self._stats["dumps_avoided"] += 1
+
+        if device_found:
+            return device
+        else:
+            raise DeviceError("Device creation failed")
+
+    def _claim_created_device(self, device):
         self.pull_netlink_messages_into_queue()
 
         device_found = False
         while len(self._msg_queue):
             msg = self._msg_queue.popleft()
-            if msg.get_attr("IFLA_IFNAME") == device.name:
+            if (msg['header']['type'] == RTM_NEWLINK and
+                    msg.get_attr("IFLA_IFNAME") == device.name):
                 device_found = True
                 device._init_netlink(msg)
                 self._devices[msg['index']] = device
             else:
                 self._handle_netlink_msg(msg)
-
-        if device_found:
-            return device
-        else:
-            raise DeviceError("Device creation failed")
+        return device_found
 
     def remap_device(self, ifindex, clsname, args=[], kwargs={}):
         devcls = self._device_classes[clsname]
@@ -250,14 +490,15 @@ class InterfaceManager(object):
         remapped_device._nl_link_update = {}
         remapped_device.ifindex = ifindex
         self.replace_dev(ifindex, remapped_device)
-        self.rescan_devices()
+        self._stats["dumps_avoided"] += 1
+        self.refresh_device(ifindex)
 
     def replace_dev(self, if_id, dev):
         del self._devices[if_id]
         self._devices[if_id] = dev
 
     def _is_name_used(self, name):
-        self.rescan_devices()
+        self.sync_devices()
         for device in self._devices.values():
             if name == device.name:
                 return True
@@ -13,9 +13,11 @@ olichtne@redhat.com (Ondrej Lichtner)
 import os
 import signal
 import logging
+import threading
 import multiprocessing
+from concurrent.futures import ThreadPoolExecutor
 from lnst.Common.JobError import JobError
-from lnst.Common.ExecCmd import exec_cmd, ExecCmdFail
+from lnst.Common.ExecCmd import start_cmd, finish_cmd, ExecCmdFail
 from lnst.Common.ConnectionHandler import send_data
 from lnst.Common.Logs import log_exc_traceback
 
@@ -24,13 +26,27 @@ def get_job_class(what):
         return ShellExecJob(what)
     elif what["type"] == "module":
         return ModuleJob(what)
+    elif what["type"] == "batch":
+        return BatchExecJob(what)
     else:
         logging.error("Unknown job type \"%s\"" % what["type"])
         raise JobError("Unknown command type \"%s\"" % what["type"])
 
+def setup_job_process():
+    """Prepares a forked process for running jobs, its process group is
+    signalled by Job.kill"""
+    os.setpgrp()
+    signal.signal(signal.SIGHUP, signal.SIG_DFL)
+    signal.signal(signal.SIGINT, signal.default_int_handler)
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+
 class JobContext(object):
-    def __init__(self):
+    def __init__(self, worker_pool=None):
         self._dict = {}
+        self._worker_pool = worker_pool
+
+    def get_worker_pool(self):
+        return self._worker_pool
 
     def add_job(self, job):
         self._dict[job.get_id()] = job
@@ -70,9 +86,14 @@ class Job(object):
         self._parent_pipe = None
         self._child_pipe = None
         self._process = None
+        self._worker = None
+        self._worker_pool = None
+        self._shell_thread = None
         self._pid = None
         self._log_ctl = log_ctl
         self._finished = False
+        self._finish_lock = threading.Lock()
+        self._finish_sent = False
 
     def get_id(self):
         return self._id
@@ -80,9 +101,33 @@ class Job(object):
     def get_parent_pipe(self):
         return self._parent_pipe
 
-    def run(self):
+    def run(self, worker_pool=None):
+        """Starts the job
+
+        Shell jobs are started directly from the Agent process, module jobs
+        are handed to a worker of worker_pool or, without one, run in a newly
+        forked process.
+        """
+        if isinstance(self._job_cls, ShellExecJob):
+            return self._run_shell()
+
+        if worker_pool is not None:
+            self._worker = worker_pool.acquire()
+        if self._worker is not None:
+            self._worker_pool = worker_pool
+            self._parent_pipe = self._worker.parent_pipe
+            self._child_pipe = self._worker.child_pipe
+            self._pid = self._worker.pid
+            self._worker.start_job(self._id, self._what)
+
+            logging.debug("Running job %d in worker with pid \"%d\"" %
+                          (self._id, self._pid))
+            return True
+
         self._parent_pipe, self._child_pipe = multiprocessing.Pipe()
-        self._process = multiprocessing.Process(target=self._run)
+        self._log_ctl.flush_connection()
+        self._process = multiprocessing.Process(target=self._run,
+                                                args=(worker_pool,))
 
         self._process.daemon = False
         self._process.start()
@@ -91,35 +136,77 @@ class Job(object):
         logging.debug("Running job %d with pid \"%d\"" % (self._id, self._pid))
         return True
 
-    def _run(self):
+    def _run(self, worker_pool=None):
         self._parent_pipe.close()
 
-        os.setpgrp()
-        signal.signal(signal.SIGHUP, signal.SIG_DFL)
-        signal.signal(signal.SIGINT, signal.default_int_handler)
-        signal.signal(signal.SIGTERM, signal.SIG_DFL)
+        setup_job_process()
+        if worker_pool is not None:
+            worker_pool.after_fork()
 
         self._log_ctl.disable_logging()
         self._log_ctl.set_connection(self._child_pipe)
 
+        self._log_ctl.send_data(self._child_pipe, self.execute())
+        self._log_ctl.cancel_connection()
+        self._child_pipe.close()
+
+    def execute(self):
+        """Runs the job in the current process, returns the job_finished
+        message"""
         result = {}
         try:
             self._job_cls.run()
             job_result = self._job_cls.get_result()
         except Exception as e:
             log_exc_traceback()
-            job_result = {}
-            job_result["passed"] = False
-            job_result["type"] = "exception"
-            job_result["res_data"] = self._job_cls.get_result()
-            job_result["res_data"]["exception"] = e
+            job_result = self._exception_result(e)
         finally:
             result["type"] = "job_finished"
             result["job_id"] = self._id
             result["result"] = job_result
+        return result
+
+    def _exception_result(self, e):
+        job_result = {}
+        job_result["passed"] = False
+        job_result["type"] = "exception"
+        job_result["res_data"] = self._job_cls.get_result()
+        job_result["res_data"]["exception"] = e
+        return job_result
+
+    def _run_shell(self):
+        # the shell is the only child process, the command runs in its own
+        # session so kill() signals the same processes as before
+        self._parent_pipe, self._child_pipe = multiprocessing.Pipe()
+        self._pid = self._job_cls.start(new_session=True).pid
+        self._shell_thread = threading.Thread(target=self._wait_shell,
+                                              name="job-%d" % self._id,
+                                              daemon=True)
+        self._shell_thread.start()
 
-        send_data(self._child_pipe, result)
-        self._child_pipe.close()
+        logging.debug("Running job %d with pid \"%d\"" % (self._id, self._pid))
+        return True
+
+    def _wait_shell(self):
+        try:
+            self._job_cls.finish()
+            job_result = self._job_cls.get_result()
+        except Exception as e:
+            log_exc_traceback()
+            job_result = self._exception_result(e)
+
+        self._send_finished(job_result)
+
+    def _send_finished(self, job_result):
+        # the result of a shell job is sent from its thread, make sure it's
+        # not sent again after the job was killed
+        with self._finish_lock:
+            if self._finish_sent:
+                return
+            self._finish_sent = True
+            send_data(self._child_pipe, dict(type = "job_finished",
+                                             job_id = self._id,
+                                             result = job_result))
 
     def kill(self, sig=signal.SIGKILL):
         if self._finished:
@@ -128,28 +215,34 @@ class Job(object):
         try:
             logging.debug("Sending signal %s to pid %d" % (sig, self._pid))
             os.killpg(self._pid, sig)
+            if self._worker is not None:
+                self._worker.signalled = True
 
             if sig == signal.SIGKILL:
-                result = dict(type = "job_finished",
-                              job_id = self._id,
-                              result = dict(passed = False,
-                                            res_data = "Job killed",
-                                            type = "result"))
-                send_data(self._child_pipe, result)
+                self._send_finished(dict(passed = False,
+                                         res_data = "Job killed",
+                                         type = "result"))
             return True
         except OSError as exc:
             logging.error(str(exc))
             return False
 
     def join(self):
-        self._process.join()
+        if self._process is not None:
+            self._process.join()
+        elif self._shell_thread is not None:
+            self._job_cls.wait()
 
     def set_finished(self, result):
         self._finished = True
         self._result = result
 
-        self._parent_pipe.close()
-        self._child_pipe.close()
+        if self._worker is not None:
+            self._worker_pool.release(self._worker)
+            self._worker = None
+        else:
+            self._parent_pipe.close()
+            self._child_pipe.close()
         self._parent_pipe = None
         self._child_pipe = None
 
@@ -233,9 +326,24 @@ class GenericJob(object):
         # return "%-9s" % (self._what["type"] + netns)
 
 class ShellExecJob(GenericJob):
+    def __init__(self, what):
+        super(ShellExecJob, self).__init__(what)
+        self._process = None
+
     def run(self):
+        self.start()
+        self.finish()
+
+    def start(self, new_session=False):
+        self._process = start_cmd(self._what["command"], new_session)
+        return self._process
+
+    def wait(self):
+        return self._process.wait()
+
+    def finish(self):
         try:
-            stdout, stderr = exec_cmd(self._what["command"], json=self._what["json"])
+            stdout, stderr = finish_cmd(self._process, json=self._what["json"])
             self._result["passed"] = True
             self._result["res_data"] = {"stdout": stdout, "stderr": stderr}
         except ExecCmdFail as e:
@@ -255,6 +363,44 @@ class ShellExecJob(GenericJob):
         # cmd = "%-9scmd: \"%s\"" %(cmd_type + netns, cmd_val)
         # return cmd
 
+class BatchExecJob(GenericJob):
+    """Runs a batch of shell commands and file writes
+
+    The results are stored column-wise, one item per command in every list,
+    to keep them small for batches of many short commands.
+    """
+    def run(self):
+        commands = self._what["commands"]
+        parallel = min(self._what.get("parallel", 1), len(commands))
+
+        if parallel > 1:
+            with ThreadPoolExecutor(max_workers=parallel) as executor:
+                results = list(executor.map(self._run_command, commands))
+        else:
+            results = [self._run_command(command) for command in commands]
+
+        self._result["passed"] = all(result[0] == 0 for result in results)
+        self._result["res_data"] = {
+            "returncodes": [result[0] for result in results],
+            "stdout": [result[1] for result in results],
+            "stderr": [result[2] for result in results]}
+
+    def _run_command(self, command):
+        if "write" in command:
+            logging.debug("Writing \"%s\" to %s" % (command["value"],
+                                                     command["write"]))
+            try:
+                with open(command["write"], "w") as f:
+                    f.write(command["value"])
+            except OSError as e:
+                logging.debug("Write to %s failed: %s" % (command["write"], e))
+                return e.errno or 1, "", str(e)
+            return 0, "", ""
+
+        process = start_cmd(command["command"])
+        stdout, stderr = process.communicate()
+        return process.returncode, stdout.decode(), stderr.decode()
+
 class ModuleJob(GenericJob):
     def run(self):
         try:
@@ -0,0 +1,246 @@
+"""
+Defines the JobWorkerPool class used by the Agent to run module jobs in
+pre-forked, reusable worker processes.
+
+Copyright 2024 Red Hat, Inc.
+Licensed under the GNU General Public License, version 2 as
+published by the Free Software Foundation; see COPYING for details.
+"""
+
+import os
+import time
+import signal
+import logging
+import multiprocessing
+from lnst.Common.Logs import log_exc_traceback
+from lnst.Common.Utils import die_when_parent_die
+from lnst.Agent.Job import Job, setup_job_process
+
+
+# seconds a stopped worker has to exit before it's killed
+STOP_TIMEOUT = 1
+
+
+class JobWorker(object):
+    """Forked process running module jobs one at a time
+
+    The job is sent pickled by the dumps function of the pool through the
+    worker's pipe, the worker reports back the same way a process forked
+    for a single job does - log records and the job_finished message.
+    """
+    def __init__(self, log_ctl, state, dumps, loads, after_fork=None):
+        self.state = state
+        self.signalled = False
+
+        self._log_ctl = log_ctl
+        self._dumps = dumps
+        self._loads = loads
+        self._after_fork = after_fork
+        self._stop_time = None
+
+        self.parent_pipe, self.child_pipe = multiprocessing.Pipe()
+        self._process = multiprocessing.Process(target=self._serve)
+        self._process.daemon = False
+        self._process.start()
+
+    @property
+    def pid(self):
+        return self._process.pid
+
+    def is_alive(self):
+        return self._process.is_alive()
+
+    def start_job(self, job_id, what):
+        self.parent_pipe.send((job_id, self._dumps(what)))
+
+    def stop(self):
+        """Asks the worker to exit without waiting for it, see reap()"""
+        try:
+            self.parent_pipe.send(None)
+        except OSError:
+            pass
+        self.parent_pipe.close()
+        self.child_pipe.close()
+        self._stop_time = time.monotonic()
+
+    def reap(self, timeout=STOP_TIMEOUT):
+        """Returns True once the stopped worker exited, the worker is
+        killed when it didn't exit within timeout seconds after stop()"""
+        if not self._process.is_alive():
+            self._process.join()
+            return True
+
+        if time.monotonic() - self._stop_time >= timeout:
+            try:
+                os.kill(self.pid, signal.SIGKILL)
+            except ProcessLookupError:
+                pass
+        return False
+
+    def _serve(self):
+        self.parent_pipe.close()
+
+        die_when_parent_die()
+        setup_job_process()
+        if self._after_fork is not None:
+            self._after_fork()
+
+        self._log_ctl.disable_logging()
+        self._log_ctl.set_connection(self.child_pipe)
+
+        while True:
+            try:
+                msg = self.child_pipe.recv()
+            except (EOFError, KeyboardInterrupt):
+                break
+            if msg is None:
+                break
+
+            job_id, payload = msg
+            try:
+                job = Job(self._loads(payload), self._log_ctl)
+                result = job.execute()
+            except Exception as e:
+                log_exc_traceback()
+                result = {"type": "job_finished",
+                          "job_id": job_id,
+                          "result": {"passed": False,
+                                     "type": "exception",
+                                     "res_data": {"exception": e}}}
+            self._log_ctl.send_data(self.child_pipe, result)
+
+        self._log_ctl.cancel_connection()
+        self.child_pipe.close()
+
+
+class JobWorkerPool(object):
+    """
+    Pool of worker processes for module jobs.
+
+    A worker is a fork of the Agent, so it can only run jobs as long as the
+    state it inherited is still current - the loaded classes and modules,
+    the devices and so on. The get_state function returns a value that
+    changes whenever that state changes, workers forked in a different
+    state are retired instead of reused.
+
+    The workers are forked on demand. Once a module job was started in the
+    current state, prefork() called from the idle event loop keeps up to
+    max_idle workers ready for the following jobs. Workers of jobs that
+    were signalled are never reused.
+
+    Retired workers are stopped without waiting for them so that the event
+    loop isn't blocked, they're reaped later by _reap().
+
+    dumps and loads serialize the job description, loads runs in the worker.
+    after_fork is called in every process forked for jobs, the workers as
+    well as the processes of single jobs when the pool is disabled, to drop
+    the resources that can't be shared with the Agent.
+    """
+    def __init__(self, log_ctl, max_idle, get_state, dumps, loads,
+                 after_fork=None):
+        self._log_ctl = log_ctl
+        self._max_idle = max_idle
+        self._get_state = get_state
+        self._dumps = dumps
+        self._loads = loads
+        self._after_fork = after_fork
+
+        self._pid = None
+        self._idle = []
+        self._stopping = []
+        self._demand = 0
+        self._demand_state = None
+
+    def _ensure_current(self):
+        if self._pid != os.getpid():
+            # the workers of the parent of a network namespace process
+            # aren't children of this process
+            self._pid = os.getpid()
+            self._idle = []
+            self._stopping = []
+            self._demand = 0
+            self._demand_state = None
+
+    def _fork_worker(self, state):
+        self._log_ctl.flush_connection()
+        return JobWorker(self._log_ctl, state, self._dumps, self._loads,
+                         self._after_fork)
+
+    def after_fork(self):
+        """Called in a process forked for a single job"""
+        if self._after_fork is not None:
+            self._after_fork()
+
+    def _stop_worker(self, worker):
+        worker.stop()
+        self._stopping.append(worker)
+
+    def _reap(self):
+        self._stopping = [worker for worker in self._stopping
+                          if not worker.reap()]
+
+    def _retire_stale(self, state):
+        for worker in list(self._idle):
+            if worker.state != state or not worker.is_alive():
+                self._idle.remove(worker)
+                self._stop_worker(worker)
+
+    def acquire(self):
+        """Returns a worker ready to run a job, None if the pool is disabled"""
+        if self._max_idle <= 0:
+            return None
+        self._ensure_current()
+        self._reap()
+
+        state = self._get_state()
+        self._retire_stale(state)
+        if self._demand_state != state:
+            self._demand_state = state
+            self._demand = 0
+        self._demand += 1
+
+        if self._idle:
+            worker = self._idle.pop()
+        else:
+            worker = self._fork_worker(state)
+        worker.signalled = False
+        return worker
+
+    def release(self, worker):
+        """Returns the worker of a finished job to the pool"""
+        if (worker.signalled or
+                worker.state != self._get_state() or
+                not worker.is_alive() or
+                len(self._idle) >= self._max_idle):
+            self._stop_worker(worker)
+        else:
+            self._idle.append(worker)
+
+    def prefork(self):
+        """Forks a worker if more are expected to be needed, called by the
+        event loop when it's idle"""
+        if self._max_idle <= 0:
+            return
+        self._ensure_current()
+        self._reap()
+        if self._demand == 0:
+            return
+
+        state = self._get_state()
+        self._retire_stale(state)
+        if state != self._demand_state:
+            return
+
+        if len(self._idle) < min(self._demand, self._max_idle):
+            logging.debug("Pre-forking a job worker")
+            self._idle.append(self._fork_worker(state))
+
+    def shutdown(self):
+        self._ensure_current()
+        for worker in self._idle:
+            self._stop_worker(worker)
+        self._idle = []
+        self._reap()
+        self._demand = 0
+        self._demand_state = None
+
@@ -0,0 +1,189 @@
+"""
+Defines the RpcDispatcher class used by the Agent to run RPC calls in a pool
+of worker threads.
+
+Copyright 2024 Red Hat, Inc.
+Licensed under the GNU General Public License, version 2 as
+published by the Free Software Foundation; see COPYING for details.
+"""
+
+import os
+import time
+import threading
+import collections
+import multiprocessing
+from concurrent.futures import ThreadPoolExecutor
+
+WAKEUP_CONNECTION_ID = "rpc_workers"
+
+
+class LatencyHistogram(object):
+    """
+    Histogram of durations with power of 2 millisecond buckets, bucket i
+    counts the durations shorter than 2**i ms, the last one all the rest.
+    """
+    BUCKETS = 18
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.buckets = [0] * self.BUCKETS
+
+    def add(self, duration):
+        self.count += 1
+        self.total += duration
+        self.max = max(self.max, duration)
+
+        bucket = int(duration * 1000).bit_length()
+        self.buckets[min(bucket, self.BUCKETS - 1)] += 1
+
+    def to_dict(self):
+        return {"count": self.count,
+                "total": self.total,
+                "max": self.max,
+                "buckets": [(2 ** i / 1000, count)
+                            for i, count in enumerate(self.buckets[:-1])] +
+                           [(None, self.buckets[-1])]}
+
+
+class RpcDispatcher(object):
+    """
+    Executes the RPC calls of the Agent.
+
+    Calls marked as concurrency safe are submitted to a pool of worker
+    threads, the rest is executed directly in the event loop. To keep the
+    ordering guarantees of the calls that aren't concurrency safe they're
+    only executed when no worker call is in flight, calls received after
+    them are queued until then.
+
+    The workers never send anything themselves, the finished calls are
+    queued and the event loop is woken up through a pipe registered in the
+    ServerHandler with an "rpc_completed" message, the responses are then
+    sent by process_completed in the event loop.
+    """
+    def __init__(self, server_handler, max_workers=4):
+        self._server_handler = server_handler
+        self._max_workers = max_workers
+
+        self._pid = None
+        self._pool = None
+        self._wakeup = None
+        self._wakeup_read = None
+        self._wakeup_lock = threading.Lock()
+
+        self._in_flight = 0
+        self._running_inline = False
+        self._pending = collections.deque()
+        self._completed = collections.deque()
+
+        self._stats_lock = threading.Lock()
+        self._latency = {}
+        self._execution = {}
+
+    def _ensure_started(self):
+        if self._pid != os.getpid():
+            # started lazily and again in forked network namespace processes
+            # as the threads don't survive a fork
+            self._pid = os.getpid()
+            self._pool = ThreadPoolExecutor(max_workers=self._max_workers,
+                                            thread_name_prefix="rpc-worker")
+            self._wakeup_read, self._wakeup = multiprocessing.Pipe(duplex=False)
+            self._in_flight = 0
+            self._running_inline = False
+            self._pending.clear()
+            self._completed.clear()
+        self._server_handler.add_connection(WAKEUP_CONNECTION_ID,
+                                            self._wakeup_read)
+
+    def dispatch(self, name, call, respond, safe):
+        """Dispatches an RPC call
+
+        Args:
+            name -- method name, used for the statistics
+            call -- function without arguments returning the response
+            respond -- function sending the response, always called from
+                the event loop
+            safe -- whether the call can run in a worker thread
+        """
+        self._ensure_started()
+        self._pending.append((name, call, respond, safe, time.monotonic()))
+        self._run_pending()
+
+    def process_completed(self):
+        """Sends the responses of finished worker calls, event loop only"""
+        while self._completed:
+            name, response, respond, received = self._completed.popleft()
+            self._in_flight -= 1
+            respond(response)
+            self._add_latency(name, received)
+        self._run_pending()
+
+    def _run_pending(self):
+        # an inline call can process messages itself (e.g. waiting for a
+        # network namespace), the following calls have to wait for it
+        if self._running_inline:
+            return
+
+        while self._pending:
+            name, call, respond, safe, received = self._pending[0]
+            if safe:
+                self._pending.popleft()
+                self._in_flight += 1
+                self._pool.submit(self._run_worker, name, call, respond,
+                                  received)
+            elif self._in_flight == 0:
+                self._pending.popleft()
+                start = time.monotonic()
+                self._running_inline = True
+                try:
+                    response = call()
+                finally:
+                    self._running_inline = False
+                if self._pid != os.getpid():
+                    # the call forked a network namespace process, the
+                    # calls queued in the parent aren't its to execute
+                    self._pending.clear()
+                self._add_execution(name, start)
+                respond(response)
+                self._add_latency(name, received)
+            else:
+                break
+
+    def _run_worker(self, name, call, respond, received):
+        start = time.monotonic()
+        response = None
+        try:
+            response = call()
+        finally:
+            self._add_execution(name, start)
+            self._completed.append((name, response, respond, received))
+            with self._wakeup_lock:
+                self._wakeup.send({"type": "rpc_completed"})
+
+    def _add_execution(self, name, start):
+        with self._stats_lock:
+            hist = self._execution.setdefault(name, LatencyHistogram())
+            hist.add(time.monotonic() - start)
+
+    def _add_latency(self, name, received):
+        with self._stats_lock:
+            hist = self._latency.setdefault(name, LatencyHistogram())
+            hist.add(time.monotonic() - received)
+
+    def get_stats(self):
+        """Returns the per method latency and execution time histograms
+
+        The latency is measured from receiving the call until sending its
+        response, so it includes waiting for previous calls.
+        """
+        with self._stats_lock:
+            return {name: {"latency": hist.to_dict(),
+                           "execution": self._execution[name].to_dict()
+                           if name in self._execution else None}
+                    for name, hist in self._latency.items()}
+
+    def reset_stats(self):
+        with self._stats_lock:
+            self._latency = {}
+            self._execution = {}
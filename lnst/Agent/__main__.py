@@ -35,7 +35,9 @@ def main():
     coloured_output = not (agent_config.get_option("colours", "disable_colours") or args.no_colours)
     log_ctl = LoggingCtl(args.debug,
                      log_dir=agent_config.get_option('environment', 'log_dir'),
-                     colours=coloured_output)
+                     colours=coloured_output,
+                     log_store_size=agent_config.get_option('environment',
+                                                            'log_store_size'))
     logging.info("Started")
 
     if args.port != None:
@@ -202,6 +202,13 @@ class Config():
             raise ConfigError(msg)
         return int(option)
 
+    def optionInt(self, option, cfg_path):
+        try:
+            return int(option)
+        except ValueError:
+            msg = "Option expects a number."
+            raise ConfigError(msg)
+
     def optionPath(self, option, cfg_path):
         exp_path = os.path.expanduser(option)
         abs_path = os.path.join(os.path.dirname(cfg_path), exp_path)
@@ -255,6 +262,18 @@ class Config():
 
         return timeval
 
+    def optionSize(self, option, cfg_path):
+        size_re = r"^([0-9]+)\s*(([KMGT])i?B?)?$"
+        size_match = re.match(size_re, option.strip(), re.IGNORECASE)
+        if not size_match:
+            msg = "Incorrect size format."
+            raise ConfigError(msg)
+
+        size = int(size_match.group(1))
+        if size_match.group(3):
+            size *= 1024 ** ("KMGT".index(size_match.group(3).upper()) + 1)
+        return size
+
     def optionColour(self, option, cfg_path):
         colour = option.split()
         if len(colour) != 3:
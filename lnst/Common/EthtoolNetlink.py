@@ -0,0 +1,494 @@
+"""
+This module defines the EthtoolNetlink class, an in-process client of the
+ethtool generic netlink family used by the Device class instead of running
+the ethtool command.
+
+Copyright 2024 Red Hat, Inc.
+Licensed under the GNU General Public License, version 2 as
+published by the Free Software Foundation; see COPYING for details.
+"""
+
+import os
+import threading
+from pyroute2.netlink import NLM_F_REQUEST, NLM_F_ACK, genlmsg
+from pyroute2.netlink.exceptions import NetlinkError, NetlinkDecodeError
+from pyroute2.netlink.nlsocket import Marshal
+from pyroute2.netlink.generic.ethtool import (
+    NlEthtool,
+    ethtoolheader,
+    ethtoolbitset,
+    ethtool_linkmode_msg,
+    ethtool_rings_msg,
+    ETHTOOL_GENL_NAME,
+    ETHTOOL_GENL_VERSION,
+)
+
+# request commands, pyroute2 only defines them up to the rings
+ETHTOOL_MSG_LINKMODES_GET = 4
+ETHTOOL_MSG_LINKMODES_SET = 5
+ETHTOOL_MSG_FEATURES_GET = 11
+ETHTOOL_MSG_FEATURES_SET = 12
+ETHTOOL_MSG_RINGS_GET = 15
+ETHTOOL_MSG_RINGS_SET = 16
+ETHTOOL_MSG_CHANNELS_GET = 17
+ETHTOOL_MSG_CHANNELS_SET = 18
+ETHTOOL_MSG_COALESCE_GET = 19
+ETHTOOL_MSG_COALESCE_SET = 20
+ETHTOOL_MSG_PAUSE_GET = 21
+ETHTOOL_MSG_PAUSE_SET = 22
+
+# the kernel numbers its replies separately from the requests
+ETHTOOL_MSG_LINKMODES_GET_REPLY = 4
+ETHTOOL_MSG_FEATURES_GET_REPLY = 11
+ETHTOOL_MSG_RINGS_GET_REPLY = 16
+ETHTOOL_MSG_CHANNELS_GET_REPLY = 18
+ETHTOOL_MSG_COALESCE_GET_REPLY = 20
+ETHTOOL_MSG_PAUSE_GET_REPLY = 22
+
+ETHTOOL_FLAG_COMPACT_BITSETS = 1 << 0
+ETHTOOL_FLAG_OMIT_REPLY = 1 << 1
+
+SPEED_UNKNOWN = 0xffffffff
+
+# offset of the cmd field of a generic netlink message
+GENL_CMD_OFFSET = 16
+
+
+class ethtool_coalesce_msg(genlmsg):
+    nla_map = (
+        ('ETHTOOL_A_COALESCE_UNSPEC', 'none'),
+        ('ETHTOOL_A_COALESCE_HEADER', 'ethtoolheader'),
+        ('ETHTOOL_A_COALESCE_RX_USECS', 'uint32'),
+        ('ETHTOOL_A_COALESCE_RX_MAX_FRAMES', 'uint32'),
+        ('ETHTOOL_A_COALESCE_RX_USECS_IRQ', 'uint32'),
+        ('ETHTOOL_A_COALESCE_RX_MAX_FRAMES_IRQ', 'uint32'),
+        ('ETHTOOL_A_COALESCE_TX_USECS', 'uint32'),
+        ('ETHTOOL_A_COALESCE_TX_MAX_FRAMES', 'uint32'),
+        ('ETHTOOL_A_COALESCE_TX_USECS_IRQ', 'uint32'),
+        ('ETHTOOL_A_COALESCE_TX_MAX_FRAMES_IRQ', 'uint32'),
+        ('ETHTOOL_A_COALESCE_STATS_BLOCK_USECS', 'uint32'),
+        ('ETHTOOL_A_COALESCE_USE_ADAPTIVE_RX', 'uint8'),
+        ('ETHTOOL_A_COALESCE_USE_ADAPTIVE_TX', 'uint8'),
+        ('ETHTOOL_A_COALESCE_PKT_RATE_LOW', 'uint32'),
+        ('ETHTOOL_A_COALESCE_RX_USECS_LOW', 'uint32'),
+        ('ETHTOOL_A_COALESCE_RX_MAX_FRAMES_LOW', 'uint32'),
+        ('ETHTOOL_A_COALESCE_TX_USECS_LOW', 'uint32'),
+        ('ETHTOOL_A_COALESCE_TX_MAX_FRAMES_LOW', 'uint32'),
+        ('ETHTOOL_A_COALESCE_PKT_RATE_HIGH', 'uint32'),
+        ('ETHTOOL_A_COALESCE_RX_USECS_HIGH', 'uint32'),
+        ('ETHTOOL_A_COALESCE_RX_MAX_FRAMES_HIGH', 'uint32'),
+        ('ETHTOOL_A_COALESCE_TX_USECS_HIGH', 'uint32'),
+        ('ETHTOOL_A_COALESCE_TX_MAX_FRAMES_HIGH', 'uint32'),
+        ('ETHTOOL_A_COALESCE_RATE_SAMPLE_INTERVAL', 'uint32'),
+        ('ETHTOOL_A_COALESCE_USE_CQE_MODE_TX', 'uint8'),
+        ('ETHTOOL_A_COALESCE_USE_CQE_MODE_RX', 'uint8'),
+        ('ETHTOOL_A_COALESCE_TX_AGGR_MAX_BYTES', 'uint32'),
+        ('ETHTOOL_A_COALESCE_TX_AGGR_MAX_FRAMES', 'uint32'),
+        ('ETHTOOL_A_COALESCE_TX_AGGR_TIME_USECS', 'uint32'),
+    )
+
+    ethtoolheader = ethtoolheader
+
+
+class ethtool_pause_msg(genlmsg):
+    nla_map = (
+        ('ETHTOOL_A_PAUSE_UNSPEC', 'none'),
+        ('ETHTOOL_A_PAUSE_HEADER', 'ethtoolheader'),
+        ('ETHTOOL_A_PAUSE_AUTONEG', 'uint8'),
+        ('ETHTOOL_A_PAUSE_RX', 'uint8'),
+        ('ETHTOOL_A_PAUSE_TX', 'uint8'),
+        ('ETHTOOL_A_PAUSE_STATS', 'hex'),
+        ('ETHTOOL_A_PAUSE_STATS_SRC', 'uint32'),
+    )
+
+    ethtoolheader = ethtoolheader
+
+
+class ethtool_channels_msg(genlmsg):
+    nla_map = (
+        ('ETHTOOL_A_CHANNELS_UNSPEC', 'none'),
+        ('ETHTOOL_A_CHANNELS_HEADER', 'ethtoolheader'),
+        ('ETHTOOL_A_CHANNELS_RX_MAX', 'uint32'),
+        ('ETHTOOL_A_CHANNELS_TX_MAX', 'uint32'),
+        ('ETHTOOL_A_CHANNELS_OTHER_MAX', 'uint32'),
+        ('ETHTOOL_A_CHANNELS_COMBINED_MAX', 'uint32'),
+        ('ETHTOOL_A_CHANNELS_RX_COUNT', 'uint32'),
+        ('ETHTOOL_A_CHANNELS_TX_COUNT', 'uint32'),
+        ('ETHTOOL_A_CHANNELS_OTHER_COUNT', 'uint32'),
+        ('ETHTOOL_A_CHANNELS_COMBINED_COUNT', 'uint32'),
+    )
+
+    ethtoolheader = ethtoolheader
+
+
+class ethtool_features_msg(genlmsg):
+    nla_map = (
+        ('ETHTOOL_A_FEATURES_UNSPEC', 'none'),
+        ('ETHTOOL_A_FEATURES_HEADER', 'ethtoolheader'),
+        ('ETHTOOL_A_FEATURES_HW', 'ethtoolbitset'),
+        ('ETHTOOL_A_FEATURES_WANTED', 'ethtoolbitset'),
+        ('ETHTOOL_A_FEATURES_ACTIVE', 'ethtoolbitset'),
+        ('ETHTOOL_A_FEATURES_NOCHANGE', 'ethtoolbitset'),
+    )
+
+    ethtoolheader = ethtoolheader
+    ethtoolbitset = ethtoolbitset
+
+
+# setting names as used by 'ethtool -C', 'ethtool -G', 'ethtool -L' and
+# 'ethtool -A' mapped to the netlink attributes, the BOOL_* tables list the
+# attributes with on/off values
+COALESCE_SETTINGS = {
+    "rx-usecs": "ETHTOOL_A_COALESCE_RX_USECS",
+    "rx-frames": "ETHTOOL_A_COALESCE_RX_MAX_FRAMES",
+    "rx-usecs-irq": "ETHTOOL_A_COALESCE_RX_USECS_IRQ",
+    "rx-frames-irq": "ETHTOOL_A_COALESCE_RX_MAX_FRAMES_IRQ",
+    "tx-usecs": "ETHTOOL_A_COALESCE_TX_USECS",
+    "tx-frames": "ETHTOOL_A_COALESCE_TX_MAX_FRAMES",
+    "tx-usecs-irq": "ETHTOOL_A_COALESCE_TX_USECS_IRQ",
+    "tx-frames-irq": "ETHTOOL_A_COALESCE_TX_MAX_FRAMES_IRQ",
+    "stats-block-usecs": "ETHTOOL_A_COALESCE_STATS_BLOCK_USECS",
+    "pkt-rate-low": "ETHTOOL_A_COALESCE_PKT_RATE_LOW",
+    "rx-usecs-low": "ETHTOOL_A_COALESCE_RX_USECS_LOW",
+    "rx-frames-low": "ETHTOOL_A_COALESCE_RX_MAX_FRAMES_LOW",
+    "tx-usecs-low": "ETHTOOL_A_COALESCE_TX_USECS_LOW",
+    "tx-frames-low": "ETHTOOL_A_COALESCE_TX_MAX_FRAMES_LOW",
+    "pkt-rate-high": "ETHTOOL_A_COALESCE_PKT_RATE_HIGH",
+    "rx-usecs-high": "ETHTOOL_A_COALESCE_RX_USECS_HIGH",
+    "rx-frames-high": "ETHTOOL_A_COALESCE_RX_MAX_FRAMES_HIGH",
+    "tx-usecs-high": "ETHTOOL_A_COALESCE_TX_USECS_HIGH",
+    "tx-frames-high": "ETHTOOL_A_COALESCE_TX_MAX_FRAMES_HIGH",
+    "sample-interval": "ETHTOOL_A_COALESCE_RATE_SAMPLE_INTERVAL",
+    "tx-aggr-max-bytes": "ETHTOOL_A_COALESCE_TX_AGGR_MAX_BYTES",
+    "tx-aggr-max-frames": "ETHTOOL_A_COALESCE_TX_AGGR_MAX_FRAMES",
+    "tx-aggr-time-usecs": "ETHTOOL_A_COALESCE_TX_AGGR_TIME_USECS",
+}
+BOOL_COALESCE_SETTINGS = {
+    "adaptive-rx": "ETHTOOL_A_COALESCE_USE_ADAPTIVE_RX",
+    "adaptive-tx": "ETHTOOL_A_COALESCE_USE_ADAPTIVE_TX",
+    "cqe-mode-rx": "ETHTOOL_A_COALESCE_USE_CQE_MODE_RX",
+    "cqe-mode-tx": "ETHTOOL_A_COALESCE_USE_CQE_MODE_TX",
+}
+
+RING_SETTINGS = {
+    "rx": "ETHTOOL_A_RINGS_RX",
+    "rx-mini": "ETHTOOL_A_RINGS_RX_MINI",
+    "rx-jumbo": "ETHTOOL_A_RINGS_RX_JUMBO",
+    "tx": "ETHTOOL_A_RINGS_TX",
+    "rx-buf-len": "ETHTOOL_A_RINGS_RX_BUF_LEN",
+    "cqe-size": "ETHTOOL_A_RINGS_CQE_SIZE",
+    "tx-push-buf-len": "ETHTOOL_A_RINGS_TX_PUSH_BUF_LEN",
+}
+BOOL_RING_SETTINGS = {
+    "tx-push": "ETHTOOL_A_RINGS_TX_PUSH",
+    "rx-push": "ETHTOOL_A_RINGS_RX_PUSH",
+}
+RING_MAXIMUMS = {
+    "rx-max": "ETHTOOL_A_RINGS_RX_MAX",
+    "rx-mini-max": "ETHTOOL_A_RINGS_RX_MINI_MAX",
+    "rx-jumbo-max": "ETHTOOL_A_RINGS_RX_JUMBO_MAX",
+    "tx-max": "ETHTOOL_A_RINGS_TX_MAX",
+    "tx-push-buf-len-max": "ETHTOOL_A_RINGS_TX_PUSH_BUF_LEN_MAX",
+}
+
+CHANNEL_SETTINGS = {
+    "rx": "ETHTOOL_A_CHANNELS_RX_COUNT",
+    "tx": "ETHTOOL_A_CHANNELS_TX_COUNT",
+    "other": "ETHTOOL_A_CHANNELS_OTHER_COUNT",
+    "combined": "ETHTOOL_A_CHANNELS_COMBINED_COUNT",
+}
+CHANNEL_MAXIMUMS = {
+    "rx-max": "ETHTOOL_A_CHANNELS_RX_MAX",
+    "tx-max": "ETHTOOL_A_CHANNELS_TX_MAX",
+    "other-max": "ETHTOOL_A_CHANNELS_OTHER_MAX",
+    "combined-max": "ETHTOOL_A_CHANNELS_COMBINED_MAX",
+}
+
+BOOL_PAUSE_SETTINGS = {
+    "autoneg": "ETHTOOL_A_PAUSE_AUTONEG",
+    "rx": "ETHTOOL_A_PAUSE_RX",
+    "tx": "ETHTOOL_A_PAUSE_TX",
+}
+
+
+def _read_attrs(msg, settings, bool_settings={}):
+    ret = {name: msg.get_attr(attr) for name, attr in settings.items()}
+    for name, attr in bool_settings.items():
+        value = msg.get_attr(attr)
+        ret[name] = None if value is None else bool(value)
+    return ret
+
+
+def _bool_value(value):
+    if isinstance(value, str):
+        return value == "on"
+    return bool(value)
+
+
+def _write_attrs(settings, attr_settings, bool_settings={}):
+    attrs = []
+    for name, value in settings.items():
+        if name in attr_settings:
+            attrs.append((attr_settings[name], int(value)))
+        elif name in bool_settings:
+            attrs.append((bool_settings[name], int(_bool_value(value))))
+        else:
+            raise KeyError(name)
+    return attrs
+
+
+def _bitset_names(bitset):
+    """Returns the names of the bits set in a verbose bitset"""
+    if bitset is None:
+        return set()
+
+    nomask = bitset.get_attr("ETHTOOL_A_BITSET_NOMASK") is not None
+    bits = bitset.get_attr("ETHTOOL_A_BITSET_BITS")
+    if bits is None:
+        return set()
+
+    names = set()
+    for bit in bits.get_attrs("ETHTOOL_A_BITSET_BITS_BIT"):
+        if nomask or bit.get_attr("ETHTOOL_A_BITSET_BIT_VALUE") is not None:
+            names.add(bit.get_attr("ETHTOOL_A_BITSET_BIT_NAME"))
+    return names
+
+
+def _parse_coalesce(msg):
+    return _read_attrs(msg, COALESCE_SETTINGS, BOOL_COALESCE_SETTINGS)
+
+
+def _parse_pause(msg):
+    return _read_attrs(msg, {}, BOOL_PAUSE_SETTINGS)
+
+
+def _parse_rings(msg):
+    ret = _read_attrs(msg, RING_MAXIMUMS)
+    ret.update(_read_attrs(msg, RING_SETTINGS, BOOL_RING_SETTINGS))
+    return ret
+
+
+def _parse_channels(msg):
+    ret = _read_attrs(msg, CHANNEL_MAXIMUMS)
+    ret.update(_read_attrs(msg, CHANNEL_SETTINGS))
+    return ret
+
+
+def _parse_features(msg):
+    active = _bitset_names(msg.get_attr("ETHTOOL_A_FEATURES_ACTIVE"))
+    hw = _bitset_names(msg.get_attr("ETHTOOL_A_FEATURES_HW"))
+    return {name: name in active for name in sorted(active | hw)}
+
+
+def _parse_linkmodes(msg):
+    speed = msg.get_attr("ETHTOOL_A_LINKMODES_SPEED")
+    autoneg = msg.get_attr("ETHTOOL_A_LINKMODES_AUTONEG")
+    return {"speed": None if speed in (None, SPEED_UNKNOWN) else speed,
+            "autoneg": None if autoneg is None else bool(autoneg),
+            "duplex": msg.get_attr("ETHTOOL_A_LINKMODES_DUPLEX")}
+
+
+# name: (message class, get command, set command, reply command, parser,
+#        header flags of the get request)
+SETTINGS_PARTS = {
+    "coalesce": (ethtool_coalesce_msg, ETHTOOL_MSG_COALESCE_GET,
+                 ETHTOOL_MSG_COALESCE_SET, ETHTOOL_MSG_COALESCE_GET_REPLY,
+                 _parse_coalesce, 0),
+    "pause": (ethtool_pause_msg, ETHTOOL_MSG_PAUSE_GET,
+              ETHTOOL_MSG_PAUSE_SET, ETHTOOL_MSG_PAUSE_GET_REPLY,
+              _parse_pause, 0),
+    "rings": (ethtool_rings_msg, ETHTOOL_MSG_RINGS_GET,
+              ETHTOOL_MSG_RINGS_SET, ETHTOOL_MSG_RINGS_GET_REPLY,
+              _parse_rings, 0),
+    "channels": (ethtool_channels_msg, ETHTOOL_MSG_CHANNELS_GET,
+                 ETHTOOL_MSG_CHANNELS_SET, ETHTOOL_MSG_CHANNELS_GET_REPLY,
+                 _parse_channels, 0),
+    "features": (ethtool_features_msg, ETHTOOL_MSG_FEATURES_GET,
+                 ETHTOOL_MSG_FEATURES_SET, ETHTOOL_MSG_FEATURES_GET_REPLY,
+                 _parse_features, 0),
+    # the link modes bitsets aren't used, compact ones are much shorter
+    "linkmodes": (ethtool_linkmode_msg, ETHTOOL_MSG_LINKMODES_GET,
+                  ETHTOOL_MSG_LINKMODES_SET, ETHTOOL_MSG_LINKMODES_GET_REPLY,
+                  _parse_linkmodes, ETHTOOL_FLAG_COMPACT_BITSETS),
+}
+
+REPLY_MESSAGES = {reply_cmd: msg_class
+                  for msg_class, _, _, reply_cmd, _, _
+                  in SETTINGS_PARTS.values()}
+
+
+class EthtoolMarshal(Marshal):
+    """
+    All messages of a generic netlink family share the message type, the
+    replies are parsed by the message class of their cmd field so that
+    different kinds of replies can be received at once.
+    """
+    def __init__(self):
+        super().__init__()
+        self.family_id = None
+
+    def parse_one_message(self, key, flags, sequence_number, data, offset,
+                          length):
+        msg_class = None
+        if key == self.family_id:
+            msg_class = REPLY_MESSAGES.get(data[offset + GENL_CMD_OFFSET])
+        if msg_class is None:
+            return super().parse_one_message(key, flags, sequence_number,
+                                             data, offset, length)
+
+        msg = msg_class(data, offset=offset)
+        msg["header"]["error"] = None
+        try:
+            msg.decode()
+        except NetlinkDecodeError as e:
+            msg["header"]["error"] = e
+        return msg
+
+
+class EthtoolNetlink(NlEthtool):
+    """
+    Client of the ethtool generic netlink family
+
+    The family is resolved once when the object is created, raises
+    NetlinkError if the kernel doesn't provide it. Devices are referenced
+    by ifindex, settings use the names of the ethtool command line options,
+    settings the device doesn't support are None.
+
+    get_settings requests several kinds of settings in one round trip. The
+    object can be shared by threads, the requests are serialized.
+    """
+    def __init__(self):
+        super().__init__()
+        self.marshal = EthtoolMarshal()
+        self._request_lock = threading.Lock()
+
+        self.bind(ETHTOOL_GENL_NAME, genlmsg)
+        self.marshal.family_id = self.prid
+
+    def _message(self, part, ifindex, attrs=[], flags=0, set_request=False):
+        msg_class, get_cmd, set_cmd, _, _, get_flags = SETTINGS_PARTS[part]
+        msg = msg_class()
+        msg["cmd"] = set_cmd if set_request else get_cmd
+        msg["version"] = ETHTOOL_GENL_VERSION
+
+        header = [("ETHTOOL_A_HEADER_DEV_INDEX", ifindex)]
+        if not set_request:
+            flags |= get_flags
+        if flags:
+            header.append(("ETHTOOL_A_HEADER_FLAGS", flags))
+        msg["attrs"].append((msg_class.nla_map[1][0], {"attrs": header}))
+        msg["attrs"].extend(attrs)
+
+        msg["header"]["flags"] = NLM_F_REQUEST
+        if set_request:
+            msg["header"]["flags"] |= NLM_F_ACK
+        return msg
+
+    def _request(self, msgs):
+        """Sends all messages at once, returns the reply of each message
+        or the NetlinkError it failed with"""
+        with self._request_lock:
+            seqs = self.addr_pool.alloc_multi(len(msgs))
+            try:
+                for seq, msg in zip(seqs, msgs):
+                    msg["header"]["type"] = self.prid
+                    msg["header"]["sequence_number"] = seq
+                    msg["header"]["pid"] = self.epid or os.getpid()
+                self._send_batch(msgs)
+
+                replies = []
+                for seq in seqs:
+                    try:
+                        replies.append(self.get(msg_seq=seq)[0])
+                    except NetlinkError as e:
+                        replies.append(e)
+                return replies
+            finally:
+                with self.backlog_lock:
+                    for seq in seqs:
+                        self.backlog.pop(seq, None)
+                        self.addr_pool.free(seq, ban=0xFF)
+
+    def get_settings(self, ifindex, parts=tuple(SETTINGS_PARTS)):
+        """Reads settings of a device in a single round trip
+
+        Args:
+            ifindex -- index of the device
+            parts -- names of the settings to read: "coalesce", "pause",
+                "rings", "channels", "features" or "linkmodes"
+
+        Returns a dictionary with a dictionary of settings for each part,
+        or the NetlinkError if the part couldn't be read, usually because
+        the driver doesn't support it.
+        """
+        replies = self._request([self._message(part, ifindex)
+                                 for part in parts])
+
+        ret = {}
+        for part, reply in zip(parts, replies):
+            if isinstance(reply, NetlinkError):
+                ret[part] = reply
+            else:
+                ret[part] = SETTINGS_PARTS[part][4](reply)
+        return ret
+
+    def get_part(self, ifindex, part):
+        """Reads one kind of settings, raises the NetlinkError on failure"""
+        settings = self.get_settings(ifindex, (part,))[part]
+        if isinstance(settings, NetlinkError):
+            raise settings
+        return settings
+
+    def _set(self, ifindex, part, attrs, flags=0):
+        reply = self._request([self._message(part, ifindex, attrs, flags,
+                                             set_request=True)])[0]
+        if isinstance(reply, NetlinkError):
+            raise reply
+
+    def set_coalesce(self, ifindex, settings):
+        """Sets coalescing settings, e.g. {"rx-usecs": 8, "adaptive-rx": "off"}
+
+        Raises KeyError for names that don't have a netlink attribute.
+        """
+        self._set(ifindex, "coalesce",
+                  _write_attrs(settings, COALESCE_SETTINGS,
+                               BOOL_COALESCE_SETTINGS))
+
+    def set_pause(self, ifindex, settings):
+        """Sets pause frame settings, e.g. {"rx": True, "tx": False}"""
+        self._set(ifindex, "pause",
+                  _write_attrs(settings, {}, BOOL_PAUSE_SETTINGS))
+
+    def set_rings(self, ifindex, settings):
+        """Sets ring sizes, e.g. {"rx": 1024, "tx": 1024}"""
+        self._set(ifindex, "rings",
+                  _write_attrs(settings, RING_SETTINGS, BOOL_RING_SETTINGS))
+
+    def set_channels(self, ifindex, settings):
+        """Sets channel counts, e.g. {"combined": 4}"""
+        self._set(ifindex, "channels",
+                  _write_attrs(settings, CHANNEL_SETTINGS))
+
+    def set_linkmodes(self, ifindex, speed=None, autoneg=None):
+        """Sets the link speed in Mb/s and the autonegotiation"""
+        attrs = []
+        if autoneg is not None:
+            attrs.append(("ETHTOOL_A_LINKMODES_AUTONEG",
+                          int(_bool_value(autoneg))))
+        if speed is not None:
+            attrs.append(("ETHTOOL_A_LINKMODES_SPEED", int(speed)))
+        self._set(ifindex, "linkmodes", attrs)
+
+    def set_features(self, ifindex, features):
+        """Sets features by their 'ethtool -k' names, e.g. {"rx-gro": False}"""
+        bits = []
+        for name, value in features.items():
+            bit = [("ETHTOOL_A_BITSET_BIT_NAME", name)]
+            if _bool_value(value):
+                bit.append(("ETHTOOL_A_BITSET_BIT_VALUE", True))
+            bits.append(("ETHTOOL_A_BITSET_BITS_BIT", {"attrs": bit}))
+
+        wanted = {"attrs": [("ETHTOOL_A_BITSET_BITS", {"attrs": bits})]}
+        self._set(ifindex, "features",
+                  [("ETHTOOL_A_FEATURES_WANTED", wanted)],
+                  flags=ETHTOOL_FLAG_OMIT_REPLY)
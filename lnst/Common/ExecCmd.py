@@ -57,11 +57,22 @@ def log_output(log_func, out_type, out):
              % (out_type, out))
 
 def exec_cmd(cmd, die_on_err=True, log_outputs=True, report_stderr=False, json=False, stdin=None):
+    subp = start_cmd(cmd)
+    return finish_cmd(subp, die_on_err, log_outputs, report_stderr, json, stdin)
+
+def start_cmd(cmd, new_session=False):
+    """Starts cmd in a shell, finish it with finish_cmd
+
+    With new_session the command gets its own session and process group so
+    that it can be signalled with os.killpg.
+    """
     cmd = cmd.rstrip(" ")
     logging.debug("Executing: \"%s\"" % cmd)
-    subp = subprocess.Popen(cmd, shell=True, stdout=subprocess.PIPE,
+    return subprocess.Popen(cmd, shell=True, stdout=subprocess.PIPE,
                             stderr=subprocess.PIPE, stdin=subprocess.PIPE,
-                            close_fds=True)
+                            close_fds=True, start_new_session=new_session)
+
+def finish_cmd(subp, die_on_err=True, log_outputs=True, report_stderr=False, json=False, stdin=None):
     (data_stdout, data_stderr) = subp.communicate(input = stdin)
     data_stdout = data_stdout.decode()
     data_stderr = data_stderr.decode()
@@ -76,7 +87,7 @@ def exec_cmd(cmd, die_on_err=True, log_outputs=True, report_stderr=False, json=F
         if data_stderr:
             log_output(logging.debug, "Stderr", data_stderr)
     if subp.returncode and die_on_err:
-        err = ExecCmdFail(cmd, subp.returncode, [data_stdout, data_stderr], report_stderr)
+        err = ExecCmdFail(subp.args, subp.returncode, [data_stdout, data_stderr], report_stderr)
         raise err
 
     if json:
@@ -0,0 +1,335 @@
+"""
+Append-only on-disk storage of exported log records.
+
+The records are stored in zlib compressed chunks appended to segment files,
+each chunk holds records of a single source (the controller or an agent).
+Every chunk is described by a line of the json index file that lives next
+to the segments, so the records of a source or of a time range can be read
+without decompressing the rest.
+
+Copyright 2024 Red Hat, Inc.
+Licensed under the GNU General Public License, version 2 as
+published by the Free Software Foundation; see COPYING for details.
+"""
+
+import os
+import json
+import bisect
+import zlib
+import pickle
+import logging
+import threading
+from collections.abc import Mapping, Sequence
+
+
+class LogStore(object):
+    """Writer of the log segments
+
+    Records are buffered per source and written as one chunk when
+    chunk_size records are buffered or on flush. A new segment file is
+    started when the current one exceeds segment_size bytes.
+
+    With max_size set the oldest segments are deleted, together with their
+    index entries, once the segments take more than max_size bytes. The
+    segments are then limited to a quarter of max_size so that most of the
+    records are kept.
+
+    The files are written unbuffered and records pending in a forked child
+    are discarded so that processes forked from the owner (jobs, network
+    namespaces) never write to the segments.
+    """
+    INDEX_NAME = "index.jsonl"
+    CHUNK_SIZE = 1024
+    SEGMENT_SIZE = 64 * 1024 * 1024
+
+    def __init__(self, path, chunk_size=CHUNK_SIZE, segment_size=SEGMENT_SIZE,
+                 max_size=None):
+        self.path = path
+        self.chunk_size = chunk_size
+        self.segment_size = segment_size
+        self.max_size = max_size
+        if max_size is not None:
+            self.segment_size = max(min(segment_size, max_size // 4), 1)
+
+        self._lock = threading.RLock()
+        self._pending = {}
+        self._generations = {}
+        self._segment_num = 0
+        self._segment = None
+        self._segment_sizes = {}
+        self._index = None
+        self._pid = os.getpid()
+
+    @property
+    def index_path(self):
+        return os.path.join(self.path, self.INDEX_NAME)
+
+    def append(self, source, record):
+        r = dict(record.__dict__)
+        r['msg'] = record.getMessage()
+        r['args'] = None
+        if record.exc_info and not record.exc_text:
+            r['exc_text'] = logging.Formatter().formatException(record.exc_info)
+        r['exc_info'] = None
+
+        with self._lock:
+            self._generations.setdefault(source, 0)
+            pending = self._pending.setdefault(source, [])
+            pending.append(r)
+            if len(pending) >= self.chunk_size:
+                self._write_chunk(source)
+
+    def reset_source(self, source):
+        """Starts a new generation of a source
+
+        The records of the previous generation are written first, views
+        show the generations that were current when they were created.
+        """
+        with self._lock:
+            self._write_chunk(source)
+            generation = self._generations.get(source, 0) + 1
+            self._generations[source] = generation
+            if os.getpid() == self._pid:
+                self._write_index({"source": source,
+                                   "generation": generation})
+
+    def flush(self):
+        with self._lock:
+            for source in list(self._pending.keys()):
+                self._write_chunk(source)
+            if self._segment is not None:
+                self._segment.flush()
+            if self._index is not None:
+                self._index.flush()
+
+    def close(self):
+        with self._lock:
+            self.flush()
+            if self._segment is not None:
+                self._segment.close()
+                self._segment = None
+            if self._index is not None:
+                self._index.close()
+                self._index = None
+
+    def view(self):
+        """Returns a LogListView of the current generations of the sources"""
+        with self._lock:
+            return LogListView(self.path, store=self,
+                               generations=dict(self._generations))
+
+    def _write_chunk(self, source):
+        records = self._pending.pop(source, None)
+        if not records or os.getpid() != self._pid:
+            return
+
+        if self._segment is None or self._segment.tell() >= self.segment_size:
+            self._open_segment()
+
+        data = zlib.compress(pickle.dumps(records, pickle.HIGHEST_PROTOCOL), 1)
+        offset = self._segment.tell()
+        self._segment.write(data)
+        self._segment_sizes[os.path.basename(self._segment.name)] = \
+            offset + len(data)
+
+        self._write_index({"source": source,
+                           "generation": self._generations.get(source, 0),
+                           "segment": os.path.basename(self._segment.name),
+                           "offset": offset,
+                           "length": len(data),
+                           "count": len(records),
+                           "start": records[0]["created"],
+                           "end": records[-1]["created"]})
+
+        if self.max_size is not None:
+            self._rotate()
+
+    def _rotate(self):
+        current = os.path.basename(self._segment.name)
+        removed = set()
+        total = sum(self._segment_sizes.values())
+        # the sizes are kept in the order the segments were created
+        for name, size in list(self._segment_sizes.items()):
+            if total <= self.max_size or name == current:
+                break
+            del self._segment_sizes[name]
+            total -= size
+            removed.add(name)
+            try:
+                os.remove(os.path.join(self.path, name))
+            except FileNotFoundError:
+                pass
+
+        if not removed:
+            return
+
+        self._index.close()
+        self._index = None
+        tmp_path = self.index_path + ".tmp"
+        with open(self.index_path) as index, open(tmp_path, "w") as tmp:
+            for line in index:
+                if json.loads(line).get("segment") not in removed:
+                    tmp.write(line)
+        os.replace(tmp_path, self.index_path)
+
+    def _open_segment(self):
+        if self._segment is not None:
+            self._segment.close()
+        os.makedirs(self.path, exist_ok=True)
+
+        self._segment_num += 1
+        name = "segment-%04d-%d.bin" % (self._segment_num, self._pid)
+        self._segment = open(os.path.join(self.path, name), "ab",
+                             buffering=0)
+
+    def _write_index(self, entry):
+        if self._index is None:
+            os.makedirs(self.path, exist_ok=True)
+            self._index = open(self.index_path, "a", buffering=1)
+        self._index.write(json.dumps(entry) + "\n")
+
+
+class LogListView(Mapping):
+    """Read-only mapping of source name to the sequence of its log records
+
+    This replaces the dictionary of LogRecord lists, the records are only
+    read from the segments when accessed. When pickled only the location of
+    the segments is stored, see relocate.
+
+    With generations set the view only contains those sources and only the
+    records of the given generation of each of them, so that the view of a
+    recipe run isn't changed by the agents reconnected for the following
+    runs. Otherwise the latest generation of every source is shown.
+    """
+    def __init__(self, path, store=None, generations=None):
+        self._path = path
+        self._store = store
+        self._generations = generations
+
+    def __getstate__(self):
+        if self._store is not None:
+            self._store.flush()
+        return {"_path": self._path, "_generations": self._generations}
+
+    def __setstate__(self, state):
+        self._path = state["_path"]
+        self._generations = state.get("_generations")
+        self._store = None
+
+    @property
+    def path(self):
+        return self._path
+
+    def relocate(self, base_dir):
+        """Looks for the segments in and above base_dir if they were moved
+
+        Returns True if the segments were found.
+        """
+        name = os.path.basename(self._path)
+        candidates = [self._path,
+                      os.path.join(base_dir, name),
+                      os.path.join(os.path.dirname(base_dir), name)]
+        for candidate in candidates:
+            if os.path.isfile(os.path.join(candidate, LogStore.INDEX_NAME)):
+                self._path = candidate
+                return True
+        return False
+
+    def _chunks(self):
+        if self._store is not None:
+            self._store.flush()
+
+        generations = self._generations
+        chunks = {}
+        if generations is not None:
+            chunks = {source: [] for source in generations}
+
+        try:
+            with open(os.path.join(self._path, LogStore.INDEX_NAME)) as f:
+                for line in f:
+                    entry = json.loads(line)
+                    source = entry["source"]
+                    if generations is not None:
+                        if ("segment" in entry and
+                                generations.get(source) == entry["generation"]):
+                            chunks[source].append(entry)
+                    elif "segment" not in entry:
+                        chunks[source] = []
+                    else:
+                        chunks.setdefault(source, []).append(entry)
+        except FileNotFoundError:
+            pass
+        return chunks
+
+    def __getitem__(self, source):
+        chunks = self._chunks()
+        if source not in chunks:
+            raise KeyError(source)
+        return LogRecordSequence(self._path, chunks[source])
+
+    def __iter__(self):
+        return iter(self._chunks())
+
+    def __len__(self):
+        return len(self._chunks())
+
+    def records(self, source, start=None, end=None):
+        """Iterates over the records of source created in <start, end>
+
+        Only the chunks overlapping the time range are read.
+        """
+        for chunk in self._chunks().get(source, []):
+            if start is not None and chunk["end"] < start:
+                continue
+            if end is not None and chunk["start"] > end:
+                continue
+            for record in _read_chunk(self._path, chunk):
+                if ((start is None or record.created >= start) and
+                        (end is None or record.created <= end)):
+                    yield record
+
+
+class LogRecordSequence(Sequence):
+    """Lazy sequence of the LogRecords of one source"""
+    def __init__(self, path, chunks):
+        self._path = path
+        self._chunks = chunks
+        self._offsets = []
+        total = 0
+        for chunk in chunks:
+            self._offsets.append(total)
+            total += chunk["count"]
+        self._len = total
+        self._cached = (None, None)
+
+    def __len__(self):
+        return self._len
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(self._len))]
+
+        if index < 0:
+            index += self._len
+        if not 0 <= index < self._len:
+            raise IndexError("log record index out of range")
+
+        i = bisect.bisect_right(self._offsets, index) - 1
+        return self._chunk_records(i)[index - self._offsets[i]]
+
+    def __iter__(self):
+        for chunk in self._chunks:
+            yield from _read_chunk(self._path, chunk)
+
+    def _chunk_records(self, i):
+        if self._cached[0] != i:
+            self._cached = (i, _read_chunk(self._path, self._chunks[i]))
+        return self._cached[1]
+
+
+def _read_chunk(path, chunk):
+    with open(os.path.join(path, chunk["segment"]), "rb") as f:
+        f.seek(chunk["offset"])
+        data = f.read(chunk["length"])
+    records = pickle.loads(zlib.decompress(data))
+    return [logging.makeLogRecord(record) for record in records]
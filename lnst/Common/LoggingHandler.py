@@ -14,8 +14,13 @@ __author__ = """
 olichtne@redhat.com (Ondrej Lichtner)
 """
 
+import os
+import zlib
+import time
 import pickle
 import logging
+import threading
+import collections
 import xmlrpc.client
 from lnst.Common.ConnectionHandler import send_data
 
@@ -63,11 +68,48 @@ class LogBuffer(logging.Handler):
         logging.Handler.close(self)
 
 class TransmitHandler(logging.Handler):
-    def __init__(self, target):
+    """
+    Handler transmitting log records to the controller (or to the parent
+    process) in batches. Records are buffered and sent as a single
+    "log_batch" message when the batch is full, when the oldest buffered
+    record is older than flush_interval seconds, or before any other message
+    is sent to the same target through the send method - so that logs of a
+    command always arrive before its result.
+
+    The buffer is bounded by capacity, when it is full (e.g. because the
+    target doesn't accept data) the oldest records are dropped. The number
+    of dropped records is reported in the next batch, the number of records
+    whose transmission had to be retried is counted in backpressured.
+    """
+    BATCH_SIZE = 256
+    FLUSH_INTERVAL = 0.2
+    CAPACITY = 16384
+    COMPRESS_THRESHOLD = 16 * 1024
+
+    def __init__(self, target, batch_size=BATCH_SIZE,
+                 flush_interval=FLUSH_INTERVAL, capacity=CAPACITY,
+                 compress=True):
         logging.Handler.__init__(self)
         self.target = target
         self._origin_name = None
 
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.capacity = capacity
+        self.compress = compress
+
+        self.dropped = 0
+        self.backpressured = 0
+        self._unreported_dropped = 0
+
+        self._buffer = collections.deque()
+        self._deadline = None
+        self._stopped = threading.Event()
+        self._flusher = None
+        # the handler is inherited by forked children, only the process
+        # that created it may send the buffered records
+        self._owner_pid = os.getpid()
+
     def set_origin_name(self, name):
         self._origin_name = name
 
@@ -79,21 +121,137 @@ class TransmitHandler(logging.Handler):
         if self._origin_name != None:
             r['origin_name'] = self._origin_name
 
-        data = {"type": "log", "record": r}
+        if not self._buffer:
+            self._deadline = time.monotonic() + self.flush_interval
+        elif len(self._buffer) >= self.capacity:
+            self._buffer.popleft()
+            self.dropped += 1
+            self._unreported_dropped += 1
+        self._buffer.append(r)
+
+        if (len(self._buffer) >= self.batch_size or
+                time.monotonic() >= self._deadline):
+            self._flush_buffer()
+        else:
+            self._start_flusher()
+
+    def send(self, data):
+        """Sends a message to the target after flushing the buffered records
+
+        Returns the result of send_data.
+        """
+        self.acquire()
+        try:
+            self._flush_buffer()
+            return send_data(self.target, data)
+        finally:
+            self.release()
+
+    def flush(self):
+        self.acquire()
+        try:
+            return self._flush_buffer()
+        finally:
+            self.release()
+
+    def _flush_buffer(self):
+        if not self._buffer:
+            return True
 
-        send_data(self.target, data)
+        records = list(self._buffer)
+        data = {"type": "log_batch",
+                "dropped": self._unreported_dropped,
+                "compressed": False,
+                "records": records}
+        if self.compress and len(records) > 1:
+            pickled = pickle.dumps(records, pickle.HIGHEST_PROTOCOL)
+            if len(pickled) >= self.COMPRESS_THRESHOLD:
+                data["compressed"] = True
+                data["records"] = zlib.compress(pickled, 1)
+
+        if not send_data(self.target, data):
+            self.backpressured += len(records)
+            self._deadline = time.monotonic() + self.flush_interval
+            return False
+
+        self._buffer.clear()
+        self._unreported_dropped = 0
+        self._deadline = None
+        return True
+
+    def _start_flusher(self):
+        # started lazily so that the thread lives in the process that uses
+        # the handler, handlers are inherited by forked children
+        if self._flusher is None and not self._stopped.is_set():
+            self._flusher = threading.Thread(target=self._flush_loop,
+                                             name="log-flusher", daemon=True)
+            self._flusher.start()
+
+    def _flush_loop(self):
+        while not self._stopped.wait(self.flush_interval / 2):
+            self.acquire()
+            try:
+                if (self._deadline is not None and
+                        time.monotonic() >= self._deadline):
+                    self._flush_buffer()
+            except Exception:
+                pass
+            finally:
+                self.release()
+
+    def stop(self):
+        """Stops the background flushing
+
+        The buffered records are sent if the target still accepts them,
+        otherwise they're counted as dropped. In a forked child the buffer
+        holds the records of the parent, they're discarded without sending
+        as the parent sends them itself - the child sending over the shared
+        target would duplicate them and, with a SecureSocket, break the
+        sequence numbers of the parent's connection.
+        """
+        self._stopped.set()
+        self.acquire()
+        try:
+            if os.getpid() != self._owner_pid:
+                self._buffer.clear()
+                return
+
+            try:
+                self._flush_buffer()
+            except Exception:
+                pass
+            self.dropped += len(self._buffer)
+            self._buffer.clear()
+        finally:
+            self.release()
 
     def close(self):
+        self._stopped.set()
         logging.Handler.close(self)
 
 
+def unpack_log_batch(data):
+    """Returns the list of log record dictionaries of a "log_batch" message"""
+    if data["compressed"]:
+        return pickle.loads(zlib.decompress(data["records"]))
+    return data["records"]
+
+
 class ExportHandler(logging.Handler):
-    def __init__(self, logs):
+    """
+    Handler storing the log records of a source (the controller or an agent)
+    in a LogStore, from which they're exported to the .lrc files.
+    """
+    def __init__(self, log_store, source):
         logging.Handler.__init__(self)
-        self._log_list = logs
+        self._log_store = log_store
+        self._source = source
 
     def emit(self, record):
-        self._log_list.append(record)
+        self._log_store.append(self._source, record)
+
+    def flush(self):
+        self._log_store.flush()
 
     def close(self):
         logging.Handler.close(self)
@@ -14,6 +14,9 @@ from logging import Formatter
 import logging.handlers
 import traceback
 from lnst.Common.LoggingHandler import TransmitHandler, ExportHandler
+from lnst.Common.LoggingHandler import unpack_log_batch
+from lnst.Common.LogStore import LogStore
+from lnst.Common.ConnectionHandler import send_data
 from lnst.Common.Colours import decorate_with_preset, strip_colours
 
 def log_exc_traceback():
@@ -101,9 +104,10 @@ class LoggingCtl:
     agents = {}
     transmit_handler = None
     _id_seq = 0
-    log_list = {}
+    log_store = None
 
-    def __init__(self, debug=False, log_dir=None, log_subdir="", colours=True):
+    def __init__(self, debug=False, log_dir=None, log_subdir="", colours=True,
+                 log_store_size=None):
         #clear any previously set handlers
         logger = logging.getLogger('')
         for i in list(logger.handlers):
@@ -130,9 +134,12 @@ class LoggingCtl:
         self.display_handler = logging.StreamHandler(sys.stdout)
         self.display_handler.setFormatter(MultilineFormatter(colours))
 
-        # the export_handler will add log messages to lists, so it could be exported to .lrc file
-        self.log_list["controller"] = []
-        self.export_handler = self._create_export_handler(self.log_list["controller"], colours)
+        # the export_handler will store log messages on disk, so they could
+        # be exported to .lrc file
+        self.log_store = LogStore(os.path.join(self.log_folder, "export_logs"),
+                                  max_size=log_store_size)
+        self.log_store.reset_source("controller")
+        self.export_handler = self._create_export_handler("controller", colours)
         self.export_handler.setLevel(logging.DEBUG)
 
         if not debug:
@@ -200,8 +207,8 @@ class LoggingCtl:
         logger.addHandler(agent_info)
         logger.addHandler(agent_debug)
 
-        self.log_list[agent_id] = []
-        export_handler = self._create_export_handler(self.log_list[agent_id])
+        self.log_store.reset_source(agent_id)
+        export_handler = self._create_export_handler(agent_id)
         logger.addHandler(export_handler)
 
         self.agents[agent_id] = (agent_info, agent_debug, export_handler)
@@ -223,6 +230,19 @@ class LoggingCtl:
         record = logging.makeLogRecord(log_record)
         logger.handle(record)
 
+    def add_client_logs(self, agent_id, batch):
+        records = unpack_log_batch(batch)
+        logger = logging.getLogger(agent_id)
+        handle = logger.handle
+        make_record = logging.makeLogRecord
+        for log_record in records:
+            log_record['address'] = agent_id
+            handle(make_record(log_record))
+
+        if batch["dropped"]:
+            logger.warning("%d log records were dropped by the agent" %
+                           batch["dropped"])
+
     def set_connection(self, target):
         if self.transmit_handler != None:
             self.cancel_connection()
@@ -240,8 +260,28 @@ class LoggingCtl:
         if self.transmit_handler != None:
             logger = logging.getLogger()
             logger.removeHandler(self.transmit_handler)
+            self.transmit_handler.stop()
             del self.transmit_handler
 
+    def flush_connection(self):
+        """Sends the buffered log records, called before forking so that
+        the child doesn't inherit them"""
+        if self.transmit_handler != None:
+            self.transmit_handler.flush()
+
+    def send_data(self, target, data):
+        """Sends data to target, flushing the transmitted logs first
+
+        Messages sent to the log connection target have to go through the
+        transmit handler so that they're ordered after the previously logged
+        records and aren't interleaved with a batch flushed in the
+        background.
+        """
+        handler = self.transmit_handler
+        if handler is not None and handler.target is target:
+            return handler.send(data)
+        return send_data(target, data)
+
     def disable_logging(self):
         self.cancel_connection()
 
@@ -274,8 +314,8 @@ class LoggingCtl:
 
         return (file_debug, file_info)
 
-    def _create_export_handler(self, target: list, colours: bool = False):
-        export_handler = ExportHandler(target)
+    def _create_export_handler(self, source: str, colours: bool = False):
+        export_handler = ExportHandler(self.log_store, source)
         export_handler.setFormatter(MultilineFormatter(colours))
 
         return export_handler
@@ -284,7 +324,7 @@ class LoggingCtl:
         return self.recipe_log_path
 
     def get_recipe_log_list(self):
-        return self.log_list
+        return self.log_store.view()
 
     def set_origin_name(self, name):
         self._origin_name = name
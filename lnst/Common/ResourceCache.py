@@ -14,11 +14,13 @@ import os
 import time
 import shutil
 import json
+import tarfile
+import tempfile
 from lnst.Common.Utils import sha256sum
 from lnst.Common.LnstError import LnstError
 
 #current index version
-INDEX_VERSION = 1
+INDEX_VERSION = 2
 #minimal supported index version -- will be updated to current one when loaded
 MIN_INDEX_VERSION = 1
 
@@ -26,11 +28,18 @@ class ResourceCacheError(LnstError):
     pass
 
 class ResourceCache(object):
+    """Content addressed cache of resources sent by the controller
+
+    Entries are stored under their sha256 digest and tracked in a json index
+    that persists across agent restarts. Entries are evicted when they
+    weren't used for the expiration period, or least recently used first
+    when the total size of the cache exceeds size_limit (0 means no limit).
+    """
     _CACHE_INDEX_FILE_NAME = "index"
     _root = None
     _expiration_period = None
 
-    def __init__(self, cache_path, expiration_period):
+    def __init__(self, cache_path, expiration_period, size_limit=0):
         if os.path.exists(cache_path):
             if os.path.isdir(cache_path):
                 self._root = cache_path
@@ -42,34 +51,56 @@ class ResourceCache(object):
 
         self._index = {"index_version": INDEX_VERSION,
                        "entries": {}}
-        self._read_index()
         self._expiration_period = expiration_period
+        self._size_limit = size_limit
+        self._read_index()
 
     def _read_index(self):
         try:
-            with open(self.index_path, "w") as f:
+            with open(self.index_path, "r") as f:
                 index = json.load(f)
-                if index["index_version"] > INDEX_VERSION:
-                    raise ResourceCacheError("Incompatible ResourceCache index versions")
-                elif index["index_version"] == INDEX_VERSION:
-                    self._index = index
-                    logging.debug("Resource cache index loaded")
-                else:
-                    self._index = self._update_old_index(index)
-                    logging.debug("Resource cache index loaded")
-                    self._save_index()
-        except:
-            pass
+        except FileNotFoundError:
+            return
+        except (OSError, ValueError) as e:
+            logging.warning("Resource cache index unreadable, starting with "
+                            "an empty cache: %s" % e)
+            return
+
+        if index["index_version"] > INDEX_VERSION:
+            raise ResourceCacheError("Incompatible ResourceCache index versions")
+        elif index["index_version"] < INDEX_VERSION:
+            index = self._update_old_index(index)
+
+        self._index = index
+        # entries whose files were removed behind our back are forgotten
+        for entry_hash, entry in list(index["entries"].items()):
+            if not os.path.isfile(entry["path"]):
+                del index["entries"][entry_hash]
+        logging.debug("Resource cache index loaded, %d entries" %
+                      len(index["entries"]))
+        self._save_index()
 
     def _update_old_index(self, old):
         if old["index_version"] < MIN_INDEX_VERSION:
             raise ResourceCacheError("ResourceCache index version too old to update")
         logging.debug("Updating old index to newer version")
+
+        if old["index_version"] < 2:
+            for entry in old["entries"].values():
+                try:
+                    entry["size"] = os.path.getsize(entry["path"])
+                except OSError:
+                    entry["size"] = 0
+        old["index_version"] = INDEX_VERSION
         return old
 
     def _save_index(self):
-        with open(self.index_path, "w") as f:
+        # written to a temporary file first so that an agent killed while
+        # saving doesn't leave a truncated index behind
+        tmp_path = self.index_path + ".tmp"
+        with open(tmp_path, "w") as f:
             json.dump(self._index, f)
+        os.replace(tmp_path, self.index_path)
 
     @property
     def index_path(self):
@@ -79,17 +110,35 @@ class ResourceCache(object):
     def root(self):
         return self._root
 
+    @property
+    def size(self):
+        return sum(entry["size"] for entry in self._index["entries"].values())
+
     def query(self, res_hash):
         return res_hash in self._index["entries"]
 
+    def query_many(self, res_hashes):
+        return {res_hash: self.query(res_hash) for res_hash in res_hashes}
+
     def get_path(self, res_hash):
         return self._index["entries"][res_hash]["path"]
 
     def renew_entry(self, entry_hash):
-        self._index["entries"][entry_hash]["last_used"] = int(time.time())
+        self.renew_entries([entry_hash])
+
+    def renew_entries(self, entry_hashes):
+        now = time.time()
+        for entry_hash in entry_hashes:
+            self._index["entries"][entry_hash]["last_used"] = now
         self._save_index()
 
-    def add_file_entry(self, filepath, entry_name):
+    def add_file_entry(self, filepath, entry_name, keep=()):
+        """Adds the file as an entry, returns its hash
+
+        Evicting the entries over the size limit skips the entry itself and
+        the entries whose hashes are in keep, e.g. the entries reported as
+        cached earlier in the same resource sync.
+        """
         entry_hash = sha256sum(filepath)
 
         if entry_hash in self._index["entries"]:
@@ -103,30 +152,92 @@ class ResourceCache(object):
 
         entry = {"name": entry_name,
                  "path": entry_path,
-                 "last_used": int(time.time()),
+                 "last_used": time.time(),
                  "digest": entry_hash,
+                 "size": os.path.getsize(entry_path),
                  "type": "file"}
         self._index["entries"][entry_hash] = entry
 
+        self._evict_over_limit(keep=set(keep) | {entry_hash})
         self._save_index()
 
         return entry_hash
 
+    def add_archive_entries(self, archive_path, entry_names, keep=()):
+        """Adds the files of a tar archive as separate file entries
+
+        entry_names maps the archive member names, which are the sha256
+        digests of the files, to the entry names. None of the archive
+        members and none of the entries in keep are evicted by adding them.
+        Returns the list of added entry hashes.
+        """
+        keep = set(keep) | set(entry_names)
+        added = []
+        with tarfile.open(archive_path) as archive:
+            for member_name, entry_name in entry_names.items():
+                if member_name in self._index["entries"]:
+                    continue
+
+                member = archive.extractfile(member_name)
+                if member is None:
+                    raise ResourceCacheError("Invalid archive member %s" %
+                                             member_name)
+                with tempfile.NamedTemporaryFile("wb", dir=self._root,
+                                                 delete=False) as f:
+                    shutil.copyfileobj(member, f)
+
+                entry_hash = self.add_file_entry(f.name, entry_name, keep)
+                if entry_hash != member_name:
+                    self.del_cache_entry(entry_hash)
+                    raise ResourceCacheError("Archive member %s digest "
+                                             "mismatch" % member_name)
+                added.append(entry_hash)
+        return added
+
+    def _remove_entry(self, entry_hash):
+        try:
+            os.remove(self._index["entries"][entry_hash]["path"])
+        except FileNotFoundError:
+            pass
+        del self._index["entries"][entry_hash]
+
     def del_cache_entry(self, entry_hash):
         if entry_hash in self._index["entries"]:
-            os.remove(self._index["entries"][entry_hash].path)
-            del self._index["entries"][entry_hash]
+            self._remove_entry(entry_hash)
             self._save_index()
 
-    def del_old_entries(self):
-        if self._expiration_period == 0:
-            return
+    def _evict_over_limit(self, keep=()):
+        if not self._size_limit:
+            return []
+
+        size = self.size
+        evicted = []
+        entries = sorted(self._index["entries"].values(),
+                         key=lambda entry: entry["last_used"])
+        for entry in entries:
+            if size <= self._size_limit:
+                break
+            if entry["digest"] in keep:
+                continue
+            size -= entry["size"]
+            evicted.append(entry["digest"])
+            self._remove_entry(entry["digest"])
+
+        if evicted:
+            logging.debug("Evicted %d least recently used resource cache "
+                          "entries" % len(evicted))
+        return evicted
 
+    def del_old_entries(self):
         rm = []
-        now = time.time()
-        for entry_hash, entry in list(self._index["entries"].items()):
-            if entry["last_used"] <= (now - self._expiration_period):
-                rm.append(entry_hash)
+        if self._expiration_period != 0:
+            now = time.time()
+            for entry_hash, entry in list(self._index["entries"].items()):
+                if entry["last_used"] <= (now - self._expiration_period):
+                    rm.append(entry_hash)
 
         for entry_hash in rm:
-            self.del_cache_entry(entry_hash)
+            self._remove_entry(entry_hash)
+
+        if self._evict_over_limit() or rm:
+            self._save_index()
@@ -0,0 +1,237 @@
+"""
+Defines the Sampler class used by test modules to collect periodic samples
+of several sources in a single thread.
+
+Copyright 2024 Red Hat, Inc.
+Licensed under the GNU General Public License, version 2 as
+published by the Free Software Foundation; see COPYING for details.
+"""
+
+import os
+import time
+import logging
+import selectors
+import threading
+from array import array
+
+
+class SamplerSource(object):
+    """Base class of the sources sampled by a Sampler
+
+    The parse function converts the raw data of one sample into a sequence
+    of integers, or None when there's nothing to record. The values of all
+    the samples are stored in a single flat array, "width" values per
+    sample, along with the wall clock timestamps of the samples and their
+    jitter - how late they were taken in seconds.
+    """
+    def __init__(self, parse):
+        self._parse = parse
+
+        self.width = None
+        self.values = array("q")
+        self.timestamps = array("d")
+        self.jitter = array("d")
+
+    def __len__(self):
+        return len(self.timestamps)
+
+    def _record(self, raw, timestamp, jitter):
+        values = self._parse(raw)
+        if values is None:
+            return
+
+        if self.width is None:
+            self.width = len(values)
+        elif len(values) != self.width:
+            raise ValueError("Sample width changed from {} to {}".format(
+                self.width, len(values)))
+
+        self.values.extend(values)
+        self.timestamps.append(timestamp)
+        self.jitter.append(jitter)
+
+    def sample(self, index):
+        """Returns the values of the sample at index as a list"""
+        return self.values[index * self.width:(index + 1) * self.width].tolist()
+
+    def series(self, column):
+        """Returns the values of one column of all the samples as an array"""
+        return self.values[column::self.width]
+
+
+class FileSource(SamplerSource):
+    """Reads the whole file on every tick of the sampler
+
+    The file is kept open and read again from the start, which works for
+    the procfs and sysfs files.
+    """
+    def __init__(self, path, parse):
+        super(FileSource, self).__init__(parse)
+        self.path = path
+        self._file = None
+
+    def open(self):
+        self._file = open(self.path, "r")
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def read(self, timestamp, jitter):
+        self._file.seek(0)
+        self._record(self._file.read(), timestamp, jitter)
+
+
+class LineSource(SamplerSource):
+    """Parses the lines of a stream as they come, e.g. the stdout of a
+    process printing its own periodic reports
+
+    The lines are timestamped when they're received, their jitter is
+    always 0.
+    """
+    def __init__(self, stream, parse, encoding="utf-8"):
+        super(LineSource, self).__init__(parse)
+        self._fd = stream if isinstance(stream, int) else stream.fileno()
+        self._encoding = encoding
+        self._partial = b""
+        self.eof = False
+
+    def fileno(self):
+        return self._fd
+
+    def read(self, timestamp):
+        try:
+            data = os.read(self._fd, 65536)
+        except OSError:
+            data = b""
+
+        if not data:
+            self.eof = True
+            lines = [self._partial] if self._partial else []
+            self._partial = b""
+        else:
+            lines = (self._partial + data).split(b"\n")
+            self._partial = lines.pop()
+
+        for line in lines:
+            self._record(line.decode(self._encoding, errors="replace"),
+                         timestamp, 0.0)
+
+
+class Sampler(object):
+    """
+    Samples all its sources in a single loop.
+
+    The FileSource sources are read on a ticker aligned to absolute
+    deadlines - start + n * interval of the monotonic clock - so the time
+    spent reading doesn't accumulate into drift. A tick that is missed
+    completely is skipped, the lateness of the taken samples is recorded
+    as their jitter. The LineSource streams are polled in between the
+    ticks.
+
+    With count set the sampling ends after the tick number count - 1, so
+    e.g. count = duration + 1 with a 1 second interval covers duration
+    seconds. Otherwise it runs until stop() is called or, without any
+    file sources, until all the streams are closed.
+
+    run() samples in the calling thread, start() in a separate one.
+    """
+    def __init__(self, interval=1.0, count=None):
+        self._interval = interval
+        self._count = count
+
+        self._file_sources = []
+        self._line_sources = []
+
+        self._stopped = threading.Event()
+        self._thread = None
+        self._error = None
+
+        self.start_time = None
+
+    def add_source(self, source):
+        if isinstance(source, LineSource):
+            self._line_sources.append(source)
+        else:
+            self._file_sources.append(source)
+        return source
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run_thread, daemon=True)
+        self._thread.start()
+
+    def _run_thread(self):
+        try:
+            self.run()
+        except Exception as e:
+            self._error = e
+
+    def stop(self):
+        self._stopped.set()
+
+    def join(self, timeout=None):
+        """Waits for the sampling thread, re-raises an exception it failed
+        with"""
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+        if self._error is not None:
+            raise self._error
+
+    def run(self):
+        selector = selectors.DefaultSelector()
+        for source in self._line_sources:
+            selector.register(source, selectors.EVENT_READ)
+
+        try:
+            for source in self._file_sources:
+                source.open()
+
+            self._loop(selector)
+        finally:
+            for source in self._file_sources:
+                source.close()
+            selector.close()
+
+    def _loop(self, selector):
+        start = time.monotonic()
+        wall_offset = time.time() - start
+        self.start_time = start + wall_offset
+
+        tick = 0
+        while not self._stopped.is_set():
+            if self._count is not None and tick >= self._count:
+                break
+
+            if not self._file_sources and not selector.get_map():
+                break
+
+            deadline = start + tick * self._interval
+            now = time.monotonic()
+            if now >= deadline and self._file_sources:
+                for source in self._file_sources:
+                    now = time.monotonic()
+                    source.read(now + wall_offset, now - deadline)
+
+                tick += 1
+                due_tick = int((time.monotonic() - start) / self._interval)
+                if due_tick > tick:
+                    logging.debug("Sampler skipped {} ticks".format(
+                        due_tick - tick))
+                    tick = due_tick
+                continue
+
+            timeout = self._interval
+            if self._file_sources:
+                timeout = deadline - now
+
+            if not selector.get_map():
+                self._stopped.wait(timeout)
+                continue
+
+            for key, _ in selector.select(timeout):
+                source = key.fileobj
+                source.read(time.monotonic() + wall_offset)
+                if source.eof:
+                    selector.unregister(source)
@@ -17,6 +17,7 @@ olichtne@redhat.com (Ondrej Lichtner)
 
 import os
 import pickle
+import struct
 import hashlib
 import hmac
 from lnst.Common.Utils import not_imported
@@ -72,9 +73,91 @@ SRP_GROUP["p_size"] = bit_length(SRP_GROUP["p"])//8
 if bit_length(SRP_GROUP["p"])%8:
     SRP_GROUP["p_size"] += 1
 
+# Wire format versions, negotiated during the hello exchange of the handshake.
+#
+# Version 1 pickles the message, then pickles it again together with its MAC
+# signature and once more together with the IV when encrypted. Every frame is
+# prefixed by its length as an ASCII number.
+#
+# Version 2 uses a fixed binary frame header:
+#     magic (2B) | version (1B) | flags (1B) | body length (8B)
+# followed by the body, which is the payload (or the IV and the encrypted
+# payload) and an optional HMAC-SHA256 computed over the sequence number, the
+# header and the rest of the body (encrypt-then-MAC). The payload is:
+#     buffer count N (4B) | pickle length (8B) | N * buffer length (8B) |
+#     pickle (protocol 5) | N * out-of-band buffer
+# Large bytes objects are carried as out-of-band pickle buffers and are not
+# copied into the pickle.
+WIRE_VERSIONS = (1, 2)
+
+FRAME_MAGIC = b"LN"
+FRAME_HEADER = struct.Struct("!2sBBQ")
+FRAME_FLAG_MAC = 0x1
+FRAME_FLAG_ENC = 0x2
+FRAME_MAC_SIZE = hashlib.sha256().digest_size
+# a body length above this is a corrupted or hostile header, it's not
+# allocated
+FRAME_MAX_BODY_SIZE = 1 << 30
+
+OUT_OF_BAND_THRESHOLD = 64 * 1024
+IOV_MAX = 1024
+
 class SecSocketException(LnstError):
     pass
 
+class _OutOfBandBytes(object):
+    """Pickles the wrapped bytes object as an out-of-band buffer"""
+    __slots__ = ("data",)
+
+    def __init__(self, data):
+        self.data = data
+
+    def __reduce_ex__(self, protocol):
+        return bytes, (pickle.PickleBuffer(self.data),)
+
+def _mark_out_of_band(obj):
+    # only the exact built-in containers are rebuilt, subclasses such as
+    # namedtuples or OrderedDicts are pickled as they are
+    obj_type = type(obj)
+    if obj_type is bytes:
+        if len(obj) >= OUT_OF_BAND_THRESHOLD:
+            return _OutOfBandBytes(obj)
+        return obj
+    elif obj_type is dict:
+        return {key: _mark_out_of_band(value) for key, value in obj.items()}
+    elif obj_type is list:
+        return [_mark_out_of_band(value) for value in obj]
+    elif obj_type is tuple:
+        return tuple(_mark_out_of_band(value) for value in obj)
+    else:
+        return obj
+
+def encode_payload(msg):
+    """Serializes msg into a list of buffers forming a version 2 payload"""
+    buffers = []
+    pickled = pickle.dumps(_mark_out_of_band(msg), protocol=5,
+                           buffer_callback=buffers.append)
+    raw_buffers = [buf.raw() for buf in buffers]
+    layout = struct.pack("!IQ%dQ" % len(raw_buffers), len(raw_buffers),
+                         len(pickled), *[len(buf) for buf in raw_buffers])
+    return [layout, pickled] + raw_buffers
+
+def decode_payload(payload):
+    payload = memoryview(payload)
+    buf_count, pickle_len = struct.unpack_from("!IQ", payload)
+    offset = struct.calcsize("!IQ")
+    buf_lens = struct.unpack_from("!%dQ" % buf_count, payload, offset)
+    offset += 8 * buf_count
+
+    pickled = payload[offset:offset + pickle_len]
+    offset += pickle_len
+
+    buffers = []
+    for buf_len in buf_lens:
+        buffers.append(payload[offset:offset + buf_len])
+        offset += buf_len
+    return pickle.loads(pickled, buffers=buffers)
+
 cryptography = not_imported
 hashes = not_imported
 Cipher = not_imported
@@ -150,17 +233,177 @@ class SecureSocket(object):
                                 "mac_key": None,
                                 "seq_num": 0}
 
+        self._wire_version = 1
+
+    @property
+    def wire_version(self):
+        return self._wire_version
+
+    def _set_wire_version(self, version):
+        if version not in WIRE_VERSIONS:
+            raise SecSocketException("Unsupported wire format version {}"
+                                     .format(version))
+        self._wire_version = version
+
     def send_msg(self, msg):
+        if self._wire_version == 2:
+            return self._send_frame(encode_payload(msg))
+
         pickled_msg = pickle.dumps(msg)
         return self.send(pickled_msg)
 
     def recv_msg(self):
+        if self._wire_version == 2:
+            return self._recv_frame()
+
         pickled_msg = self.recv()
         if pickled_msg == b"":
             raise SecSocketException("Disconnected")
         msg = pickle.loads(pickled_msg)
         return msg
 
+    def _frame_mac(self, spec, header, parts):
+        mac = hmac.new(spec["mac_key"], struct.pack("!Q", spec["seq_num"]),
+                       hashlib.sha256)
+        mac.update(header)
+        for part in parts:
+            mac.update(part)
+        return mac.digest()
+
+    def _encrypt_parts(self, parts):
+        cryptography_imports()
+
+        block_size = algorithms.AES.block_size//8
+        iv = os.urandom(block_size)
+        cipher = Cipher(algorithms.AES(self._current_write_spec["enc_key"]),
+                        modes.CBC(iv), default_backend())
+        encryptor = cipher.encryptor()
+
+        length = sum(len(part) for part in parts)
+        pad_length = block_size - (length % block_size)
+
+        encrypted = [iv]
+        for part in parts:
+            encrypted.append(encryptor.update(part))
+        encrypted.append(encryptor.update(bytes([pad_length]) * pad_length))
+        encrypted.append(encryptor.finalize())
+        return encrypted
+
+    def _decrypt_body(self, body):
+        cryptography_imports()
+
+        block_size = algorithms.AES.block_size//8
+        iv = bytes(body[:block_size])
+        cipher = Cipher(algorithms.AES(self._current_read_spec["enc_key"]),
+                        modes.CBC(iv), default_backend())
+        decryptor = cipher.decryptor()
+        data = decryptor.update(body[block_size:]) + decryptor.finalize()
+
+        pad_length = data[-1]
+        if (pad_length == 0 or pad_length > block_size or
+                data[-pad_length:] != bytes([pad_length]) * pad_length):
+            return None
+        return memoryview(data)[:-pad_length]
+
+    def _send_frame(self, parts):
+        spec = self._current_write_spec
+        flags = 0
+        if spec["enc_key"]:
+            parts = self._encrypt_parts(parts)
+            flags |= FRAME_FLAG_ENC
+
+        body_len = sum(len(part) for part in parts)
+        if spec["mac_key"]:
+            flags |= FRAME_FLAG_MAC
+            body_len += FRAME_MAC_SIZE
+
+        if body_len > FRAME_MAX_BODY_SIZE:
+            raise SecSocketException("Message too large to send ({} bytes)"
+                                     .format(body_len))
+
+        header = FRAME_HEADER.pack(FRAME_MAGIC, 2, flags, body_len)
+        if spec["mac_key"]:
+            parts.append(self._frame_mac(spec, header, parts))
+
+        spec["seq_num"] += 1
+        return self._sendall_parts([header] + parts)
+
+    def _sendall_parts(self, parts):
+        if sum(len(part) for part in parts) < OUT_OF_BAND_THRESHOLD:
+            # copying small frames is cheaper than scatter-gather bookkeeping
+            return self._socket.sendall(b"".join(parts))
+
+        views = [memoryview(part) for part in parts if len(part)]
+        while views:
+            sent = self._socket.sendmsg(views[:IOV_MAX])
+            while sent:
+                if sent >= len(views[0]):
+                    sent -= len(views[0])
+                    views.pop(0)
+                else:
+                    views[0] = views[0][sent:]
+                    sent = 0
+
+    def _recv_exact(self, length):
+        buf = bytearray(length)
+        view = memoryview(buf)
+        received = 0
+        while received < length:
+            n = self._socket.recv_into(view[received:])
+            if n == 0:
+                return None
+            received += n
+        return buf
+
+    def _recv_frame(self):
+        while True:
+            header = self._recv_exact(FRAME_HEADER.size)
+            if header is None:
+                raise SecSocketException("Disconnected")
+
+            magic, version, flags, body_len = FRAME_HEADER.unpack(header)
+            if magic != FRAME_MAGIC or version != 2:
+                raise SecSocketException("Invalid frame received")
+            if body_len > FRAME_MAX_BODY_SIZE:
+                raise SecSocketException("Invalid frame length {} received"
+                                         .format(body_len))
+
+            body = self._recv_exact(body_len)
+            if body is None:
+                raise SecSocketException("Disconnected")
+
+            msg = self._unprotect_frame(header, flags, memoryview(body))
+            if msg is None:
+                # same as for version 1, frames failing the integrity
+                # checks are dropped
+                continue
+
+            if isinstance(msg, dict) and msg.get("type") == "change_cipher_spec":
+                self._change_read_cipher_spec()
+                continue
+            return msg
+
+    def _unprotect_frame(self, header, flags, body):
+        spec = self._current_read_spec
+        if bool(spec["mac_key"]) != bool(flags & FRAME_FLAG_MAC) or \
+           bool(spec["enc_key"]) != bool(flags & FRAME_FLAG_ENC):
+            return None
+
+        if spec["mac_key"]:
+            signature = body[-FRAME_MAC_SIZE:]
+            body = body[:-FRAME_MAC_SIZE]
+            if not hmac.compare_digest(self._frame_mac(spec, header, [body]),
+                                       signature):
+                return None
+
+        if spec["enc_key"]:
+            body = self._decrypt_body(body)
+            if body is None:
+                return None
+
+        spec["seq_num"] += 1
+        return decode_payload(body)
+
     def _add_mac_sign(self, data):
         if not self._current_write_spec["mac_key"]:
             return data
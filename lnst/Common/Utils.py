@@ -131,16 +131,29 @@ def md5sum(file_path, block_size=2**20):
 
     return md5.hexdigest()
 
-def sha256sum(file_path):
+def sha256sum(file_path, length=None):
+    return sha256sum_prefix(file_path, length)[1]
+
+def sha256sum_prefix(file_path, length=None):
+    """Hashes the first length bytes of a file, or the whole file if None
+
+    Returns a (hashed_length, hexdigest) tuple, hashed_length is smaller than
+    length if the file is shorter.
+    """
     sha256 = hashlib.sha256()
+    hashed = 0
     with open(file_path, "rb") as f:
-        while True:
-            data = f.read(1024)
+        while length is None or hashed < length:
+            read_size = 1024*1024
+            if length is not None:
+                read_size = min(read_size, length - hashed)
+            data = f.read(read_size)
             if not data:
                 break
             sha256.update(data)
+            hashed += len(data)
 
-    return sha256.hexdigest()
+    return hashed, sha256.hexdigest()
 
 def create_tar_archive(input_path, target_path, compression=False):
     if compression:
@@ -379,3 +392,22 @@ def wait_for_condition(condition: Callable[[], bool], timeout: int):
         if attempts == timeout:
             raise TimeoutError(f"Timeout while waiting for condition")
         time.sleep(1)
+
+def concurrency_safe(func):
+    """
+    Decorator marking an Agent RPC method (or a Device method called through
+    dev_method) as safe to run in a worker thread, concurrently with other
+    such calls and with the processing of the Agent event loop (netlink
+    messages, job and network namespace messages).
+
+    Only mark methods that don't modify the state of the Agent, the
+    InterfaceManager or the Device objects, e.g. methods only running
+    external commands or reading files. All other methods are executed in
+    the event loop in the order they were received.
+    """
+    func.concurrency_safe = True
+    return func
+
+
+def is_concurrency_safe(method):
+    return getattr(method, "concurrency_safe", False)
@@ -13,6 +13,7 @@ import sys
 from typing import Union
 import datetime
 import logging
+import traceback
 from lnst.Common.Logs import LoggingCtl, log_exc_traceback
 from lnst.Common.NetUtils import MacPool
 from lnst.Common.Utils import mkdir_p
@@ -191,11 +192,17 @@ class Controller(object):
             machine = self._machines[m_id] = pool[m["target"]]
 
             setattr(self._hosts, m_id, Host(machine))
-            host = getattr(self._hosts, m_id)
 
             machine.set_id(m_id)
             machine.set_mapped(True)
-            self._prepare_machine(machine)
+            self._setup_machine(machine)
+
+        self._run_on_machines("prepare",
+                              {m_id: machine.prepare_machine_task()
+                               for m_id, machine in self._machines.items()})
+
+        for m_id, m in list(match["machines"].items()):
+            host = getattr(self._hosts, m_id)
 
             for if_id, i in list(m["interfaces"].items()):
                 host.map_device(if_id, i)
@@ -209,36 +216,65 @@ class Controller(object):
                     setattr(host, name, new_virt_dev)
                     new_virt_dev._enable()
 
-            machine.start_recipe(recipe)
+        self._run_on_machines("recipe start",
+                              {m_id: machine.start_recipe_task(recipe)
+                               for m_id, machine in self._machines.items()})
 
-    def _prepare_machine(self, machine):
+    def _setup_machine(self, machine):
         self._log_ctl.add_agent(machine.get_id())
         machine.set_mac_pool(self._mac_pool)
         machine.set_network_bridges(self._network_bridges)
 
+    def _prepare_machine(self, machine):
+        self._setup_machine(machine)
         machine.prepare_machine()
 
+    def _run_on_machines(self, phase, tasks, raise_errors=True):
+        _, errors = self._msg_dispatcher.run_tasks(tasks)
+
+        for m_id, exc in errors.items():
+            logging.error("Machine {} {} failed: {}".format(m_id, phase,
+                                                            repr(exc)))
+            logging.debug("".join(traceback.format_exception(
+                type(exc), exc, exc.__traceback__)))
+
+        if errors and raise_errors:
+            if len(errors) == 1:
+                raise list(errors.values())[0]
+            raise ControllerError(
+                "Machine {} failed on hosts: {}".format(
+                    phase, ", ".join(sorted(errors.keys()))
+                )
+            )
+        return errors
+
     def _cleanup_agents(self):
         if self._machines == None:
             return
 
-        for m_id, machine in list(self._machines.items()):
-            try:
-                machine.cleanup()
-            except:
-                #TODO report errors during deconfiguration as FAIL!!
-                log_exc_traceback()
-            finally:
-                machine.stop_recipe()
-                for dev in list(machine._device_database.values()):
-                    if isinstance(dev, VirtualDevice):
-                        dev._destroy()
-
-                #clean-up agent logger
-                self._log_ctl.remove_agent(m_id)
-                machine.set_mapped(False)
-
-        self._machines.clear()
+        try:
+            #TODO report errors during deconfiguration as FAIL!!
+            self._run_on_machines("cleanup",
+                                  {m_id: machine.cleanup_task()
+                                   for m_id, machine in self._machines.items()},
+                                  raise_errors=False)
+        except:
+            log_exc_traceback()
+        finally:
+            for m_id, machine in list(self._machines.items()):
+                try:
+                    machine.stop_recipe()
+                    for dev in list(machine._device_database.values()):
+                        if isinstance(dev, VirtualDevice):
+                            dev._destroy()
+                except:
+                    log_exc_traceback()
+                finally:
+                    #clean-up agent logger
+                    self._log_ctl.remove_agent(m_id)
+                    machine.set_mapped(False)
+
+            self._machines.clear()
 
         # remove dynamically created bridges
         for bridge in list(self._network_bridges.values()):
@@ -15,7 +15,7 @@ import os
 import hashlib
 import logging
 from lnst.Common.SecureSocket import SecureSocket
-from lnst.Common.SecureSocket import DH_GROUP, SRP_GROUP
+from lnst.Common.SecureSocket import DH_GROUP, SRP_GROUP, WIRE_VERSIONS
 from lnst.Common.SecureSocket import SecSocketException
 from lnst.Common.Utils import not_imported
 
@@ -58,7 +58,8 @@ class CtlSecSocket(SecureSocket):
         self._ctl_random = os.urandom(28)
 
         ctl_hello = {"type": "ctl_hello",
-                     "ctl_random": self._ctl_random}
+                     "ctl_random": self._ctl_random,
+                     "wire_versions": WIRE_VERSIONS}
         self.send_msg(ctl_hello)
         agent_hello = self.recv_msg()
 
@@ -66,6 +67,8 @@ class CtlSecSocket(SecureSocket):
             raise SecSocketException("Handshake failed.")
 
         self._agent_random = agent_hello["agent_random"]
+        # agents not supporting the negotiation only know version 1
+        self._set_wire_version(agent_hello.get("wire_version", 1))
 
         if sec_params["auth_type"] == "none":
             logging.warning("===================================")
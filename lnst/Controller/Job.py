@@ -19,6 +19,43 @@ from lnst.Controller.RecipeResults import ResultLevel, ResultType
 
 DEFAULT_TIMEOUT = 60
 
+class CommandBatch(object):
+    """A list of commands executed by a single Job
+
+    Created by Namespace.run_batch. Every command is either a shell command
+    string or a (path, value) tuple that writes str(value) into the file at
+    path without running a shell.
+
+    parallel is the maximum number of commands executed at the same time,
+    the results are always in the order of the commands.
+    """
+    def __init__(self, commands, parallel=1):
+        self._commands = []
+        for command in commands:
+            if isinstance(command, str):
+                self._commands.append({"command": command})
+            elif isinstance(command, tuple) and len(command) == 2:
+                self._commands.append({"write": command[0],
+                                       "value": str(command[1])})
+            else:
+                raise JobError("Invalid batch command '%s'" % str(command))
+        self._parallel = max(1, int(parallel))
+
+    @property
+    def commands(self):
+        return self._commands
+
+    @property
+    def parallel(self):
+        return self._parallel
+
+    def __len__(self):
+        return len(self._commands)
+
+    def __repr__(self):
+        return "CommandBatch({} commands, parallel={})".format(
+            len(self._commands), self._parallel)
+
 class Job(object):
     """Tester facing Job API
 
@@ -72,6 +109,8 @@ class Job(object):
             return "module"
         elif isinstance(self.what, str):
             return "shell"
+        elif isinstance(self.what, CommandBatch):
+            return "batch"
         return "unknown"
 
     @property
@@ -88,7 +127,7 @@ class Job(object):
     def stdout(self):
         """standard output of the Job
 
-        Type: string
+        Type: string, a list of strings for command batches
         Only applicable for Jobs running a shell command
         """
         try:
@@ -100,7 +139,7 @@ class Job(object):
     def stderr(self):
         """standard error output of the Job
 
-        Type: string
+        Type: string, a list of strings for command batches
         Only applicable for Jobs running a shell command
         """
         try:
@@ -116,6 +155,8 @@ class Job(object):
             depends on the type of the job. For python modules it is whatever
             the module sets as the _res_data attribute.
             For shell commands it is a dictionary with stdout and stderr.
+            For command batches it is a dictionary of lists with an item
+            for every command: returncodes, stdout and stderr.
         """
         try:
             return self._res["res_data"]
@@ -176,8 +217,7 @@ class Job(object):
                 Default is DEFAULT_TIMEOUT.
                 Use zero to wait forever. Don't use for infinitelly running
                 jobs...
-                If non-zero LNST uses a timed SIGALARM signal to return from
-                this method.
+                Fractions of a second are supported.
         Returns:
             True if the Job finished, False if the Job is still running and
             the wait method just timed out.
@@ -216,6 +256,9 @@ class Job(object):
             d["command"] = self._what
         elif self.type == "module":
             d["module"] = self._what
+        elif self.type == "batch":
+            d["commands"] = self._what.commands
+            d["parallel"] = self._what.parallel
         else:
             raise JobError("Unknown Job type %s" % self.type)
         return d
@@ -11,10 +11,15 @@ __author__ = """
 rpazdera@redhat.com (Radek Pazdera)
 """
 
+import os
 import logging
 import socket
 import sys
-from lnst.Common.Utils import sha256sum
+import zlib
+import hashlib
+import tarfile
+import tempfile
+from lnst.Common.Utils import sha256sum, sha256sum_prefix
 from lnst.Common.Utils import check_process_running
 from lnst.Common.Version import lnst_version
 from lnst.Controller.Common import ControllerError
@@ -30,6 +35,21 @@ from lnst.Devices.LoopbackDevice import LoopbackDevice
 if check_process_running("libvirtd"):
     from lnst.Controller.VirtDomainCtl import VirtDomainCtl
 
+# number of file chunks that can be in flight to an agent at the same time
+COPY_WINDOW = 8
+COPY_CHUNK_SIZE = 1024*1024
+
+# sha256 digests of local files keyed by (path, mtime, size), the same module
+# files are synced to every machine and namespace
+_file_digests = {}
+
+def _file_digest(file_path):
+    st = os.stat(file_path)
+    key = (file_path, st.st_mtime_ns, st.st_size)
+    if key not in _file_digests:
+        _file_digests[key] = sha256sum(file_path)
+    return _file_digests[key]
+
 class MachineError(ControllerError):
     pass
 
@@ -85,6 +105,8 @@ class Machine(object):
 
         self._device_database = {}
         self._tmp_device_database = []
+        # {netns name: {module name: digest}} of modules loaded on the agent
+        self._loaded_modules = {}
         self._netns_moved_devices = {}
 
         self._initns = None
@@ -305,10 +327,44 @@ class Machine(object):
 
         return None
 
+    def get_rpc_stats(self, netns=None):
+        """Returns the per method RPC latency histograms of the Agent
+
+        Useful for diagnosing slow agents, see RpcDispatcher.get_stats.
+        """
+        return self.rpc_call("get_rpc_stats", netns=netns)
+
+    def get_device_timings(self, netns=None):
+        """Returns how long storing and restoring the original configuration
+        took for every device of the Agent
+
+        Useful for finding slow NIC drivers, see
+        DeviceStateManager.get_timings.
+        """
+        return self.rpc_call("get_device_timings", netns=netns)
+
     def rpc_call(self, method_name, *args, **kwargs):
+        return self.rpc_call_async(method_name, *args, **kwargs).result()
+
+    def rpc_call_async(self, method_name, *args, **kwargs):
+        """Sends the RPC call without waiting for its result
+
+        Returns a RpcFuture, the Agent processes the calls in the order they
+        were sent so any number of them can be in flight at the same time.
+        Only the calls marked as concurrency safe on the Agent may run in
+        parallel and finish out of order.
+        """
         if kwargs.get("netns") in self._namespaces.values():
             netns = kwargs["netns"]
             del kwargs["netns"]
+            if self._msg_dispatcher.has_netns_connection(self, netns.name):
+                msg = {"type": "command",
+                       "method_name": method_name,
+                       "args": args,
+                       "kwargs": kwargs}
+                return self._msg_dispatcher.send_message_async(
+                    self, msg, netns=netns.name)
+
             msg = {"type": "to_netns",
                    "netns": netns.name,
                    "data": {"type": "command",
@@ -323,7 +379,7 @@ class Machine(object):
                    "args": args,
                    "kwargs": kwargs}
 
-        return self._msg_dispatcher.send_message(self, msg)
+        return self._msg_dispatcher.send_message_async(self, msg)
 
     def init_connection(self, timeout=None):
         """ Initialize the agent connection
@@ -366,20 +422,38 @@ class Machine(object):
 
         self._agent_desc = agent_desc
 
+    def run_task(self, task):
+        """Runs a generator based task to completion
+
+        Tasks are generators yielding RpcFutures, they're resumed with the
+        result of the yielded future once it's available. This allows the
+        MessageDispatcher to drive the same task for several machines at the
+        same time, see MessageDispatcher.run_tasks.
+        """
+        return self._msg_dispatcher.run_task(task)
+
     def prepare_machine(self):
-        self.rpc_call("prepare_machine")
+        return self.run_task(self.prepare_machine_task())
+
+    def prepare_machine_task(self):
+        yield self.rpc_call_async("prepare_machine")
+        # the agent drops all dynamically loaded modules during preparation
+        self._loaded_modules = {}
         self._device_database = {self._initns: {}}
-        self._send_device_classes()
-        self.rpc_call("init_if_manager")
+        yield from self._send_device_classes_task()
+        yield self.rpc_call_async("init_if_manager")
 
-        devices = self.rpc_call("get_devices")
+        devices = yield self.rpc_call_async("get_devices")
         for ifindex, dev in list(devices.items()):
             self.device_created(dev)
 
     def start_recipe(self, recipe):
+        return self.run_task(self.start_recipe_task(recipe))
+
+    def start_recipe_task(self, recipe):
         self._recipe = recipe
         recipe_name = recipe.__class__.__name__
-        self.rpc_call("start_recipe", recipe_name)
+        yield self.rpc_call_async("start_recipe", recipe_name)
 
     def stop_recipe(self):
         self._recipe = None
@@ -388,32 +462,58 @@ class Machine(object):
         if self._recipe:
             self._recipe.current_run.add_result(result)
 
-    def _send_device_classes(self):
-        for cls_name, cls in device_classes:
-            self.send_class(cls)
+    def _send_device_classes_task(self):
+        yield from self.send_classes_task([cls for _, cls in device_classes])
 
-        for cls_name, cls in device_classes:
-            module_name = cls.__module__
-            self.rpc_call("map_device_class", cls_name, module_name)
+        map_calls = [self.rpc_call_async("map_device_class", cls_name,
+                                         cls.__module__)
+                     for cls_name, cls in device_classes]
+        for call in map_calls:
+            yield call
 
     def send_class(self, cls, netns=None):
-        classes = [cls]
-        classes.extend(self._get_base_classes(cls))
+        return self.run_task(self.send_class_task(cls, netns))
 
-        for cls in reversed(classes):
-            module_name = cls.__module__
+    def send_class_task(self, cls, netns=None):
+        yield from self.send_classes_task([cls], netns)
 
-            if module_name == "builtins":
-                continue
+    def send_classes_task(self, classes, netns=None):
+        """Makes the modules of the classes and their bases available
 
-            module = sys.modules[module_name]
-            filename = module.__file__
+        Modules already loaded in the namespace are skipped, the cached state
+        of the remaining module files is queried in a single call and all of
+        them are loaded with a single call.
+        """
+        modules = []
+        for cls in classes:
+            for base in reversed([cls] + self._get_base_classes(cls)):
+                module_name = base.__module__
+                if module_name == "builtins":
+                    continue
+
+                module = sys.modules[module_name]
+                filename = module.__file__
+
+                if filename[-3:] == "pyc":
+                    filename = filename[:-1]
+
+                if (module_name, filename) not in modules:
+                    modules.append((module_name, filename))
+
+        netns_name = netns.name if netns in self._namespaces.values() else None
+        loaded = self._loaded_modules.setdefault(netns_name, {})
+        modules = [(module_name, filename) for module_name, filename in modules
+                   if loaded.get(module_name) != _file_digest(filename)]
+        if not modules:
+            return
 
-            if filename[-3:] == "pyc":
-                filename = filename[:-1]
+        res_hashes = yield from self.sync_resources_task(modules, netns)
 
-            res_hash = self.sync_resource(module_name, filename, netns=netns)
-            self.rpc_call("load_cached_module", module_name, res_hash, netns=netns)
+        # modules are loaded in order, base classes first
+        to_load = [(module_name, res_hash)
+                   for (module_name, _), res_hash in zip(modules, res_hashes)]
+        yield self.rpc_call_async("load_cached_modules", to_load, netns=netns)
+        loaded.update(to_load)
 
     def is_git_version(self, version):
         try:
@@ -423,15 +523,19 @@ class Machine(object):
             return True
 
     def cleanup_devices(self):
+        return self.run_task(self.cleanup_devices_task())
+
+    def cleanup_devices_task(self):
         for netns in self._namespaces.values():
             self._set_readonly_cache_for_all_devices(netns)
 
         self._set_readonly_cache_for_all_devices(self._initns)
 
-        for netns in self._namespaces.values():
-            self.rpc_call("destroy_devices", netns=netns)
-
-        self.rpc_call("destroy_devices")
+        calls = [self.rpc_call_async("destroy_devices", netns=netns)
+                 for netns in self._namespaces.values()]
+        calls.append(self.rpc_call_async("destroy_devices"))
+        for call in calls:
+            yield call
 
     def _set_readonly_cache_for_device(self, ifindex, netns):
         try:
@@ -457,24 +561,29 @@ class Machine(object):
             all the interfaces that have been configured on the machine,
             and finalize and close the rpc connection to the machine.
         """
+        return self.run_task(self.cleanup_task())
+
+    def cleanup_task(self):
         # connection to the agent was closed
         if not self._msg_dispatcher.get_connection(self):
             return
 
         try:
-            for netns in self._namespaces.values():
-                self.rpc_call("kill_jobs", netns=netns)
-            self.rpc_call("kill_jobs")
-
-            self.restore_system_config()
-            self.cleanup_devices()
-            self.del_namespaces()
-            self.rpc_call("bye")
+            calls = [self.rpc_call_async("kill_jobs", netns=netns)
+                     for netns in self._namespaces.values()]
+            calls.append(self.rpc_call_async("kill_jobs"))
+            for call in calls:
+                yield call
+
+            yield from self.restore_system_config_task()
+            yield from self.cleanup_devices_task()
+            yield from self.del_namespaces_task()
+            yield self.rpc_call_async("bye")
         except:
             # cleanup is only meaningful on dynamic interfaces, and should
             # always be called when deconfiguration happens- especially
             # when something on the agent breaks during deconfiguration
-            self.cleanup_devices()
+            yield from self.cleanup_devices_task()
             raise
 
     def _get_base_classes(self, cls):
@@ -578,9 +687,15 @@ class Machine(object):
         self._mac_pool = mac_pool
 
     def restore_system_config(self):
-        self.rpc_call("restore_system_config")
+        return self.run_task(self.restore_system_config_task())
+
+    def restore_system_config_task(self):
+        calls = [self.rpc_call_async("restore_system_config")]
         for netns in self._namespaces.values():
-            self.rpc_call("restore_system_config", netns=netns)
+            calls.append(self.rpc_call_async("restore_system_config",
+                                             netns=netns))
+        for call in calls:
+            yield call
         return True
 
     def set_network_bridges(self, bridges):
@@ -616,53 +731,195 @@ class Machine(object):
         for netns in namespaces:
             self.rpc_call("stop_packet_capture", netns=netns)
 
-    def copy_file_to_machine(self, local_path, remote_path=None, netns=None):
-        remote_path = self.rpc_call("start_copy_to", remote_path, netns=netns)
-
-        f = open(local_path, "rb")
+    def copy_file_to_machine(self, local_path, remote_path=None, netns=None,
+                             compress=False, resume=False):
+        return self.run_task(self.copy_file_to_machine_task(
+            local_path, remote_path, netns, compress, resume
+        ))
+
+    def copy_file_to_machine_task(self, local_path, remote_path=None,
+                                  netns=None, compress=False, resume=False):
+        """Streams a local file to the agent
+
+        Up to COPY_WINDOW chunks are in flight at the same time, the transfer
+        is verified by comparing the sha256 digest of the sent data with the
+        data written by the agent.
+
+        :param compress:
+            compress the chunks with zlib, worth it for text files
+        :param resume:
+            if remote_path already holds a prefix of the local file only the
+            rest is transferred
+        """
+        offset = 0
+        if resume and remote_path is not None:
+            remote = yield self.rpc_call_async("get_file_digest", remote_path,
+                                               netns=netns)
+            if remote is not None and remote[0] > 0:
+                local = sha256sum_prefix(local_path, remote[0])
+                if local == tuple(remote):
+                    offset = remote[0]
+
+        remote_path = yield self.rpc_call_async("start_copy_to", remote_path,
+                                                offset, netns=netns)
+        if offset:
+            logging.debug("Resuming transfer of {} to machine {} at byte {}"
+                          .format(local_path, self.get_id(), offset))
+
+        digest = hashlib.sha256()
+        with open(local_path, "rb") as f:
+            f.seek(offset)
+            in_flight = []
+            while True:
+                data: bytes = f.read(COPY_CHUNK_SIZE)
+                if not data:
+                    break
+                digest.update(data)
+
+                if compress:
+                    data = zlib.compress(data, 1)
+                in_flight.append(self.rpc_call_async("copy_part_to",
+                                                     remote_path, data,
+                                                     compress, netns=netns))
+                if len(in_flight) >= COPY_WINDOW:
+                    yield in_flight.pop(0)
+
+        for call in in_flight:
+            yield call
+
+        if not (yield self.rpc_call_async("finish_copy_to", remote_path,
+                                          digest.hexdigest(), netns=netns)):
+            raise MachineError("Digest mismatch after transferring {} to {} "
+                               "on machine {}".format(local_path, remote_path,
+                                                      self.get_id()))
 
-        while True:
-            data: bytes = f.read(1024*1024) # 1MB buffer
-            if not data:
-                break
+        return remote_path
 
-            self.rpc_call("copy_part_to", remote_path, data, netns=netns)
+    def copy_file_from_machine(self, remote_path, local_path, netns=None,
+                               compress=False, resume=False):
+        return self.run_task(self.copy_file_from_machine_task(
+            remote_path, local_path, netns, compress, resume
+        ))
 
-        self.rpc_call("finish_copy_to", remote_path, netns=netns)
+    def copy_file_from_machine_task(self, remote_path, local_path, netns=None,
+                                    compress=False, resume=False):
+        """Streams a file from the agent to a local path
 
-        return remote_path
-
-    def copy_file_from_machine(self, remote_path, local_path):
-        status = self.rpc_call("start_copy_from", remote_path)
+        Works the same way as copy_file_to_machine_task, the agent serves
+        chunk requests in order so COPY_WINDOW of them are kept in flight.
+        """
+        offset = 0
+        if resume and os.path.isfile(local_path):
+            local = sha256sum_prefix(local_path)
+            if local[0] > 0:
+                remote = yield self.rpc_call_async("get_file_digest",
+                                                   remote_path, local[0],
+                                                   netns=netns)
+                if remote is not None and tuple(remote) == local:
+                    offset = local[0]
+
+        status = yield self.rpc_call_async("start_copy_from", remote_path,
+                                           offset, netns=netns)
         if not status:
             raise MachineError("The requested file cannot be transfered." \
                        "It does not exist on machine %s" % self.get_id())
+        if offset:
+            logging.debug("Resuming transfer of {} from machine {} at byte {}"
+                          .format(remote_path, self.get_id(), offset))
+
+        digest = hashlib.sha256()
+        with open(local_path, "r+b" if offset else "wb") as local_file:
+            local_file.truncate(offset)
+            local_file.seek(offset)
+
+            in_flight = []
+            eof = False
+            while not eof or in_flight:
+                while not eof and len(in_flight) < COPY_WINDOW:
+                    in_flight.append(self.rpc_call_async("copy_part_from",
+                                                         remote_path,
+                                                         COPY_CHUNK_SIZE,
+                                                         compress,
+                                                         netns=netns))
+
+                data: bytes = yield in_flight.pop(0)
+                if compress:
+                    data = zlib.decompress(data)
+                if not data:
+                    # the remaining requests in flight return empty chunks
+                    eof = True
+                    continue
+                local_file.write(data)
+                digest.update(data)
+
+        remote_digest = yield self.rpc_call_async("finish_copy_from",
+                                                  remote_path, netns=netns)
+        if remote_digest != digest.hexdigest():
+            raise MachineError("Digest mismatch after transferring {} from "
+                               "machine {}".format(remote_path, self.get_id()))
 
-        local_file = open(local_path, "wb")
-
-        buf_size = 1024*1024 # 1MB buffer
-        while True:
-            data: bytes = self.rpc_call("copy_part_from", remote_path, buf_size)
-            if not data:
-                break
-            local_file.write(data)
+    def sync_resource(self, res_name, file_path, netns=None):
+        return self.run_task(self.sync_resource_task(res_name, file_path,
+                                                     netns))
 
-        local_file.close()
-        self.rpc_call("finish_copy_from", remote_path)
+    def sync_resource_task(self, res_name, file_path, netns=None):
+        digests = yield from self.sync_resources_task([(res_name, file_path)],
+                                                      netns)
+        return digests[0]
 
-    def sync_resource(self, res_name, file_path, netns=None):
-        digest = sha256sum(file_path)
+    def sync_resources_task(self, resources, netns=None):
+        """Transfers the (res_name, file_path) resources missing in the cache
 
-        if not self.rpc_call("has_resource", digest, netns=netns):
+        Multiple missing resources are sent as a single archive. Returns the
+        list of digests of the resources.
+        """
+        digests = [_file_digest(file_path) for _, file_path in resources]
+        cached = yield self.rpc_call_async("has_resources", digests,
+                                           netns=netns)
+
+        # the cached resources of this sync mustn't be evicted to make room
+        # for the missing ones, they're loaded afterwards
+        keep = [digest for digest in digests if cached[digest]]
+        missing = {}
+        for (res_name, file_path), digest in zip(resources, digests):
+            # the same file can be requested under multiple names
+            if not cached[digest] and digest not in missing:
+                missing[digest] = (res_name, file_path)
+
+        if len(missing) == 1:
+            res_name, file_path = list(missing.values())[0]
             msg = "Transfering %s to machine %s as '%s'" % (file_path,
                                                             self.get_id(),
                                                             res_name)
             logging.debug(msg)
 
-            remote_path = self.copy_file_to_machine(file_path, netns=netns)
-            self.rpc_call("add_resource_to_cache",
-                           "file", remote_path, res_name, netns=netns)
-        return digest
+            remote_path = yield from self.copy_file_to_machine_task(
+                file_path, netns=netns
+            )
+            yield self.rpc_call_async("add_resource_to_cache",
+                                      "file", remote_path, res_name,
+                                      keep=keep, netns=netns)
+        elif missing:
+            logging.debug("Transfering bundle of %d resources to machine %s" %
+                          (len(missing), self.get_id()))
+            yield from self._sync_resource_bundle_task(missing, keep, netns)
+        return digests
+
+    def _sync_resource_bundle_task(self, resources, keep=(), netns=None):
+        with tempfile.NamedTemporaryFile(suffix=".tar.gz") as bundle:
+            with tarfile.open(fileobj=bundle, mode="w:gz") as archive:
+                for digest, (res_name, file_path) in resources.items():
+                    archive.add(file_path, arcname=digest)
+            bundle.flush()
+
+            remote_path = yield from self.copy_file_to_machine_task(
+                bundle.name, netns=netns
+            )
+
+        names = {digest: res_name
+                 for digest, (res_name, _) in resources.items()}
+        yield self.rpc_call_async("add_resource_bundle_to_cache", remote_path,
+                                  names, keep=keep, netns=netns)
 
     def init_remote_class(self, cls, *args, **kwargs):
         module_name = cls.__module__
@@ -678,14 +935,41 @@ class Machine(object):
     def add_netns(self, netns):
         self._namespaces[netns.name] = netns
         self._device_database[netns] = {}
-        return self.rpc_call("add_namespace", netns.name)
+        if not netns.direct_connection:
+            return self.rpc_call("add_namespace", netns.name)
+
+        port = self.rpc_call("add_namespace", netns.name, direct=True)
+        if not isinstance(port, int) or isinstance(port, bool):
+            raise MachineError("Agent {} didn't provide a direct connection "
+                               "to network namespace {}".format(
+                                   self._id, netns.name))
+
+        logging.debug("Connecting directly to network namespace %s of "
+                      "machine %s", netns.name, self._id)
+        connection = CtlSecSocket(socket.create_connection((self._hostname,
+                                                            port)))
+        connection.handshake(self._security)
+        self._msg_dispatcher.add_netns_connection(self, netns.name,
+                                                  connection)
+        return True
 
     def del_netns(self, netns):
+        self._loaded_modules.pop(netns.name, None)
+        self._msg_dispatcher.remove_netns_connection(self, netns.name)
         return self.rpc_call("del_namespace", netns.name)
 
     def del_namespaces(self):
-        for netns in self._namespaces.values():
-            self.del_netns(netns)
+        return self.run_task(self.del_namespaces_task())
+
+    def del_namespaces_task(self):
+        for netns_name in self._namespaces:
+            self._msg_dispatcher.remove_netns_connection(self, netns_name)
+        calls = [self.rpc_call_async("del_namespace", netns.name)
+                 for netns in self._namespaces.values()]
+        for call in calls:
+            yield call
+        for netns_name in self._namespaces:
+            self._loaded_modules.pop(netns_name, None)
         self._namespaces = {}
         return True
 
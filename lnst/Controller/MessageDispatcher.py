@@ -16,7 +16,10 @@ olichtne@redhat.com (Ondrej Lichtner)
 
 import logging
 import copy
-import signal
+import time
+import itertools
+import threading
+from collections import OrderedDict
 from lnst.Common.ConnectionHandler import send_data
 from lnst.Common.ConnectionHandler import ConnectionHandler
 from lnst.Common.Parameters import Parameters
@@ -83,122 +86,404 @@ def remote_device_to_deviceref(obj):
     else:
         return obj
 
+# maximum time between checks of conditions that don't depend on messages
+# received from the agents
+POLL_INTERVAL = 0.1
+
 class ConnectionError(ControllerError):
     pass
 
 class WaitTimeoutError(ControllerError):
     pass
 
-def _timeout_handler(signum, frame):
-    msg = "Timeout expired"
-    raise WaitTimeoutError(msg)
+class RpcFuture(object):
+    """Handle to the result of an asynchronous RPC call to an Agent
+
+    Returned by MessageDispatcher.send_message_async. The result is matched
+    to the request by the request id carried in the command message, so any
+    number of these can be outstanding for a single Agent. Calling result()
+    pumps the MessageDispatcher until the matching result arrives.
+    """
+    def __init__(self, dispatcher, machine, request_id, netns=None):
+        self._dispatcher = dispatcher
+        self._machine = machine
+        self._request_id = request_id
+        self._netns = netns
+        self._done = False
+        self._result = None
+        self._raw_result = None
+        self._exception = None
+
+    @property
+    def machine(self):
+        return self._machine
+
+    @property
+    def request_id(self):
+        return self._request_id
+
+    def done(self):
+        return self._done
+
+    def result(self):
+        self._dispatcher.wait_for_future(self)
+
+        if self._exception is not None:
+            raise self._exception
+
+        with self._dispatcher.lock:
+            if self._raw_result is not None:
+                # translated lazily so that device updates received in the
+                # same batch of messages are already processed
+                self._result = deviceref_to_remote_device(self._machine,
+                                                          self._raw_result,
+                                                          self._netns)
+                self._raw_result = None
+        return self._result
+
+    def exception(self):
+        self._dispatcher.wait_for_future(self)
+        return self._exception
+
+    def _set_result(self, result):
+        with self._dispatcher.poll_condition:
+            self._raw_result = result
+            self._done = True
+            self._dispatcher.poll_condition.notify_all()
+
+    def _set_exception(self, exception):
+        with self._dispatcher.poll_condition:
+            self._exception = exception
+            self._done = True
+            self._dispatcher.poll_condition.notify_all()
+
+
+def wait_all(futures):
+    """Waits for all futures and returns their results in order
+
+    All futures are waited for even if some of them fail, the first
+    exception encountered is then re-raised.
+    """
+    results = []
+    first_exc = None
+    for future in futures:
+        exc = future.exception()
+        if exc is not None:
+            if first_exc is None:
+                first_exc = exc
+            results.append(None)
+        else:
+            results.append(future.result())
+
+    if first_exc is not None:
+        raise first_exc
+    return results
+
 
 class MessageDispatcher(ConnectionHandler):
     def __init__(self, log_ctl):
         super(MessageDispatcher, self).__init__()
         self._log_ctl = log_ctl
         self._machines = dict()
+        self._request_ids = itertools.count()
+        self._pending_requests = OrderedDict()
+        self._lock = threading.RLock()
+        self._poll_condition = threading.Condition(threading.Lock())
+        self._polling = False
+
+    @property
+    def lock(self):
+        return self._lock
+
+    @property
+    def poll_condition(self):
+        """Notified when a future is done or a thread stops polling"""
+        return self._poll_condition
+
+    def wait_for_future(self, future):
+        """Processes incoming messages until the future is done
+
+        Safe to call from multiple threads: only one of them polls the
+        connections at a time, the others wait until their future is done
+        or until the polling thread is done with a batch of messages and
+        one of them takes over. The poll timeout is bounded so that futures
+        completed by other means (e.g. disconnect_agent) are noticed.
+        """
+        while True:
+            with self._poll_condition:
+                while self._polling and not future.done():
+                    self._poll_condition.wait()
+                if future.done():
+                    return
+                self._polling = True
+
+            try:
+                self.handle_messages(timeout=POLL_INTERVAL)
+            finally:
+                with self._poll_condition:
+                    self._polling = False
+                    self._poll_condition.notify_all()
 
     def add_agent(self, machine, connection):
         self._machines[machine] = machine
         self.add_connection(machine, connection)
 
+    def add_netns_connection(self, machine, netns, connection):
+        """Adds a direct connection to a network namespace of machine
+
+        Messages received on it are processed as if they were received from
+        the machine itself, they carry the name of the namespace the same
+        way as the ones relayed by the agent of the init namespace.
+        """
+        self.add_connection((machine, netns), connection)
+
+    def has_netns_connection(self, machine, netns):
+        return (machine, netns) in self._connection_mapping
+
+    def remove_netns_connection(self, machine, netns):
+        soc = self.get_connection((machine, netns))
+        if soc is not None:
+            self.remove_connection(soc)
+            soc.close()
+
     def send_message(self, machine, data):
-        soc = self.get_connection(machine)
+        return self.send_message_async(machine, data).result()
+
+    def send_message_async(self, machine, data, netns=None):
+        """Sends data to machine, or to its network namespace netns over
+        the direct connection added by add_netns_connection"""
+        if netns is not None:
+            soc = self.get_connection((machine, netns))
+        else:
+            soc = self.get_connection(machine)
+            netns = data.get("netns", None)
         data = remote_device_to_deviceref(data)
 
+        request_id = next(self._request_ids)
+        if data["type"] == "to_netns":
+            data["data"]["request_id"] = request_id
+        else:
+            data["request_id"] = request_id
+
+        future = RpcFuture(self, machine, request_id, netns)
+        with self._lock:
+            self._pending_requests[request_id] = future
+
         if send_data(soc, data) == False:
+            with self._lock:
+                del self._pending_requests[request_id]
             msg = "Connection error from agent %s" % machine.get_id()
             raise ConnectionError(msg)
 
-        result = None
+        return future
+
+    def run_task(self, task):
+        results, errors = self.run_tasks({None: task})
+        if None in errors:
+            raise errors[None]
+        return results[None]
+
+    def run_tasks(self, tasks):
+        """Drives several generator based tasks at the same time
+
+        Every task is a generator yielding RpcFuture objects and gets resumed
+        with the result of the future (or has the exception of the future
+        thrown into it) once the future is done. While all tasks are waiting
+        for their futures the incoming messages are processed, so the round
+        trips of tasks talking to different agents overlap.
+
+        Returns a tuple of two dictionaries mapping the keys of the tasks
+        dictionary to the return values of the finished tasks and to the
+        exceptions raised by the failed tasks respectively. Errors coming
+        from an agent while the messages are processed (an unexpected
+        exception message, a hard disconnect) fail the tasks waiting for
+        that agent, the other tasks keep running.
+        """
+        results = {}
+        errors = {}
+        running = {task_id: None for task_id in tasks}
+
+        while running:
+            progressed = False
+            for task_id, future in list(running.items()):
+                if future is not None and not future.done():
+                    continue
+
+                progressed = True
+                task = tasks[task_id]
+                try:
+                    if future is None:
+                        future = next(task)
+                    elif future.exception() is not None:
+                        future = task.throw(future.exception())
+                    else:
+                        future = task.send(future.result())
+                except StopIteration as stop:
+                    results[task_id] = stop.value
+                    del running[task_id]
+                except Exception as exc:
+                    errors[task_id] = exc
+                    del running[task_id]
+                else:
+                    running[task_id] = future
+
+            if running and not progressed:
+                agent_errors = {}
+                self.handle_messages(errors=agent_errors)
+                for machine, exc in agent_errors.items():
+                    failed = [task_id for task_id, future in running.items()
+                              if future is not None and not future.done() and
+                              future.machine == machine]
+                    if not failed:
+                        logging.error("Error from agent {}: {}".format(
+                            machine.get_id(), repr(exc)))
+                    for task_id in failed:
+                        tasks[task_id].close()
+                        errors[task_id] = exc
+                        del running[task_id]
+
+        return results, errors
+
+    def pending_requests(self, machine=None):
+        with self._lock:
+            return [future for future in self._pending_requests.values()
+                    if machine is None or future.machine == machine]
+
+    def _pop_pending_request(self, machine, message):
+        with self._lock:
+            try:
+                request_id = message["request_id"]
+            except KeyError:
+                # agents without request id support answer in order
+                for future in self._pending_requests.values():
+                    if future.machine == machine:
+                        request_id = future.request_id
+                        break
+                else:
+                    return None
+
+            future = self._pending_requests.get(request_id, None)
+            if future is None:
+                return None
+
+            if future.machine != machine:
+                msg = ("Result for request {} received from agent '{}' "
+                       "instead of '{}'".format(request_id, machine.get_id(),
+                                                future.machine.get_id()))
+                raise ConnectionError(msg)
+
+            del self._pending_requests[request_id]
+            return future
+
+    def wait_for_condition(self, condition_check, timeout=0):
+        """Processes incoming messages until condition_check returns True
+
+        The condition is checked right away and then after every batch of
+        received messages, so conditions depending on messages from the
+        agents (e.g. a job finishing) are detected immediately. Conditions
+        depending on something else are polled every POLL_INTERVAL seconds.
+
+        timeout is in seconds and can be fractional, 0 means no timeout.
+        Returns False if the timeout expired before the condition passed.
+        """
+        return self.wait_for_conditions([condition_check], timeout)
+
+    def wait_for_conditions(self, conditions, timeout=0, wait_all=True):
+        """Waits until all (or any, if wait_all is False) conditions pass
+
+        Works the same way as wait_for_condition, conditions that already
+        passed aren't checked again.
+        """
+        deadline = None
+        if timeout:
+            deadline = time.monotonic() + timeout
+
+        remaining = list(conditions)
+        while True:
+            remaining = [condition for condition in remaining
+                         if not condition()]
+            if not remaining or (not wait_all and
+                                 len(remaining) < len(conditions)):
+                logging.debug("Condition passed")
+                return True
+
+            poll_timeout = POLL_INTERVAL
+            if deadline is not None:
+                poll_timeout = min(poll_timeout, deadline - time.monotonic())
+                if poll_timeout <= 0:
+                    logging.error("Waiting for condition timed out!")
+                    return False
+
+            self.handle_messages(timeout=poll_timeout)
+
+    def process_messages(self, duration):
+        """Processes incoming messages for the duration in seconds"""
+        deadline = time.monotonic() + duration
         while True:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return
+            self.handle_messages(timeout=remaining)
+
+    def handle_messages(self, timeout=None, errors=None):
+        """Waits for and processes the next batch of messages
+
+        timeout is the maximum time to wait for a message in seconds, None
+        means waiting until a message arrives. Can be called from multiple
+        threads, messages are processed by one of them at a time.
+
+        When errors is a dictionary, the exception raised by processing the
+        messages of an agent or by its hard disconnect is stored in it under
+        the agent instead of being raised and the remaining messages are
+        still processed.
+        """
+        with self._lock:
             connected_agents = list(self._connection_mapping.keys())
 
-            messages = self.check_connections()
+            messages = self.check_connections(timeout=timeout)
+
             for msg in messages:
-                if msg[1]["type"] == "result" and msg[0] == machine:
-                    if result is not None:
-                        msg = ("Multiple result messages from the same agent "
-                               "'{}'".format(machine.get_id()))
-                        raise ConnectionError(msg)
-                    result = msg[1]
-                else:
+                if isinstance(msg[0], tuple):
+                    # direct network namespace connection
+                    msg = (msg[0][0], msg[1])
+                try:
                     self._process_message(msg)
+                except Exception as exc:
+                    if errors is None:
+                        raise
+                    errors.setdefault(msg[0], exc)
 
             remaining_agents = list(self._connection_mapping.keys())
             if connected_agents != remaining_agents:
-                self._handle_disconnects(set(connected_agents)-
-                                         set(remaining_agents))
-
-            if result is not None:
-                netns = data.get("netns", None)
-                return deviceref_to_remote_device(machine, result["result"], netns)
-
-    def wait_for_condition(self, condition_check, timeout=0):
-        res = True
-        prev_handler = signal.signal(signal.SIGALRM, _timeout_handler)
-
-        def condition_wrapper():
-            res = condition_check()
-            if res:
-                signal.alarm(0)
-                signal.signal(signal.SIGALRM, prev_handler)
-                logging.debug("Condition passed, disabling timeout alarm")
-            return res
-
-        try:
-            signal.alarm(timeout)
-
-            wait = True
-            while wait:
-                connected_agents = list(self._connection_mapping.keys())
-                messages = self.check_connections(timeout=1)
-                for msg in messages:
-                    try:
-                        self._process_message(msg)
-                        wait = wait and not condition_wrapper()
-                    except WaitTimeoutError as exc:
-                        logging.error("Waiting for condition timed out!")
-                        res = False
-                        wait = False
-
-                wait = wait and not condition_wrapper()
-
-                remaining_agents = list(self._connection_mapping.keys())
-                if connected_agents != remaining_agents:
-                    self._handle_disconnects(set(connected_agents)-
-                                             set(remaining_agents))
-        except WaitTimeoutError as exc:
-            logging.error("Waiting for condition timed out!")
-            res = False
-        finally:
-            signal.alarm(0)
-            signal.signal(signal.SIGALRM, prev_handler)
-
-        return res
-
-    def handle_messages(self):
-        connected_agents = list(self._connection_mapping.keys())
-
-        messages = self.check_connections()
-
-        for msg in messages:
-            self._process_message(msg)
-
-        remaining_agents = list(self._connection_mapping.keys())
-        if connected_agents != remaining_agents:
-            self._handle_disconnects(set(connected_agents)-
-                                     set(remaining_agents))
+                disconnected = set(agent[0] if isinstance(agent, tuple)
+                                   else agent
+                                   for agent in set(connected_agents) -
+                                   set(remaining_agents))
+                try:
+                    self._handle_disconnects(disconnected)
+                except ConnectionError as exc:
+                    if errors is None:
+                        raise
+                    for agent in disconnected:
+                        if agent.get_mapped():
+                            errors.setdefault(agent, exc)
         return True
 
     def _process_message(self, message):
-        if message[1]["type"] == "log":
+        if message[1]["type"] == "log_batch":
+            self._log_ctl.add_client_logs(message[0].get_id(), message[1])
+        elif message[1]["type"] == "log":
+            # single records sent by older agents
             record = message[1]["record"]
             self._log_ctl.add_client_log(message[0].get_id(), record)
         elif message[1]["type"] == "result":
-            msg = "Received result message from different agent %s" % message[0].get_id()
-            logging.debug(msg)
+            future = self._pop_pending_request(message[0], message[1])
+            if future is None:
+                msg = ("Received unexpected result message from agent %s" %
+                       message[0].get_id())
+                logging.debug(msg)
+            else:
+                future._set_result(message[1]["result"])
         elif message[1]["type"] == "dev_created":
             machine = self._machines[message[0]]
             try:
@@ -221,7 +506,13 @@ class MessageDispatcher(ConnectionHandler):
                 netns = None
             machine.device_netns_change(message[1], netns)
         elif message[1]["type"] == "exception":
-            raise message[1]["Exception"]
+            future = None
+            if "request_id" in message[1]:
+                future = self._pop_pending_request(message[0], message[1])
+
+            if future is None:
+                raise message[1]["Exception"]
+            future._set_exception(message[1]["Exception"])
         elif message[1]["type"] == "job_finished":
             machine = self._machines[message[0]]
             machine.job_finished(message[1])
@@ -242,9 +533,29 @@ class MessageDispatcher(ConnectionHandler):
                                   for x in disconnected_agents]
             msg = "Agents " + str(list(disconnected_names)) + \
                   " hard-disconnected from the controller."
+            for agent in disconnected_agents:
+                self._fail_pending_requests(agent, ConnectionError(msg))
             raise ConnectionError(msg)
 
+    def _fail_pending_requests(self, machine, exception):
+        with self._lock:
+            failed = [(request_id, future) for request_id, future
+                      in self._pending_requests.items()
+                      if future.machine == machine]
+            for request_id, future in failed:
+                del self._pending_requests[request_id]
+
+        for request_id, future in failed:
+            future._set_exception(exception)
+
     def disconnect_agent(self, machine):
+        for key in list(self._connection_mapping.keys()):
+            if isinstance(key, tuple) and key[0] == machine:
+                self.remove_netns_connection(*key)
         soc = self.get_connection(machine)
         self.remove_connection(soc)
+        self._fail_pending_requests(
+            machine,
+            ConnectionError("Agent %s disconnected" % machine.get_id())
+        )
         del self._machines[machine]
@@ -22,7 +22,7 @@ from lnst.Devices.LoopbackDevice import LoopbackDevice
 from lnst.Devices.VirtualDevice import VirtualDevice
 from lnst.Devices.RemoteDevice import RemoteDevice
 from lnst.Controller.Common import ControllerError
-from lnst.Controller.Job import Job
+from lnst.Controller.Job import Job, CommandBatch
 from lnst.Controller.RecipeResults import ResultLevel
 from lnst.Common.conditions.WaitForConditionModule import WaitForConditionModule
 
@@ -89,12 +89,24 @@ class Namespace(object):
     def copy_file_to_machine(
         self,
         local_path: str,
-        remote_path: Optional[str] = None
+        remote_path: Optional[str] = None,
+        compress: bool = False,
+        resume: bool = False,
     ) -> str:
-        return self._machine.copy_file_to_machine(local_path, remote_path, self)
+        return self._machine.copy_file_to_machine(
+            local_path, remote_path, self, compress=compress, resume=resume
+        )
 
-    def copy_file_from_machine(self, remote_path: str, local_path: str):
-        self._machine.copy_file_from_machine(remote_path, local_path)
+    def copy_file_from_machine(
+        self,
+        remote_path: str,
+        local_path: str,
+        compress: bool = False,
+        resume: bool = False,
+    ):
+        self._machine.copy_file_from_machine(
+            remote_path, local_path, self, compress=compress, resume=resume
+        )
 
     def prepare_job(self, what, fail=False, json=False, desc=None,
                     job_level=ResultLevel.DEBUG):
@@ -129,6 +141,35 @@ class Namespace(object):
         job = self.prepare_job(what, fail, json, desc, job_level)
         job.start(bg, timeout)
         return job
+
+    def run_batch(self, commands, parallel=False, fail=False, desc=None,
+                  job_level=ResultLevel.IMPORTANT, bg=False,
+                  timeout=DEFAULT_TIMEOUT):
+        """Runs a list of commands on the host in a single Job
+
+        Args:
+            commands (mandatory) -- list of the commands to run, every item
+                is either a string with a shell command or a (path, value)
+                tuple writing str(value) into the file at path, e.g.
+                ("/proc/irq/42/smp_affinity_list", 3).
+            parallel -- False runs the commands one by one, True runs all of
+                them at the same time, an integer limits how many of them run
+                at the same time. The commands always run all, even if some
+                of them fail.
+            fail, desc, job_level, bg and timeout are the same as for the
+            run method.
+
+        Returns:
+            a Job object, its result is a dictionary of lists with an item
+            for every command in the order of the commands: "returncodes"
+            (the errno of a failed write), "stdout" and "stderr". The Job
+            passes if all the commands succeeded.
+        """
+        if parallel is True:
+            parallel = len(commands)
+        batch = CommandBatch(commands, parallel or 1)
+        return self.run(batch, fail=fail, desc=desc, job_level=job_level,
+                        bg=bg, timeout=timeout)
     
     def wait_for_condition(self, condition: WaitForConditionModule):
         job = self.prepare_job(condition)
@@ -18,9 +18,20 @@ class NetNamespace(Namespace):
 
     Created by the tester, should be assigned to a Host object which will
     perform the namespace creation. After that the tester uses it the same
-    way."""
-    def __init__(self, name):
+    way.
+
+    With direct_connection=True the Controller connects to the process
+    serving the namespace on the agent directly instead of relaying all the
+    communication through the agent process of the init namespace, so
+    several namespaces of one agent can be driven in parallel."""
+    def __init__(self, name, direct_connection=False):
         super(NetNamespace, self).__init__(None)
 
         self._name = name
+        self._direct_connection = direct_connection
         #self.jobs = None #TODO
+
+    @property
+    def direct_connection(self):
+        """Whether the Controller connects to the namespace directly"""
+        return self._direct_connection
@@ -17,6 +17,7 @@ from functools import reduce
 
 from lnst.Common.Parameters import Parameters, Param
 from lnst.Common.Colours import decorate_with_preset
+from lnst.Common.LogStore import LogListView
 from lnst.Controller.Requirements import _Requirements, HostReq
 from lnst.Controller.Common import ControllerError
 from lnst.Controller.RecipeResults import BaseResult, Result, ResultType
@@ -205,6 +206,11 @@ class RecipeRun(object):
 
     @property
     def log_list(self):
+        """Mapping of the controller and agent names to their log records
+
+        The records are read lazily from the on disk log segments, see
+        :py:class:`lnst.Common.LogStore.LogListView`.
+        """
         return self._log_list
 
     @property
@@ -255,7 +261,15 @@ class RecipeRun(object):
 
 def export_recipe_run(run: RecipeRun, export_dir: str = None, name: str = None) -> str:
     """
-    Export a recipe run to a file. :py:class:`RecipeRun` is pickled and compressed.
+    Export a recipe run to a file. The :py:class:`RecipeRun` is stored in
+    separately compressed sections, see
+    :py:mod:`lnst.Controller.RecipeRunArchive`.
+
+    The log records aren't part of the file, :py:attr:`RecipeRun.log_list`
+    only references the log segments stored in the `export_logs` directory
+    of the log folder. Keep it together with the exported file, when
+    imported it's looked up at its original location and next to or one
+    level above the exported file.
 
     :param run: `RecipeRun` object to export.
     :type run: :py:class:`RecipeRun`
@@ -285,8 +299,8 @@ def export_recipe_run(run: RecipeRun, export_dir: str = None, name: str = None)
         export_dir = run.log_dir
 
     path = os.path.join(export_dir, name)
-    with lzma.open(path, 'wb') as f:
-        pickle.dump(run, f)
+    from lnst.Controller.RecipeRunArchive import write_run_archive
+    write_run_archive(run, path)
     logging.info(f"Exported {run.recipe.__class__.__name__} run to {path}")
     return path
 
@@ -300,6 +314,11 @@ def import_recipe_run(path: str) -> RecipeRun:
     :return: object which contains the imported recipe run
     :rtype:  :py:class:`RecipeRun`
 
+    The data of the results is only loaded when accessed. To inspect the
+    run metadata or summaries of the measurement results without loading
+    the whole run use
+    :py:class:`lnst.Controller.RecipeRunArchive.RecipeRunArchive`.
+
     Example::
 
         >>> from lnst.Controller.Recipe import import_recipe_run
@@ -317,6 +336,14 @@ def import_recipe_run(path: str) -> RecipeRun:
         cpu 'cpu': 45.40 +-0.00 time units per second
         cpu 'cpu0': 45.40 +-0.00 time units per second
     """
+    from lnst.Controller.RecipeRunArchive import RecipeRunArchive, is_run_archive
+    if is_run_archive(path):
+        return RecipeRunArchive(path).load_run()
+
+    # legacy format, the whole RecipeRun pickled and LZMA compressed
     with lzma.open(path, 'rb') as f:
         run = pickle.load(f)
+
+    if isinstance(run.log_list, LogListView):
+        run.log_list.relocate(os.path.dirname(os.path.abspath(path)))
     return run
@@ -1,4 +1,3 @@
-import time
 import logging
 from lnst.Common.Logs import log_exc_traceback
 from lnst.Controller.Machine import Machine
@@ -14,23 +13,34 @@ class RecipeControl(object):
         return self._controller._hosts
 
     def wait(self, sec):
-        finish_time = time.time() + sec
         logging.info("Suspending recipe execution for {} seconds, "
                      "messages from agent will still be processed.".
                      format(sec))
 
-        def condition():
-            return time.time() > finish_time
-
         msg_dispatcher = self._controller._msg_dispatcher
-        msg_dispatcher.wait_for_condition(condition)
+        msg_dispatcher.process_messages(sec)
 
     def wait_for_condition(self, condition, timeout=0):
         #TODO add descriptions to conditions?
         logging.info("Suspending recipe execution until condition is true")
 
         msg_dispatcher = self._controller._msg_dispatcher
-        msg_dispatcher.wait_for_condition(condition, timeout)
+        return msg_dispatcher.wait_for_condition(condition, timeout)
+
+    def wait_for_jobs(self, jobs, timeout=0, wait_all=True):
+        """Waits for several jobs, possibly running on different hosts
+
+        Returns True when all the jobs finished, or any of them if wait_all
+        is False, and False if the timeout (in seconds, 0 means no timeout)
+        expired first.
+        """
+        logging.info("Suspending recipe execution until {} of {} jobs "
+                     "finish".format("all" if wait_all else "any", len(jobs)))
+
+        msg_dispatcher = self._controller._msg_dispatcher
+        conditions = [lambda job=job: job.finished for job in jobs]
+        return msg_dispatcher.wait_for_conditions(conditions, timeout,
+                                                  wait_all)
 
     def connect_host(self, hostname, timeout=60, port=None, machine_id=None,
                      security=None):
@@ -14,6 +14,8 @@ olichtne@redhat.com (Ondrej Lichtner)
 """
 
 import logging
+import lzma
+import pickle
 import time
 from enum import IntEnum
 from typing import Optional, Union
@@ -256,6 +258,24 @@ class DeviceAttrSetResult(DeviceConfigResult):
         )
 
 
+class ArchivedResultData(object):
+    """Placeholder of the data of a Result imported from a run archive
+
+    The data is only read, decompressed and unpickled from the archive when
+    the Result.data property is first accessed.
+    """
+    def __init__(self, offset, length, path=None):
+        self.offset = offset
+        self.length = length
+        self.path = path
+
+    def load(self):
+        with open(self.path, "rb") as f:
+            f.seek(self.offset)
+            data = f.read(self.length)
+        return pickle.loads(lzma.decompress(data))
+
+
 class Result(BaseResult):
     """Class intended to store aribitrary tester supplied data
 
@@ -280,6 +300,8 @@ class Result(BaseResult):
 
     @property
     def data(self):
+        if isinstance(self._data, ArchivedResultData):
+            self._data = self._data.load()
         return self._data
 
     @property
@@ -0,0 +1,276 @@
+"""
+Indexed archive format of exported recipe runs (.lrc files).
+
+The archive consists of separately LZMA compressed pickled sections so that
+parts of a run can be loaded without decompressing the rest:
+
+* metadata - recipe name, description, timestamps, overall result and the
+  rest of the RecipeRun attributes
+* recipe - the BaseRecipe instance
+* results_index - json list describing every result, including summaries
+  of measurement results
+* results - the result objects without the data of Result instances
+* one section per Result data - measurement data, raw samples
+* logs - the RecipeRun.log_list, a reference to the log segments
+
+File layout::
+
+    header: magic (8B), format version (u16), toc offset (u64), toc length (u64)
+    sections
+    toc: json, section name -> [offset, length]
+
+Copyright 2024 Red Hat, Inc.
+Licensed under the GNU General Public License, version 2 as
+published by the Free Software Foundation; see COPYING for details.
+"""
+
+import os
+import copy
+import json
+import lzma
+import pickle
+import struct
+import logging
+
+from lnst.Controller.Recipe import RecipeRun, RecipeError
+from lnst.Controller.RecipeResults import (
+    ArchivedResultData,
+    MeasurementResult,
+    Result,
+)
+
+MAGIC = b"LNSTLRC\x00"
+FORMAT_VERSION = 2
+HEADER = struct.Struct("!8sHQQ")
+
+_RUN_STATE_EXCLUDE = ("_results", "_recipe", "_log_list")
+
+
+def is_run_archive(path: str) -> bool:
+    """Checks whether path is a run archive, legacy .lrc files aren't"""
+    with open(path, "rb") as f:
+        return f.read(len(MAGIC)) == MAGIC
+
+
+def write_run_archive(run: RecipeRun, path: str) -> None:
+    """Writes run to path in the indexed archive format"""
+    toc = {}
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(HEADER.pack(MAGIC, FORMAT_VERSION, 0, 0))
+
+        def write_section(name, obj):
+            data = lzma.compress(pickle.dumps(obj, pickle.HIGHEST_PROTOCOL))
+            toc[name] = [f.tell(), len(data)]
+            f.write(data)
+            return toc[name]
+
+        results = []
+        results_index = []
+        for i, result in enumerate(run.results):
+            entry = _index_entry(i, result)
+            if isinstance(result, Result) and result.data is not None:
+                offset, length = write_section("data/%d" % i, result.data)
+                entry["data"] = [offset, length]
+                result = copy.copy(result)
+                result._data = ArchivedResultData(offset, length)
+            results.append(result)
+            results_index.append(entry)
+
+        write_section("results", results)
+        write_section("metadata", _run_metadata(run))
+
+        recipe = copy.copy(run.recipe)
+        recipe.runs = []
+        write_section("recipe", recipe)
+        write_section("logs", run.log_list)
+
+        index = json.dumps(results_index, default=repr).encode()
+        toc["results_index"] = [f.tell(), len(index)]
+        f.write(index)
+
+        toc_data = json.dumps(toc).encode()
+        toc_offset = f.tell()
+        f.write(toc_data)
+
+        f.seek(0)
+        f.write(HEADER.pack(MAGIC, FORMAT_VERSION, toc_offset, len(toc_data)))
+    os.replace(tmp_path, path)
+
+
+def _run_metadata(run):
+    recipe_cls = run.recipe.__class__
+    state = {key: value for key, value in run.__dict__.items()
+             if key not in _RUN_STATE_EXCLUDE}
+    return {
+        "format_version": FORMAT_VERSION,
+        "recipe": "{}.{}".format(recipe_cls.__module__, recipe_cls.__qualname__),
+        "recipe_name": recipe_cls.__name__,
+        "description": run.description,
+        "datetime": run.datetime,
+        "overall_result": str(run.overall_result),
+        "results_count": len(run.results),
+        "exception": repr(run.exception) if run.exception is not None else None,
+        "run_state": state,
+    }
+
+
+def _index_entry(i, result):
+    result_cls = result.__class__
+    entry = {
+        "index": i,
+        "class": "{}.{}".format(result_cls.__module__, result_cls.__qualname__),
+        "result": str(result.result),
+        "timestamp": result.timestamp,
+        "description": result.description,
+        "level": int(result.level),
+        "measurement_type": None,
+        "summary": None,
+        "data": None,
+    }
+    if isinstance(result, MeasurementResult):
+        from lnst.Controller.RunSummaryFormatters.JsonRunSummaryFormatter import (
+            JsonRunSummaryFormatter,
+        )
+
+        entry["measurement_type"] = result.measurement_type
+        try:
+            transformed = JsonRunSummaryFormatter()._transform_result(result)
+            entry["summary"] = transformed["data"]
+        except Exception:
+            logging.debug("Couldn't summarize result {}".format(i))
+    return entry
+
+
+class RecipeRunArchive(object):
+    """Reader of a run archive
+
+    Only the header and the table of contents are read when created, the
+    sections are read on demand, e.g. the results index or the metadata can
+    be inspected without loading any results, logs or measurement data.
+    """
+    def __init__(self, path: str):
+        self._path = os.path.abspath(path)
+        self._metadata = None
+        self._results_index = None
+        self._results = None
+
+        with open(self._path, "rb") as f:
+            header = f.read(HEADER.size)
+            if len(header) < HEADER.size:
+                raise RecipeError("{} is not a recipe run archive".format(path))
+            magic, version, toc_offset, toc_length = HEADER.unpack(header)
+            if magic != MAGIC:
+                raise RecipeError("{} is not a recipe run archive".format(path))
+            if version > FORMAT_VERSION:
+                raise RecipeError(
+                    "Unsupported recipe run archive version {} of {}".format(
+                        version, path))
+            f.seek(toc_offset)
+            self._toc = json.loads(f.read(toc_length))
+        self._version = version
+
+    @property
+    def path(self) -> str:
+        return self._path
+
+    @property
+    def version(self) -> int:
+        return self._version
+
+    def _read(self, name):
+        offset, length = self._toc[name]
+        with open(self._path, "rb") as f:
+            f.seek(offset)
+            return f.read(length)
+
+    def _load_section(self, name):
+        return pickle.loads(lzma.decompress(self._read(name)))
+
+    @property
+    def metadata(self) -> dict:
+        if self._metadata is None:
+            self._metadata = self._load_section("metadata")
+        return self._metadata
+
+    @property
+    def results_index(self) -> list:
+        if self._results_index is None:
+            self._results_index = json.loads(self._read("results_index"))
+        return self._results_index
+
+    def measurement_summaries(self, measurement_type: str = None) -> list:
+        """Returns the results index entries of MeasurementResults
+
+        Only the results index is read, the summary of every entry is the
+        same as the "data" of the JSON run summary.
+        """
+        return [entry for entry in self.results_index
+                if entry["measurement_type"] is not None and
+                (measurement_type is None or
+                 entry["measurement_type"] == measurement_type)]
+
+    def _load_results(self):
+        if self._results is None:
+            results = self._load_section("results")
+            for result in results:
+                if isinstance(getattr(result, "_data", None),
+                              ArchivedResultData):
+                    result._data.path = self._path
+            self._results = results
+        return self._results
+
+    def load_result(self, index: int):
+        """Loads a single result, its data is read on first access"""
+        return self._load_results()[index]
+
+    def load_results(self) -> list:
+        return list(self._load_results())
+
+    def load_recipe(self):
+        return self._load_section("recipe")
+
+    def load_logs(self):
+        log_list = self._load_section("logs")
+        if hasattr(log_list, "relocate"):
+            log_list.relocate(os.path.dirname(self._path))
+        return log_list
+
+    def load_run(self) -> RecipeRun:
+        """Loads the complete RecipeRun, results data is still lazy"""
+        run = RecipeRun.__new__(RecipeRun)
+        run.__dict__.update(self.metadata["run_state"])
+        run._results = self.load_results()
+        run._log_list = self.load_logs()
+        run._recipe = self.load_recipe()
+        run._recipe.runs = [run]
+        return run
+
+
+def scan_run_archives(directory: str, recursive: bool = True):
+    """Iterates over the run archives in directory
+
+    Yields RecipeRunArchive objects, so only the sections used by the caller
+    are read, e.g.::
+
+        for archive in scan_run_archives("/tmp/lnst-logs"):
+            print(archive.metadata["recipe_name"],
+                  archive.measurement_summaries("flow"))
+
+    Legacy .lrc files are skipped.
+    """
+    for root, dirs, files in os.walk(directory):
+        for name in sorted(files):
+            if not name.endswith(".lrc"):
+                continue
+            path = os.path.join(root, name)
+            try:
+                if not is_run_archive(path):
+                    logging.debug("Skipping legacy recipe run export {}".format(path))
+                    continue
+                yield RecipeRunArchive(path)
+            except (OSError, RecipeError) as e:
+                logging.debug("Skipping {}: {}".format(path, e))
+        if not recursive:
+            break
+        dirs.sort()
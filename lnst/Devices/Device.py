@@ -12,23 +12,25 @@ olichtne@redhat.com (Ondrej Lichtner)
 """
 
 import re
+import json
 import ethtool
-import pyroute2
 import logging
 import pprint
 import time
 from abc import ABCMeta
 from itertools import product
 from pyroute2.netlink.rtnl import ifinfmsg
+from pyroute2.netlink.exceptions import NetlinkError
 from typing import Optional
 from lnst.Common.Logs import log_exc_traceback
 from lnst.Common.ExecCmd import exec_cmd, ExecCmdFail
+from lnst.Common.EthtoolNetlink import COALESCE_SETTINGS
 from lnst.Common.DeviceError import DeviceError, DeviceDeleted, DeviceDisabled
 from lnst.Common.DeviceError import DeviceConfigError, DeviceConfigValueError
 from lnst.Common.DeviceError import DeviceFeatureNotSupported
 from lnst.Common.IpAddress import ipaddress, AF_INET, BaseIpAddress
 from lnst.Common.HWAddress import hwaddress
-from lnst.Common.Utils import wait_for_condition
+from lnst.Common.Utils import wait_for_condition, concurrency_safe
 
 from pyroute2.netlink.rtnl import RTM_NEWLINK
 from pyroute2.netlink.rtnl import RTM_NEWADDR
@@ -153,19 +155,13 @@ class Device(object, metaclass=DeviceMeta):
         logging.debug("Performing pyroute.IPRoute().{}({}, *args, **kwargs)".format(obj_name, op_name))
         logging.debug("{}".format(pretty_attrs))
 
-        ret_val = None
-        with pyroute2.IPRoute() as ipr:
-            try:
-                obj = getattr(ipr, obj_name)
-                if op_name is not None:
-                    ret_val = obj(op_name, *args, **kwargs)
-                else:
-                    ret_val = obj(*args, **kwargs)
-                self._if_manager.rescan_devices()
-            except Exception as e:
-                log_exc_traceback()
-                raise DeviceConfigError("Object {} operation {} on link {} failed: {}"
-                        .format(obj_name, op_name, self.name, str(e)))
+        try:
+            ret_val = self._if_manager.ipr_call(self.ifindex, obj_name,
+                                                op_name, args, kwargs)
+        except Exception as e:
+            log_exc_traceback()
+            raise DeviceConfigError("Object {} operation {} on link {} failed: {}"
+                    .format(obj_name, op_name, self.name, str(e)))
         return ret_val
 
     def _enable(self):
@@ -285,15 +281,16 @@ class Device(object, metaclass=DeviceMeta):
                    "mtu": self.mtu,
                    "driver": self.driver,
                    "devlink": self._devlink}
+        settings = self._read_ethtool_settings("coalesce", "pause")
         try:
-            ad_rx_coal, ad_tx_coal = self._read_adaptive_coalescing()
+            ad_rx_coal, ad_tx_coal = self._read_adaptive_coalescing(settings)
         except DeviceError:
             ad_rx_coal, ad_tx_coal = None, None
         if_data["adaptive_rx_coalescing"] = ad_rx_coal
         if_data["adaptive_tx_coalescing"] = ad_tx_coal
 
         try:
-            rx_pause, tx_pause = self._read_pause_frames()
+            rx_pause, tx_pause = self._read_pause_frames(settings)
         except DeviceError:
             rx_pause, tx_pause = None, None
         if_data["rx_pause"] = rx_pause
@@ -339,15 +336,18 @@ class Device(object, metaclass=DeviceMeta):
                 "mtu": self.mtu,
                 "name": self.name,
                 "hwaddr": self.hwaddr}
+
+        # all the ethtool settings in a single netlink round trip
+        settings = self._read_ethtool_settings("coalesce", "pause")
         try:
-            ad_rx_coal, ad_tx_coal = self._read_adaptive_coalescing()
+            ad_rx_coal, ad_tx_coal = self._read_adaptive_coalescing(settings)
         except DeviceError:
             ad_rx_coal, ad_tx_coal = None, None
         self._cleanup_data["adaptive_rx_coalescing"] = ad_rx_coal
         self._cleanup_data["adaptive_tx_coalescing"] = ad_tx_coal
 
         try:
-            rx_pause, tx_pause = self._read_pause_frames()
+            rx_pause, tx_pause = self._read_pause_frames(settings)
         except DeviceError:
             rx_pause, tx_pause = None, None
         self._cleanup_data.update(
@@ -356,7 +356,9 @@ class Device(object, metaclass=DeviceMeta):
                     "tx_pause": tx_pause
                 })
 
-        self._cleanup_data["coalescing_settings"] = self._read_coalescing_settings()
+        self._cleanup_data["coalescing_settings"] = (
+            self._read_coalescing_settings(settings)
+        )
 
     def restore_original_data(self):
         """Restores initial configuration from stored values"""
@@ -364,6 +366,21 @@ class Device(object, metaclass=DeviceMeta):
             logging.debug("No cleanup data present")
             return
 
+        # only the settings that changed are written, the current ethtool
+        # settings are read in a single round trip. These are restored
+        # before the name as the ethtool command uses the current name.
+        settings = self._read_ethtool_settings("coalesce", "pause")
+        try:
+            self.restore_coalescing(settings)
+        except DeviceError as e:
+            logging.warn(e)
+
+        if not self._pause_frames_restored(settings):
+            # the device needs to be up to configure the pause frame settings
+            self.up()
+            self.restore_pause_frames()
+            self.down()
+
         if self.mtu != self._cleanup_data["mtu"]:
             self.mtu = self._cleanup_data["mtu"]
 
@@ -373,16 +390,6 @@ class Device(object, metaclass=DeviceMeta):
         if self.hwaddr != self._cleanup_data["hwaddr"]:
             self.hwaddr = self._cleanup_data["hwaddr"]
 
-        try:
-            self.restore_coalescing()
-        except DeviceError as e:
-            logging.warn(e)
-
-        # the device needs to be up to configure the pause frame settings
-        self.up()
-        self.restore_pause_frames()
-        self.down()
-
         self._cleanup_data = None
 
     def _create(self):
@@ -670,8 +677,9 @@ class Device(object, metaclass=DeviceMeta):
             raise DeviceFeatureNotSupported(f"No bus info for {self.name}")
 
     def ip_add_bulk(self, addresses: list[tuple[BaseIpAddress, Optional[BaseIpAddress]]], wait=True):
-        for addr, peer in addresses:
-            self._ip_add((addr, peer))
+        with self._if_manager.netlink_batch():
+            for addr, peer in addresses:
+                self._ip_add((addr, peer))
 
         if wait:
             self.wait_for_addresses(addresses)
@@ -708,7 +716,7 @@ class Device(object, metaclass=DeviceMeta):
         while not all([addr in self.ips for (addr, _) in addresses]) and i <= MAX_TRIES:
             logging.debug("Waiting for ip address to be added {} of 5".format(i))
             time.sleep(1)
-            self._if_manager.rescan_devices()
+            self._if_manager.sync_devices()
 
         if not all([addr in self.ips for (addr, _) in addresses]):
             raise DeviceError("Failed to configure ip addresses {}".format(str(ipaddress(addr)) for (addr, _) in addresses))
@@ -761,8 +769,40 @@ class Device(object, metaclass=DeviceMeta):
         self.down()
         wait_for_condition(lambda: "up" not in self.state, timeout=timeout)
 
-    #TODO looks like python ethtool module doesn't support these so we'll keep
-    #exec_cmd for now...
+    def _read_ethtool_settings(self, *parts):
+        """Reads settings through ethtool netlink in a single round trip
+
+        Returns None when ethtool netlink isn't available and the ethtool
+        command has to be used instead. The parts that couldn't be read are
+        returned as the NetlinkError instances.
+        """
+        ethtool_nl = self._if_manager.get_ethtool()
+        if ethtool_nl is None:
+            return None
+        return ethtool_nl.get_settings(self.ifindex, parts)
+
+    def _write_ethtool_settings(self, method_name, *args):
+        """Writes settings through ethtool netlink
+
+        Returns False when ethtool netlink isn't available and the ethtool
+        command has to be used instead, NetlinkError is raised on failure.
+        """
+        ethtool_nl = self._if_manager.get_ethtool()
+        if ethtool_nl is None:
+            return False
+        getattr(ethtool_nl, method_name)(self.ifindex, *args)
+        return True
+
+    def _write_linkmodes(self, cmd_args, speed=None, autoneg=None):
+        try:
+            if self._write_ethtool_settings("set_linkmodes", speed, autoneg):
+                return
+        except NetlinkError as e:
+            raise DeviceConfigError("Could not set link modes of %s: %s" %
+                                    (self.name, e))
+        exec_cmd("ethtool -s %s %s" % (self.name, cmd_args))
+
+    @concurrency_safe
     def speed_set(self, speed):
         """set the device speed
 
@@ -776,17 +816,32 @@ class Device(object, metaclass=DeviceMeta):
         except:
             raise DeviceConfigValueError("Invalid link speed value %s" %
                                          str(speed))
-        exec_cmd("ethtool -s %s speed %d" % (self.name, speed))
+        self._write_linkmodes("speed %d" % speed, speed=int(speed))
 
+    @concurrency_safe
     def autoneg_on(self):
         """enable automatic negotiation of speed for this device"""
-        exec_cmd("ethtool -s %s autoneg on" % self.name)
+        self._write_linkmodes("autoneg on", autoneg=True)
 
+    @concurrency_safe
     def autoneg_off(self):
         """disable automatic negotiation of speed for this device"""
-        exec_cmd("ethtool -s %s autoneg off" % self.name)
+        self._write_linkmodes("autoneg off", autoneg=False)
+
+    def _read_adaptive_coalescing(self, settings=None):
+        if settings is None:
+            settings = self._read_ethtool_settings("coalesce")
+
+        if settings is not None:
+            coalesce = settings["coalesce"]
+            if (isinstance(coalesce, NetlinkError) or
+                    None in (coalesce["adaptive-rx"], coalesce["adaptive-tx"])):
+                raise DeviceFeatureNotSupported(
+                    "No values for coalescence of %s." % self.name
+                )
+            return ['on' if coalesce["adaptive-rx"] else 'off',
+                    'on' if coalesce["adaptive-tx"] else 'off']
 
-    def _read_adaptive_coalescing(self):
         res, _ = exec_cmd("ethtool -c %s" % self.name, die_on_err=False)
 
         regex = "Adaptive RX: (on|off)  TX: (on|off)"
@@ -802,6 +857,10 @@ class Device(object, metaclass=DeviceMeta):
         if self._read_adaptive_coalescing() == [rx_val, tx_val]:
             return
         try:
+            if self._write_ethtool_settings(
+                    "set_coalesce", {"adaptive-rx": rx_val,
+                                     "adaptive-tx": tx_val}):
+                return
             exec_cmd("ethtool -C %s adaptive-rx %s adaptive-tx %s" %
                      (self.name, rx_val, tx_val))
         except:
@@ -809,17 +868,32 @@ class Device(object, metaclass=DeviceMeta):
                 "Not allowed to modify coalescence settings for %s." % self.name
             )
 
-    def restore_coalescing(self):
-        for setting, value in self._cleanup_data["coalescing_settings"].items():
-            if value != 'n/a':
-                self._write_coalescing_setting(setting, value)
+    def restore_coalescing(self, settings=None):
+        current = self._read_coalescing_settings(settings)
+        self._write_coalescing_settings(
+            {setting: value
+             for setting, value in self._cleanup_data["coalescing_settings"].items()
+             if value != 'n/a' and current.get(setting) != value}
+        )
 
         rx_val = self._cleanup_data["adaptive_rx_coalescing"]
         tx_val = self._cleanup_data["adaptive_tx_coalescing"]
         if (rx_val, tx_val) != (None, None):
             self._write_adaptive_coalescing(rx_val, tx_val)
 
-    def _read_coalescing_settings(self):
+    def _read_coalescing_settings(self, settings=None):
+        if settings is None:
+            settings = self._read_ethtool_settings("coalesce")
+
+        if settings is not None:
+            coalesce = settings["coalesce"]
+            if isinstance(coalesce, NetlinkError):
+                return {}
+            # same format as parsed from the ethtool output
+            return {setting: 'n/a' if coalesce[setting] is None
+                    else str(coalesce[setting])
+                    for setting in COALESCE_SETTINGS}
+
         settings = {}
         output, _ = exec_cmd("ethtool -c %s" % self.name, die_on_err=False)
 
@@ -835,11 +909,32 @@ class Device(object, metaclass=DeviceMeta):
         return settings
 
     def _write_coalescing_setting(self, setting, value):
+        self._write_coalescing_settings({setting: value})
+
+    def _write_coalescing_settings(self, settings):
+        if not settings:
+            return
+
+        try:
+            if self._write_ethtool_settings("set_coalesce", settings):
+                return
+        except KeyError:
+            # not a netlink attribute, leave it to the ethtool command
+            pass
+        except NetlinkError:
+            raise DeviceFeatureNotSupported(
+                "Not allowed to modify coalescence settings {} for {}."
+                .format(" ".join(settings.keys()), self.name)
+            )
+
         try:
-            exec_cmd(f"ethtool -C {self.name} {setting} {value}")
+            exec_cmd(f"ethtool -C {self.name} " +
+                     " ".join(f"{setting} {value}"
+                              for setting, value in settings.items()))
         except:
             raise DeviceFeatureNotSupported(
-                f"Not allowed to modify coalescence settings {setting} for {self.name}."
+                "Not allowed to modify coalescence settings {} for {}."
+                .format(" ".join(settings.keys()), self.name)
             )
 
     @property
@@ -868,7 +963,19 @@ class Device(object, metaclass=DeviceMeta):
     def tx_pause_frames(self, value):
         self._write_pause_frames(None, value)
 
-    def _read_pause_frames(self):
+    def _read_pause_frames(self, settings=None):
+        if settings is None:
+            settings = self._read_ethtool_settings("pause")
+
+        if settings is not None:
+            pause = settings["pause"]
+            if (isinstance(pause, NetlinkError) or
+                    None in (pause["rx"], pause["tx"])):
+                raise DeviceFeatureNotSupported(
+                    "No values for pause frames of %s." % self.name
+                    )
+            return [pause["rx"], pause["tx"]]
+
         try:
             res, _ = exec_cmd("ethtool -a %s" % self.name)
         except:
@@ -894,18 +1001,25 @@ class Device(object, metaclass=DeviceMeta):
     def _write_pause_frames(self, rx_val, tx_val):
         ethtool_cmd = "ethtool -A {}".format(self.name)
         ethtool_opts = ""
+        nl_settings = {}
 
         for feature, value in [('rx', rx_val), ('tx', tx_val)]:
             if value is None:
                 continue
 
             ethtool_opts += " {} {}".format(feature, 'on' if value else 'off')
+            nl_settings[feature] = value
 
         if len(ethtool_opts) == 0:
             return
 
         try:
-            exec_cmd(ethtool_cmd + ethtool_opts)
+            if not self._write_ethtool_settings("set_pause", nl_settings):
+                exec_cmd(ethtool_cmd + ethtool_opts)
+        except NetlinkError:
+            raise DeviceConfigError(
+                "Could not modify pause settings for %s." % self.name
+            )
         except ExecCmdFail as e:
             if e.get_retval() == 79:
                 raise DeviceConfigError(
@@ -922,20 +1036,180 @@ class Device(object, metaclass=DeviceMeta):
         if timeout == 0:
             raise DeviceError("Pause frames not set!")
 
-    def _pause_frames_match(self, rx_expected, tx_expected):
-        rx_value, tx_value = self._read_pause_frames()
+    def _pause_frames_match(self, rx_expected, tx_expected, settings=None):
+        rx_value, tx_value = self._read_pause_frames(settings)
         if ((rx_expected is not None and rx_expected != rx_value) or
                 (tx_expected is not None and tx_expected != tx_value)):
             return False
 
         return True
 
+    def _pause_frames_restored(self, settings=None):
+        rx_val = self._cleanup_data["rx_pause"]
+        tx_val = self._cleanup_data["tx_pause"]
+        if (rx_val, tx_val) == (None, None):
+            return True
+
+        try:
+            return self._pause_frames_match(rx_val, tx_val, settings)
+        except DeviceFeatureNotSupported:
+            return False
+
     def restore_pause_frames(self):
         rx_val = self._cleanup_data["rx_pause"]
         tx_val = self._cleanup_data["tx_pause"]
         if (rx_val, tx_val) != (None, None):
             self._write_pause_frames(rx_val, tx_val)
 
+    @property
+    def ring_settings(self):
+        """ring_settings attribute
+
+        Returns a dictionary of the ring sizes and their maximums as
+        reported by 'ethtool --json -g', e.g. {"rx": 512, "rx-max": 4096}.
+        Sizes that the device doesn't support are None when read through
+        ethtool netlink.
+        """
+        settings = self._read_ethtool_settings("rings")
+        if settings is not None:
+            if isinstance(settings["rings"], NetlinkError):
+                raise DeviceFeatureNotSupported(
+                    "No ring settings for %s." % self.name
+                )
+            return settings["rings"]
+
+        try:
+            out, _ = exec_cmd("ethtool --json -g %s" % self.name)
+        except ExecCmdFail:
+            raise DeviceFeatureNotSupported(
+                "No ring settings for %s." % self.name
+            )
+        ring_settings = json.loads(out)[0]
+        ring_settings.pop("ifname", None)
+        return ring_settings
+
+    def set_ring_settings(self, settings):
+        """set ring sizes of the device
+
+        Args:
+            settings -- dictionary of 'ethtool -G' parameters and their
+                values, e.g. {"rx": 1024, "tx": 1024}
+        """
+        self._write_ethtool_part("set_rings", "ethtool -G", settings,
+                                 "ring settings")
+
+    @property
+    def channels(self):
+        """channels attribute
+
+        Returns a dictionary of the channel counts and their maximums using
+        the 'ethtool -L' names, e.g. {"combined": 4, "combined-max": 8}.
+        Channel types that the device doesn't support are None.
+        """
+        settings = self._read_ethtool_settings("channels")
+        if settings is not None:
+            if isinstance(settings["channels"], NetlinkError):
+                raise DeviceFeatureNotSupported(
+                    "No channel settings for %s." % self.name
+                )
+            return settings["channels"]
+
+        try:
+            out, _ = exec_cmd("ethtool -l %s" % self.name)
+        except ExecCmdFail:
+            raise DeviceFeatureNotSupported(
+                "No channel settings for %s." % self.name
+            )
+
+        channels = {}
+        suffix = "-max"
+        for line in out.split("\n")[1:]:
+            if line == "Pre-set maximums:":
+                suffix = "-max"
+            elif line == "Current hardware settings:":
+                suffix = ""
+            elif ":" in line:
+                name, value = line.split(":", 1)
+                value = value.strip()
+                channels[name.lower() + suffix] = (
+                    None if value == "n/a" else int(value)
+                )
+        return channels
+
+    def set_channels(self, settings):
+        """set channel counts of the device
+
+        Args:
+            settings -- dictionary of 'ethtool -L' parameters and their
+                values, e.g. {"combined": 4}
+        """
+        self._write_ethtool_part("set_channels", "ethtool -L", settings,
+                                 "channel settings")
+
+    @property
+    def features(self):
+        """features attribute
+
+        Returns a dictionary of the features the device has, e.g.
+        {"rx-gro": True}, using the names reported by 'ethtool -k'.
+        """
+        settings = self._read_ethtool_settings("features")
+        if settings is not None:
+            if isinstance(settings["features"], NetlinkError):
+                raise DeviceFeatureNotSupported(
+                    "No features for %s." % self.name
+                )
+            return settings["features"]
+
+        try:
+            out, _ = exec_cmd("ethtool -k %s" % self.name)
+        except ExecCmdFail:
+            raise DeviceFeatureNotSupported(
+                "No features for %s." % self.name
+            )
+        features = {}
+        for line in out.split("\n")[1:]:
+            if m := re.match(r"^\s*([\w-]+): (on|off)", line):
+                features[m.group(1)] = m.group(2) == "on"
+        return features
+
+    def set_features(self, features):
+        """set features of the device
+
+        Args:
+            features -- dictionary of 'ethtool -k' feature names and boolean
+                or "on"/"off" values, e.g. {"rx-gro": False}
+        """
+        self._write_ethtool_part(
+            "set_features", "ethtool -K",
+            {name: value if isinstance(value, str) else
+             ("on" if value else "off")
+             for name, value in features.items()},
+            "features",
+        )
+
+    def _write_ethtool_part(self, method_name, cmd, settings, desc):
+        if not settings:
+            return
+
+        try:
+            if self._write_ethtool_settings(method_name, settings):
+                return
+        except KeyError as e:
+            raise DeviceConfigValueError("Unknown %s parameter %s" %
+                                         (desc, e))
+        except NetlinkError as e:
+            raise DeviceConfigError("Could not set %s of %s: %s" %
+                                    (desc, self.name, e))
+
+        try:
+            exec_cmd(f"{cmd} {self.name} " +
+                     " ".join(f"{name} {value}"
+                              for name, value in settings.items()))
+        except ExecCmdFail as e:
+            raise DeviceConfigError("Could not set %s of %s: %s" %
+                                    (desc, self.name, e))
+
     @property
     def eswitch_mode(self):
         try:
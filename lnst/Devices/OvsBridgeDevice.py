@@ -11,6 +11,7 @@ olichtne@redhat.com (Ondrej Lichtner)
 """
 
 import re
+import json
 import pprint
 from lnst.Common.ExecCmd import exec_cmd
 from lnst.Common.DeviceError import DeviceError
@@ -24,6 +25,10 @@ class OvsBridgeDevice(SoftDevice):
         super(OvsBridgeDevice, self).__init__(ifmanager)
         self._type_init()
 
+        self._transaction = None
+        self._transaction_ifaces = None
+        self._transaction_names = None
+
     @classmethod
     def _type_init(cls):
         exec_cmd("systemctl start openvswitch.service", die_on_err=False)
@@ -82,41 +87,117 @@ class OvsBridgeDevice(SoftDevice):
 
         return formatted_data
 
-    def _list_ports(self):
-        out_json = exec_cmd("ovs-vsctl --format json list port",
-                log_outputs=False, json=True)[0]
-
-        return self._format_ovs_json(out_json)
-
-    def _list_interfaces(self):
-        out_json = exec_cmd("ovs-vsctl --format json list interface",
-                log_outputs=False, json=True)[0]
-
-        return self._format_ovs_json(out_json)
+    def _list_ports_and_interfaces(self):
+        # both tables in a single ovs-vsctl transaction, it prints a json
+        # object for each of the commands
+        out = exec_cmd("ovs-vsctl --format json list port -- list interface",
+                log_outputs=False)[0]
+
+        decoder = json.JSONDecoder()
+        tables = []
+        idx = 0
+        while len(tables) < 2:
+            out_json, idx = decoder.raw_decode(out, idx)
+            tables.append(self._format_ovs_json(out_json))
+            while idx < len(out) and out[idx].isspace():
+                idx += 1
+
+        return tables
+
+    def _vsctl(self, cmd):
+        if self._transaction is not None:
+            self._transaction.append(cmd)
+        else:
+            exec_cmd("ovs-vsctl {}".format(cmd))
+
+    def begin_transaction(self):
+        """start collecting OVSDB changes for a single transaction
+
+        The following port_add, port_del, bond_add, bond_del, tunnel_add
+        and tunnel_del calls are only recorded and then applied all at once
+        by a single ovs-vsctl transaction in commit_transaction. Internal
+        ports added within the transaction are returned by
+        commit_transaction instead of port_add.
+        """
+        if self._transaction is not None:
+            raise DeviceError("OVSDB transaction already started on %s" %
+                              self.name)
+
+        self._transaction = []
+        self._transaction_ifaces = []
+        self._transaction_names = set()
+
+    def commit_transaction(self):
+        """apply the OVSDB changes collected since begin_transaction
+
+        Returns the list of the internal port devices created by the
+        transaction.
+        """
+        if self._transaction is None:
+            raise DeviceError("No OVSDB transaction started on %s" %
+                              self.name)
+
+        cmds, self._transaction = self._transaction, None
+        iface_names, self._transaction_ifaces = self._transaction_ifaces, None
+        self._transaction_names = None
+
+        if cmds:
+            exec_cmd("ovs-vsctl " + " ".join(
+                "-- {}".format(cmd) for cmd in cmds))
+
+        return [self._enable_internal_iface(name) for name in iface_names]
+
+    def abort_transaction(self):
+        """discard the OVSDB changes collected since begin_transaction"""
+        self._transaction = None
+        self._transaction_ifaces = None
+        self._transaction_names = None
+
+    def _assign_port_name(self, prefix):
+        if self._transaction is None:
+            return self._if_manager.assign_name(prefix)
+
+        # the ports of the pending transaction don't exist yet
+        index = 0
+        while (prefix + str(index) in self._transaction_names or
+               self._if_manager._is_name_used(prefix + str(index))):
+            index += 1
+        return prefix + str(index)
+
+    def _enable_internal_iface(self, dev_name):
+        iface = self._if_manager.get_device_by_name(dev_name)
+        iface._enable()
+        return iface
 
     def port_add(self, device=None, port_options={}, interface_options={}):
         if device is None:
-            dev_name = interface_options.get('name',
-                self._if_manager.assign_name(interface_options['type']))
+            dev_name = interface_options.get('name')
+            if dev_name is None:
+                dev_name = self._assign_port_name(interface_options['type'])
         else:
             dev_name = device.name
 
-        exec_cmd("ovs-vsctl add-port {} {}{}{}".format(self.name, dev_name,
+        if self._transaction is not None:
+            self._transaction_names.add(dev_name)
+
+        self._vsctl("add-port {} {}{}{}".format(self.name, dev_name,
             self._dict_to_keyvalues(port_options),
             self._interface_cmd(dev_name, interface_options)))
 
         iface = None
         if 'type' in interface_options and interface_options['type'] == 'internal':
-            iface = self._if_manager.get_device_by_name(dev_name)
-            iface._enable()
+            if self._transaction is not None:
+                self._transaction_ifaces.append(dev_name)
+            else:
+                iface = self._enable_internal_iface(dev_name)
 
         return iface
 
     def port_del(self, dev):
         if isinstance(dev, Device):
-            exec_cmd("ovs-vsctl del-port %s %s" % (self.name, dev.name))
+            self._vsctl("del-port %s %s" % (self.name, dev.name))
         elif isinstance(dev, str):
-            exec_cmd("ovs-vsctl del-port %s %s" % (self.name, dev))
+            self._vsctl("del-port %s %s" % (self.name, dev))
         else:
             raise DeviceError("Invalid port_del argument %s" % str(dev))
 
@@ -129,8 +210,8 @@ class OvsBridgeDevice(SoftDevice):
         for opt_name, opt_value in kwargs.items():
             options += " %s=%s" % (opt_name, opt_value)
 
-        exec_cmd("ovs-vsctl add-bond %s %s %s %s" % (self.name, port_name,
-                                                     dev_names, options))
+        self._vsctl("add-bond %s %s %s %s" % (self.name, port_name,
+                                              dev_names, options))
 
     def bond_del(self, dev):
         self.port_del(dev)
@@ -146,25 +227,39 @@ class OvsBridgeDevice(SoftDevice):
     def flow_add(self, entry):
         exec_cmd("ovs-ofctl add-flow %s '%s'" % (self.name, entry))
 
-    def flows_add(self, entries):
-        for entry in entries:
-            self.flow_add(entry)
+    def flows_add(self, entries, bundle=True):
+        """add a list of flows with a single ovs-ofctl call
+
+        Args:
+            entries -- list of flows in the 'ovs-ofctl add-flow' format
+            bundle -- install all the flows atomically as an OpenFlow
+                bundle, either all of them are added or none
+        """
+        if not entries:
+            return
+
+        exec_cmd("ovs-ofctl {}add-flows {} -".format(
+                     "--bundle " if bundle else "", self.name),
+                 stdin="".join("%s\n" % entry for entry in entries).encode())
 
     def flows_del(self, entry):
         exec_cmd("ovs-ofctl del-flows %s" % (self.name))
 
     @property
     def ports(self):
-        ports = self._list_ports()
-        interfaces = self._list_interfaces()
+        ports, interfaces = self._list_ports_and_interfaces()
+        interfaces = {iface['_uuid']: iface for iface in interfaces}
 
         filtered_ports = {}
 
         for port in ports:
             port_iface_uuid = port['interfaces']
-            port_ifaces = [ iface for iface in interfaces if iface['_uuid'] == port_iface_uuid ]
-            if len(port_ifaces):
-                port_iface = port_ifaces[0]
+            # ports with multiple interfaces (bonds) list a set of uuids
+            if not isinstance(port_iface_uuid, str):
+                continue
+
+            port_iface = interfaces.get(port_iface_uuid)
+            if port_iface is not None:
                 filtered_ports[port['name']] = {
                         'interface': port_iface['name'],
                         'type': port_iface['type'],
@@ -175,13 +270,8 @@ class OvsBridgeDevice(SoftDevice):
 
     @property
     def tunnels(self):
-        tunnels = self.ports.copy()
-
-        for port in self.ports.keys():
-            if tunnels[port]['type'] in ['', 'internal']:
-                del tunnels[port]
-
-        return tunnels
+        return {port_name: port for port_name, port in self.ports.items()
+                if port['type'] not in ['', 'internal']}
 
     @property
     def bonds(self):
@@ -56,7 +56,8 @@ class BaseCPUMeasurement(BaseMeasurement):
                 (old.host is not new.host or old.cpu != new.cpu)):
             raise MeasurementError("Aggregating incompatible CPU Results")
 
-        new_result = AggregatedCPUMeasurementResults(self, new.host, new.cpu)
-        new_result.add_results(old)
-        new_result.add_results(new)
-        return new_result
+        if old is None:
+            old = AggregatedCPUMeasurementResults(self, new.host, new.cpu)
+
+        old.add_results(new)
+        return old
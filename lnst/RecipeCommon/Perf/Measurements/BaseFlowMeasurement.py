@@ -132,11 +132,11 @@ class BaseFlowMeasurement(BaseMeasurement):
         if old_flow is not None and old_flow.flow is not new_flow.flow:
             raise MeasurementError("Aggregating incompatible Flows")
 
-        new_result = AggregatedFlowMeasurementResults(measurement=self, flow=new_flow.flow)
+        if old_flow is None:
+            old_flow = AggregatedFlowMeasurementResults(measurement=self, flow=new_flow.flow)
 
-        new_result.add_results(old_flow)
-        new_result.add_results(new_flow)
-        return new_result
+        old_flow.add_results(new_flow)
+        return old_flow
 
     @staticmethod
     def aggregate_multi_flow_results(results):
@@ -214,23 +214,24 @@ class IperfFlowMeasurement(BaseFlowMeasurement):
         if not job.passed:
             result.append(SequentialPerfResult([PerfInterval(0, 1, "bits", time.time())]))
         else:
-            for i in job.result["data"]["end"]["streams"]:
-                result.append(SequentialPerfResult())
-
-            job_start = job.result["data"]["start"]["timestamp"]["timesecs"]
-            for interval in job.result["data"]["intervals"]:
-                interval_start = interval["sum"]["start"]
-                for i, stream in enumerate(interval["streams"]):
-                    result[i].append(PerfInterval(stream["bytes"] * 8,
-                                                  stream["seconds"],
-                                                  "bits", job_start + interval_start))
+            data = job.result["data"]
+            interval_starts = [data["timestamp"] + start
+                               for start in data["interval_starts"]]
+            for stream_bytes, stream_seconds in zip(data["stream_bytes"],
+                                                    data["stream_seconds"]):
+                result.append(SequentialPerfResult(
+                    [PerfInterval(nbytes * 8, seconds, "bits", start)
+                     for nbytes, seconds, start in zip(stream_bytes,
+                                                       stream_seconds,
+                                                       interval_starts)]))
         return result
 
     def _parse_job_cpu(self, job):
         if not job.passed:
             return PerfInterval(0, 1, "cpu_percent", time.time())
         else:
-            cpu_percent = job.result["data"]["end"]["cpu_utilization_percent"]["host_total"]
-            job_start = job.result["data"]["start"]["timestamp"]["timesecs"]
-            duration = job.result["data"]["start"]["test_start"]["duration"]
+            data = job.result["data"]
+            cpu_percent = data["cpu_utilization_percent"]
+            job_start = data["timestamp"]
+            duration = data["duration"]
             return PerfInterval(cpu_percent*duration, duration, "cpu_percent", job_start)
@@ -1,15 +1,17 @@
+import math
 import time
 import logging
-from typing import List, Dict, Tuple
+from array import array
+from typing import List, Dict, Tuple, Optional
 from lnst.Common.IpAddress import ipaddress
 from lnst.Controller.Job import Job
-from lnst.Common.Utils import pairwise
 from lnst.Controller.Recipe import RecipeError
 from lnst.Controller.RecipeResults import ResultLevel
 from lnst.RecipeCommon.Perf.Measurements.BaseFlowMeasurement import BaseFlowMeasurement, NetworkFlowTest, Flow
 from lnst.RecipeCommon.Perf.Measurements.Results.NeperFlowMeasurementResults import NeperFlowMeasurementResults
+from lnst.RecipeCommon.Perf.Measurements.Results.AggregatedNeperFlowMeasurementResults import AggregatedNeperFlowMeasurementResults
 from lnst.RecipeCommon.Perf.Measurements.MeasurementError import MeasurementError
-from lnst.RecipeCommon.Perf.Results import PerfInterval, SequentialPerfResult, ParallelPerfResult
+from lnst.RecipeCommon.Perf.Results import PerfInterval, SequentialPerfResult, ParallelPerfResult, SequentialPerfSeries
 from lnst.Tests.Neper import NeperServer, NeperClient
 
 
@@ -167,12 +169,14 @@ class NeperFlowMeasurement(BaseFlowMeasurement):
             generator_stats = self._parse_job_samples(test_flow.client_job)
             flow_results.generator_results = generator_stats[0]
             flow_results.generator_cpu_stats = generator_stats[1]
+            flow_results.generator_latency = generator_stats[2]
             self._host_versions[test_flow.flow.generator] = \
                 test_flow.client_job.result["data"]["VERSION"]
 
             receiver_stats = self._parse_job_samples(test_flow.server_job)
             flow_results.receiver_results = receiver_stats[0]
             flow_results.receiver_cpu_stats = receiver_stats[1]
+            flow_results.receiver_latency = receiver_stats[2]
             self._host_versions[test_flow.flow.receiver] = \
                 test_flow.server_job.result["data"]["VERSION"]
 
@@ -180,11 +184,25 @@ class NeperFlowMeasurement(BaseFlowMeasurement):
 
         return results
 
+    def _aggregate_flows(self, old_flow, new_flow):
+        if old_flow is not None and old_flow.flow is not new_flow.flow:
+            raise MeasurementError("Aggregating incompatible Flows")
+
+        if old_flow is None:
+            old_flow = AggregatedNeperFlowMeasurementResults(
+                measurement=self, flow=new_flow.flow
+            )
+
+        old_flow.add_results(new_flow)
+        return old_flow
+
     def _parse_job_samples(self, job: Job) ->\
-            Tuple[ParallelPerfResult, ParallelPerfResult]:
+            Tuple[ParallelPerfResult, ParallelPerfResult,
+                  Dict[str, ParallelPerfResult]]:
         """
-        each perfinterval is samples.csv line #2 (l2) - line #1 (l1) to get # transactions and duration
-        timestamp is time of l1, but we need to convert it from CLOCK_MONOTONIC time to unix time.
+        The neper module groups the samples.csv lines by the (tid, flow_id)
+        of the flow and sends back arrays of the intervals between the
+        consecutive samples of each flow, see NeperBase._parse_samples.
         samples.csv looks like this:
         ```
         tid,flow_id,time,transactions,utime,stime,maxrss,minflt,majflt,nvcsw,nivcsw,latency_min,latency_mean,latency_max,latency_stddev
@@ -193,70 +211,88 @@ class NeperFlowMeasurement(BaseFlowMeasurement):
         0,0,1898648.747757407,89210,0.281500,0.354934,1144,43,0,89207,0,0.000000,0.000000,0.000000,0.000000
         0,0,1898649.747737156,118790,0.281500,0.354934,1144,43,0,89207,0,0.000000,0.000000,0.000000,0.000000
         ```
+
+        Returns the transactions of every flow, the cpu usage of every
+        thread (utime and stime are per thread, so only the first flow of
+        each thread is used) and for each of the latency columns (min,
+        mean, max, stddev and the percentiles) the latency of every flow.
         :param job:
         :type job:
         :return:
         :rtype:
         """
 
-        results = SequentialPerfResult()
-        cpu_results = SequentialPerfResult()
+        results = ParallelPerfResult()
+        cpu_results = ParallelPerfResult()
+        latency_results = {}
 
         if not job.passed:
-            results.append(PerfInterval(0, 1, "transactions", time.time()))
-            cpu_results.append(PerfInterval(0, 1, "cpu_percent", time.time()))
+            results.append(_zero_result("transactions", 1))
+            cpu_results.append(_zero_result("cpu_percent", 1))
         elif job.what.is_crr_server():
             # Neper doesn't support server stats for tcp_crr due to memory issues.
             # Use perf_interval of 0.
             # For duration neper doesn't have time_start/time_end for tcp_crr
             # So just use the value of test length
             d = float(job.what.params.test_length)
-            results.append(PerfInterval(0, d, "transactions", time.time()))
-            cpu_results.append(PerfInterval(0, d, "cpu_percent", time.time()))
+            results.append(_zero_result("transactions", d))
+            cpu_results.append(_zero_result("cpu_percent", d))
         else:
-            job_start = job.result['start_time']
             samples = job.result['samples']
-            if samples is not None:
-                neper_start_time = float(samples[0]['time'])
-                for s_start, s_end in pairwise(samples):
-                    flow, cpu = get_interval(s_start, s_end,
-                                             job_start, neper_start_time)
-                    results.append(flow)
-                    cpu_results.append(cpu)
-
-        #Wrap in ParallelPerfResult for now for easier graphing
-        #TODO When we add support for multiple flows and threads
-        #We want to update this accordingly.
-        p_results = ParallelPerfResult()
-        p_results.append(results)
-        p_cpu_results = ParallelPerfResult()
-        p_cpu_results.append(cpu_results)
-        return p_results, p_cpu_results
-
-
-def get_interval(s_start: Dict, s_end: Dict, job_start: float,
-                 neper_start: float) -> Tuple[PerfInterval, PerfInterval]:
-
-    transactions = int(s_end['transactions']) - int(s_start['transactions'])
-    s_start_time = float(s_start['time'])
-    s_start_utime = float(s_start['utime'])
-    s_start_stime = float(s_start['stime'])
-
-    s_end_time = float(s_end['time'])
-    s_end_utime = float(s_end['utime'])
-    s_end_stime = float(s_end['stime'])
-
-    # cpu_usage_percent = (utime_delta + stime_delta) / duration
-    utime_delta = s_end_utime - s_start_utime
-    stime_delta = s_end_stime - s_start_stime
-
-    # neper uses CLOCK_MONOTONIC, need to convert to
-    # unix time using job_start as reference
-    timestamp = job_start + (s_start_time - neper_start)
-    duration = s_end_time - s_start_time
-    cpu_usage = ((utime_delta + stime_delta) / duration) * 100
-
-    interval = PerfInterval(transactions, duration, 'transactions', timestamp)
-    cpu_interval = PerfInterval(cpu_usage * duration, duration, 'cpu_percent', timestamp)
-
-    return interval, cpu_interval
+            flows = [flow for flow in samples["flows"] if flow["durations"]]
+
+            tids = set()
+            for flow in flows:
+                results.append(SequentialPerfSeries(flow["transactions"],
+                                                    flow["durations"],
+                                                    flow["timestamps"],
+                                                    "transactions"))
+
+                if flow["tid"] not in tids:
+                    tids.add(flow["tid"])
+                    # cpu_usage_percent = (utime_delta + stime_delta) / duration
+                    cpu_results.append(SequentialPerfSeries(
+                        array("d", (cpu * 100 for cpu in flow["cpu"])),
+                        flow["durations"],
+                        flow["timestamps"],
+                        "cpu_percent"))
+
+            for name in samples["latency_columns"]:
+                latency = ParallelPerfResult()
+                for flow in flows:
+                    series = _latency_series(flow, name)
+                    if series is not None:
+                        latency.append(series)
+                if latency:
+                    latency_results[name] = latency
+
+            if not flows:
+                results.append(_zero_result("transactions", 1))
+                cpu_results.append(_zero_result("cpu_percent", 1))
+
+        return results, cpu_results, latency_results
+
+
+def _zero_result(unit: str, duration: float) -> SequentialPerfResult:
+    return SequentialPerfResult([PerfInterval(0, duration, unit, time.time())])
+
+
+def _latency_series(flow: Dict, name: str) -> Optional[SequentialPerfSeries]:
+    # the interval value is latency * duration so that its average is the
+    # latency, samples without transactions have a nan latency and are left
+    # out
+    values = array("d")
+    durations = array("d")
+    timestamps = array("d")
+    for latency, duration, timestamp in zip(flow["latency"][name],
+                                            flow["durations"],
+                                            flow["timestamps"]):
+        if math.isnan(latency):
+            continue
+        values.append(latency * duration)
+        durations.append(duration)
+        timestamps.append(timestamp)
+
+    if not values:
+        return None
+    return SequentialPerfSeries(values, durations, timestamps, "seconds")
@@ -1,4 +1,4 @@
-from lnst.RecipeCommon.Perf.Results import SequentialPerfResult
+from lnst.RecipeCommon.Perf.Results import AccumulatedPerfResult
 from lnst.RecipeCommon.Perf.Measurements.Results.CPUMeasurementResults import CPUMeasurementResults
 from lnst.RecipeCommon.Perf.Measurements.MeasurementError import MeasurementError
 
@@ -7,6 +7,7 @@ class AggregatedCPUMeasurementResults(CPUMeasurementResults):
     def __init__(self, measurement, host, cpu):
         super(AggregatedCPUMeasurementResults, self).__init__(measurement, True, host, cpu)
         self._individual_results = []
+        self._utilization = AccumulatedPerfResult()
 
     @property
     def measurement_success(self) -> bool:
@@ -21,15 +22,16 @@ class AggregatedCPUMeasurementResults(CPUMeasurementResults):
 
     @property
     def utilization(self):
-        return SequentialPerfResult([i.utilization
-                                     for i in self.individual_results])
+        return self._utilization
 
     def add_results(self, results):
         if results is None:
             return
         elif isinstance(results, AggregatedCPUMeasurementResults):
             self.individual_results.extend(results.individual_results)
+            self._utilization.extend(results.utilization)
         elif isinstance(results, CPUMeasurementResults):
             self.individual_results.append(results)
+            self._utilization.append(results.utilization)
         else:
             raise MeasurementError("Adding incorrect results.")
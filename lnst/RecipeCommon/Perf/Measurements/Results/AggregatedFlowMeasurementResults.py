@@ -1,4 +1,4 @@
-from lnst.RecipeCommon.Perf.Results import SequentialPerfResult
+from lnst.RecipeCommon.Perf.Results import AccumulatedPerfResult
 from lnst.RecipeCommon.Perf.Measurements.Results.FlowMeasurementResults import FlowMeasurementResults
 from lnst.RecipeCommon.Perf.Measurements.MeasurementError import MeasurementError
 
@@ -7,10 +7,10 @@ class AggregatedFlowMeasurementResults(FlowMeasurementResults):
     def __init__(self, measurement, flow):
         super(FlowMeasurementResults, self).__init__(measurement, True)
         self._flow = flow
-        self._generator_results = SequentialPerfResult()
-        self._generator_cpu_stats = SequentialPerfResult()
-        self._receiver_results = SequentialPerfResult()
-        self._receiver_cpu_stats = SequentialPerfResult()
+        self._generator_results = AccumulatedPerfResult()
+        self._generator_cpu_stats = AccumulatedPerfResult()
+        self._receiver_results = AccumulatedPerfResult()
+        self._receiver_cpu_stats = AccumulatedPerfResult()
         self._individual_results = []
 
     @property
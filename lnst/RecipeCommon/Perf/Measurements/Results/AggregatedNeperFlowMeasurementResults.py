@@ -0,0 +1,46 @@
+from lnst.RecipeCommon.Perf.Results import ParallelPerfResult
+from lnst.RecipeCommon.Perf.Measurements.Results.AggregatedFlowMeasurementResults import AggregatedFlowMeasurementResults
+from lnst.RecipeCommon.Perf.Measurements.Results.NeperFlowMeasurementResults import (
+    NeperFlowMeasurementResults,
+    describe_latency,
+)
+
+
+class AggregatedNeperFlowMeasurementResults(AggregatedFlowMeasurementResults):
+    def __init__(self, measurement, flow):
+        super().__init__(measurement, flow)
+        self._generator_latency = {}
+        self._receiver_latency = {}
+
+    @property
+    def generator_latency(self) -> dict[str, list[ParallelPerfResult]]:
+        """latency of every flow by the neper latency column, one
+        ParallelPerfResult per iteration"""
+        return self._generator_latency
+
+    @property
+    def receiver_latency(self) -> dict[str, list[ParallelPerfResult]]:
+        return self._receiver_latency
+
+    def add_results(self, results):
+        super().add_results(results)
+
+        if isinstance(results, AggregatedNeperFlowMeasurementResults):
+            for own, other in ((self.generator_latency, results.generator_latency),
+                               (self.receiver_latency, results.receiver_latency)):
+                for name, iterations in other.items():
+                    own.setdefault(name, []).extend(iterations)
+        elif isinstance(results, NeperFlowMeasurementResults):
+            for own, other in ((self.generator_latency, results.generator_latency),
+                               (self.receiver_latency, results.receiver_latency)):
+                for name, latency in other.items():
+                    own.setdefault(name, []).append(latency)
+
+    def describe(self):
+        desc = [super().describe()]
+        for side, latencies in (("Generator", self.generator_latency),
+                                ("Receiver", self.receiver_latency)):
+            for name, iterations in latencies.items():
+                flows = [flow for latency in iterations for flow in latency]
+                desc.append(describe_latency(side, name, flows))
+        return "\n".join(desc)
@@ -1,12 +1,14 @@
 from lnst.RecipeCommon.Perf.Measurements.BaseMeasurement import BaseMeasurement
 from lnst.RecipeCommon.Perf.Measurements.Results.RDMABandwidthMeasurementResults import RDMABandwidthMeasurementResults
 from lnst.RecipeCommon.Perf.Results import SequentialPerfResult
+from lnst.RecipeCommon.Perf.Results import AccumulatedPerfResult
 
 
 class AggregatedRDMABandwidthMeasurementResults(RDMABandwidthMeasurementResults):
     def __init__(self, measurement: BaseMeasurement, flow: "Flow"):
         super().__init__(measurement, True, flow)
         self._individual_results = []
+        self._bandwidth = AccumulatedPerfResult()
 
     @property
     def measurement_success(self) -> bool:
@@ -21,7 +23,8 @@ class AggregatedRDMABandwidthMeasurementResults(RDMABandwidthMeasurementResults)
 
     @property
     def bandwidth(self) -> SequentialPerfResult:
-        return SequentialPerfResult([result.bandwidth for result in self.individual_results])
+        return self._bandwidth
 
     def add_results(self, result: RDMABandwidthMeasurementResults) -> None:
         self._individual_results.append(result)
+        self._bandwidth.append(result.bandwidth)
@@ -5,6 +5,7 @@ from lnst.Devices import Device
 from lnst.RecipeCommon.Perf.Measurements.MeasurementError import MeasurementError
 from lnst.RecipeCommon.Perf.Measurements.Results.TcRunMeasurementResults import TcRunMeasurementResults
 from lnst.RecipeCommon.Perf.Results import SequentialPerfResult
+from lnst.RecipeCommon.Perf.Results import AccumulatedPerfResult
 
 
 class AggregatedTcRunMeasurementResults(TcRunMeasurementResults):
@@ -17,7 +18,7 @@ class AggregatedTcRunMeasurementResults(TcRunMeasurementResults):
     ):
         super().__init__(measurement, True, device, warmup_rules=warmup_rules)
         self._individual_results: list[TcRunMeasurementResults] = []
-        self._rule_install_rate: SequentialPerfResult = SequentialPerfResult()
+        self._rule_install_rate: SequentialPerfResult = AccumulatedPerfResult()
 
     @property
     def measurement_success(self) -> bool:
@@ -2,15 +2,15 @@ from lnst.RecipeCommon.Perf.Measurements.Results.XDPBenchMeasurementResults impo
     XDPBenchMeasurementResults,
 )
 from lnst.RecipeCommon.Perf.Measurements.MeasurementError import MeasurementError
-from lnst.RecipeCommon.Perf.Results import SequentialPerfResult
+from lnst.RecipeCommon.Perf.Results import AccumulatedPerfResult
 
 
 class AggregatedXDPBenchMeasurementResults(XDPBenchMeasurementResults):
     def __init__(self, measurement, flow):
         super().__init__(measurement, True, flow)
         self._individual_results: list[TcRunMeasurementResults] = []
-        self._generator_results = SequentialPerfResult()
-        self._receiver_results = SequentialPerfResult()
+        self._generator_results = AccumulatedPerfResult()
+        self._receiver_results = AccumulatedPerfResult()
 
     @property
     def individual_results(self) -> list[XDPBenchMeasurementResults]:
@@ -1,7 +1,59 @@
+from lnst.RecipeCommon.Perf.Results import ParallelPerfResult, EmptySlice
 from lnst.RecipeCommon.Perf.Measurements.BaseFlowMeasurement import FlowMeasurementResults
 
 
 class NeperFlowMeasurementResults(FlowMeasurementResults):
+    def __init__(self, measurement, measurement_success, flow, warmup_duration=0):
+        super().__init__(measurement, measurement_success, flow, warmup_duration)
+        self._generator_latency = {}
+        self._receiver_latency = {}
+
+    @property
+    def generator_latency(self) -> dict[str, ParallelPerfResult]:
+        """latency of every flow by the neper latency column (min, mean,
+        max, stddev, percentiles)"""
+        return self._generator_latency
+
+    @generator_latency.setter
+    def generator_latency(self, value):
+        self._generator_latency = value
+
+    @property
+    def receiver_latency(self) -> dict[str, ParallelPerfResult]:
+        return self._receiver_latency
+
+    @receiver_latency.setter
+    def receiver_latency(self, value):
+        self._receiver_latency = value
+
+    def time_slice(self, start, end):
+        flow_slice = super().time_slice(start, end)
+
+        result_copy = NeperFlowMeasurementResults(
+            self.measurement, self.measurement_success, self.flow, warmup_duration=0
+        )
+        result_copy.generator_results = flow_slice.generator_results
+        result_copy.generator_cpu_stats = flow_slice.generator_cpu_stats
+        result_copy.receiver_results = flow_slice.receiver_results
+        result_copy.receiver_cpu_stats = flow_slice.receiver_cpu_stats
+
+        result_copy.generator_latency = _latency_slice(
+            self.generator_latency, start, end
+        )
+        result_copy.receiver_latency = _latency_slice(
+            self.receiver_latency, start, end
+        )
+
+        return result_copy
+
+    def describe(self):
+        desc = [super().describe()]
+        for side, latencies in (("Generator", self.generator_latency),
+                                ("Receiver", self.receiver_latency)):
+            for name, latency in latencies.items():
+                desc.append(describe_latency(side, name, latency))
+        return "\n".join(desc)
+
     @property
     def warmup_end(self):
         if self.flow.type != "tcp_crr":
@@ -31,3 +83,29 @@ class NeperFlowMeasurementResults(FlowMeasurementResults):
                 for parallel in self.generator_results
             ]
         )
+
+
+def _latency_slice(latencies, start, end):
+    """Slices every latency column, the columns without any sample in the
+    slice are left out"""
+    result = {}
+    for name, latency in latencies.items():
+        try:
+            result[name] = latency.time_slice(start, end)
+        except EmptySlice:
+            continue
+    return result
+
+
+def describe_latency(side, name, flows):
+    flow_latencies = [flow.average for flow in flows]
+    return (
+        "{side} latency {name}: {avg:.6f} seconds average over "
+        "{flows} flows, highest {highest:.6f} seconds.".format(
+            side=side,
+            name=name,
+            avg=sum(flow_latencies) / len(flow_latencies),
+            flows=len(flow_latencies),
+            highest=max(flow_latencies),
+        )
+    )
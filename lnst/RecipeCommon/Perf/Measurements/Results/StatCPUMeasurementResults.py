@@ -14,6 +14,9 @@ class StatCPUMeasurementResults(CPUMeasurementResults):
                 self._data[key] = SequentialPerfResult()
             self._data[key].append(interval)
 
+    def set_series(self, cpu_state, series):
+        self._data[cpu_state] = series
+
     @property
     def utilization(self):
         return ParallelPerfResult([self._data["user"], self._data["nice"],
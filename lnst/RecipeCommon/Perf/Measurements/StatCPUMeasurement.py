@@ -1,7 +1,7 @@
 import signal
 
 from lnst.Controller.RecipeResults import ResultLevel
-from lnst.RecipeCommon.Perf.Results import PerfInterval
+from lnst.RecipeCommon.Perf.Results import SequentialPerfSeries
 from lnst.RecipeCommon.Perf.Measurements.BaseCPUMeasurement import BaseCPUMeasurement
 from lnst.RecipeCommon.Perf.Measurements.Results import StatCPUMeasurementResults
 
@@ -58,34 +58,29 @@ class StatCPUMeasurement(BaseCPUMeasurement):
 
     def _process_job(self, job):
         host = job.host
-        job_results = {}
-        for sample in job.result["data"]:
-            parsed_sample = self._parse_sample(sample)
-
-            for cpu, cpu_intervals in list(parsed_sample.items()):
-                if cpu not in job_results:
-                    job_results[cpu] = StatCPUMeasurementResults(
-                        measurement=self,
-                        measurement_success=job.passed,
-                        host=host,
-                        cpu=cpu
-                    )
-                cpu_results = job_results[cpu]
-                cpu_results.update_intervals(cpu_intervals)
-
-        return list(job_results.values())
-
-    def _parse_sample(self, sample):
-        result = {}
-        duration = sample["duration"]
-        timestamp = sample["timestamp"]
-        for key, value in list(sample.items()):
-            if key.startswith("cpu"):
-                result[key] = self._create_cpu_intervals(duration, value, timestamp)
-        return result
-
-    def _create_cpu_intervals(self, duration, cpu_intervals, timestamp):
-        result = {}
-        for key, value in list(cpu_intervals.items()):
-            result[key] = PerfInterval(value, duration, "time units", timestamp)
-        return result
+        data = job.result["data"]
+        samples = len(data["timestamps"])
+        if samples == 0:
+            # a single sample of the counters gives no intervals
+            return []
+        fields = data["fields"]
+
+        job_results = []
+        for i, cpu in enumerate(data["cpus"]):
+            cpu_results = StatCPUMeasurementResults(
+                measurement=self,
+                measurement_success=job.passed,
+                host=host,
+                cpu=cpu
+            )
+            for j, field in enumerate(fields):
+                offset = (i * len(fields) + j) * samples
+                cpu_results.set_series(field, SequentialPerfSeries(
+                    data["values"][offset:offset + samples],
+                    data["durations"],
+                    data["timestamps"],
+                    "time units",
+                ))
+            job_results.append(cpu_results)
+
+        return job_results
@@ -272,10 +272,11 @@ class TcRunMeasurement(BaseMeasurement):
         if old is not None and (old.device is not new.device):
             raise MeasurementError("Aggregating incompatible Device Results")
 
-        new_result = AggregatedTcRunMeasurementResults(
-            measurement=new.measurement,
-            device=new.device,
-        )
-        new_result.add_results(old)
-        new_result.add_results(new)
-        return new_result
+        if old is None:
+            old = AggregatedTcRunMeasurementResults(
+                measurement=new.measurement,
+                device=new.device,
+            )
+
+        old.add_results(new)
+        return old
@@ -251,13 +251,13 @@ class XDPBenchMeasurement(BaseFlowMeasurement):
         if old_flow is not None and old_flow.flow is not new_flow.flow:
             raise MeasurementError("Aggregating incompatible Flows")
 
-        new_result = AggregatedXDPBenchMeasurementResults(
-            measurement=self, flow=new_flow.flow
-        )
+        if old_flow is None:
+            old_flow = AggregatedXDPBenchMeasurementResults(
+                measurement=self, flow=new_flow.flow
+            )
 
-        new_result.add_results(old_flow)
-        new_result.add_results(new_flow)
-        return new_result
+        old_flow.add_results(new_flow)
+        return old_flow
 
     @classmethod
     def report_results(cls, recipe: BaseRecipe, results: list[AggregatedXDPBenchMeasurementResults]):
@@ -1,3 +1,7 @@
+import weakref
+import functools
+from array import array
+from bisect import bisect_left, bisect_right
 from lnst.Common.LnstError import LnstError
 from lnst.Common.Utils import std_deviation
 
@@ -89,7 +93,116 @@ class PerfInterval(PerfResult):
         new_value = self.value * (new_duration/self.duration)
         return PerfInterval(new_value, new_duration, self.unit, new_start)
 
+class SequentialPerfSeries(PerfResult):
+    """Sequence of consecutive intervals stored in packed arrays
+
+    Behaves like a SequentialPerfResult of PerfIntervals without creating an
+    object per interval, used for long running measurements with many
+    samples. The timestamps and durations arrays can be shared by several
+    series with the same sampling, they aren't modified.
+    """
+    def __init__(self, values, durations, timestamps, unit):
+        if not len(values) == len(durations) == len(timestamps):
+            raise LnstError("{} arrays must have the same length."
+                            .format(self.__class__.__name__))
+        self._values = values
+        self._durations = durations
+        self._timestamps = timestamps
+        self._unit = unit
+
+    @property
+    def value(self):
+        return sum(self._values)
+
+    @property
+    def duration(self):
+        return sum(self._durations)
+
+    @property
+    def unit(self):
+        return self._unit
+
+    @property
+    def start_timestamp(self):
+        return self._timestamps[0]
+
+    @property
+    def end_timestamp(self):
+        return self._timestamps[-1] + self._durations[-1]
+
+    @property
+    def std_deviation(self):
+        averages = []
+        for value, duration in zip(self._values, self._durations):
+            try:
+                averages.append(float(value) / duration)
+            except ZeroDivisionError:
+                averages.append(float('inf') if value >= 0 else float('-inf'))
+        return std_deviation(averages)
+
+    def __len__(self):
+        return len(self._values)
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return self.__class__(self._values[i], self._durations[i],
+                                  self._timestamps[i], self._unit)
+        return PerfInterval(self._values[i], self._durations[i], self._unit,
+                            self._timestamps[i])
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self[i]
+
+    def time_slice(self, start, end):
+        first = max(bisect_right(self._timestamps, start) - 1, 0)
+        if (first < len(self) and
+                self._timestamps[first] + self._durations[first] <= start):
+            first += 1
+        last = bisect_left(self._timestamps, end)
+
+        if first >= last:
+            raise EmptySlice(
+                "current start, end {} {}; request start, end {}, {}".format(
+                    self.start_timestamp if len(self) else None,
+                    self.end_timestamp if len(self) else None, start, end,
+                )
+            )
+
+        values = array("d", self._values[first:last])
+        durations = array("d", self._durations[first:last])
+        timestamps = array("d", self._timestamps[first:last])
+        for i in {0, len(values) - 1}:
+            interval = PerfInterval(values[i], durations[i], self._unit,
+                                    timestamps[i]).time_slice(start, end)
+            values[i] = interval.value
+            durations[i] = interval.duration
+            timestamps[i] = interval.start_timestamp
+
+        return self.__class__(values, durations, timestamps, self._unit)
+
+def _memoized(func):
+    """Property cached by a PerfList until the list or its items change"""
+    name = func.__name__
+
+    @functools.wraps(func)
+    def wrapper(self):
+        cache = self._perf_cache()
+        try:
+            return cache[name]
+        except KeyError:
+            value = cache[name] = func(self)
+            return value
+    return property(wrapper)
+
 class PerfList(list):
+    """List of PerfIntervals or nested PerfLists
+
+    Derived values of the subclasses (value, duration, timestamps, ...) are
+    memoised. Any modification of the list, or of a PerfList nested in it,
+    invalidates the memoised values, so items shouldn't be modified by other
+    means than the list methods.
+    """
     def __init__(self, iterable=[]):
         for i, item in enumerate(iterable):
             self._validate_item_type(item)
@@ -101,6 +214,42 @@ class PerfList(list):
                 raise LnstError("PerfList items must have the same unit.")
 
         super(PerfList, self).__init__(iterable)
+        self._items_added(self)
+
+    def __getstate__(self):
+        state = dict(self.__dict__)
+        state.pop("_cache", None)
+        state.pop("_parents", None)
+        return state
+
+    def _perf_cache(self):
+        # created lazily, unpickling adds items before restoring attributes
+        try:
+            return self.__dict__["_cache"]
+        except KeyError:
+            return self.__dict__.setdefault("_cache", {})
+
+    def _perf_parents(self):
+        # weak references, lists aren't hashable so a WeakSet can't be used
+        try:
+            return self.__dict__["_parents"]
+        except KeyError:
+            return self.__dict__.setdefault("_parents", [])
+
+    def _invalidate(self):
+        self._perf_cache().clear()
+        for parent_ref in self._perf_parents():
+            parent = parent_ref()
+            if parent is not None:
+                parent._invalidate()
+
+    def _items_added(self, items):
+        for item in items:
+            if isinstance(item, PerfList):
+                parents = item._perf_parents()
+                if not any(parent_ref() is self for parent_ref in parents):
+                    parents.append(weakref.ref(self))
+        self._invalidate()
 
     def _validate_item(self, item):
         self._validate_item_type(item)
@@ -110,37 +259,41 @@ class PerfList(list):
 
     def _validate_item_type(self, item):
         if (not isinstance(item, PerfInterval) and
-            not isinstance(item, PerfList)):
-            raise LnstError("{} only accepts PerfInterval or PerfList objects."
+            not isinstance(item, PerfList) and
+            not isinstance(item, SequentialPerfSeries)):
+            raise LnstError("{} only accepts PerfInterval, PerfList or "
+                            "SequentialPerfSeries objects."
                             .format(self.__class__.__name__))
 
     def append(self, item):
         self._validate_item(item)
 
         super(PerfList, self).append(item)
+        self._items_added([item])
 
     def extend(self, iterable):
+        iterable = list(iterable)
         for i in iterable:
             self._validate_item(i)
 
         super(PerfList, self).extend(iterable)
+        self._items_added(iterable)
 
     def insert(self, index, item):
         self._validate_item(item)
 
         super(PerfList, self).insert(index, item)
+        self._items_added([item])
 
     def __add__(self, iterable):
         for i in iterable:
             self._validate_item(i)
 
-        super(PerfList, self).__add__(iterable)
+        return self.__class__(super(PerfList, self).__add__(iterable))
 
     def __iadd__(self, iterable):
-        for i in iterable:
-            self._validate_item(i)
-
-        super(PerfList, self).__iadd__(iterable)
+        self.extend(iterable)
+        return self
 
     def __setitem__(self, i, item):
         if isinstance(item, list):
@@ -150,10 +303,38 @@ class PerfList(list):
 
             for j in item:
                 self._validate_item(j)
+            added = item
         else:
             self._validate_item(item)
+            added = [item]
 
         super(PerfList, self).__setitem__(i, item)
+        self._items_added(added)
+
+    def __delitem__(self, i):
+        super(PerfList, self).__delitem__(i)
+        self._invalidate()
+
+    def pop(self, *args):
+        item = super(PerfList, self).pop(*args)
+        self._invalidate()
+        return item
+
+    def remove(self, item):
+        super(PerfList, self).remove(item)
+        self._invalidate()
+
+    def clear(self):
+        super(PerfList, self).clear()
+        self._invalidate()
+
+    def sort(self, *args, **kwargs):
+        super(PerfList, self).sort(*args, **kwargs)
+        self._invalidate()
+
+    def reverse(self):
+        super(PerfList, self).reverse()
+        self._invalidate()
 
     def time_slice(self, start, end):
         result = self.__class__()
@@ -172,11 +353,11 @@ class PerfList(list):
         return result
 
 class SequentialPerfResult(PerfList, PerfResult):
-    @property
+    @_memoized
     def value(self):
         return sum([i.value for i in self])
 
-    @property
+    @_memoized
     def duration(self):
         return sum([i.duration for i in self])
 
@@ -187,24 +368,137 @@ class SequentialPerfResult(PerfList, PerfResult):
         else:
             return None
 
-    @property
+    @_memoized
     def start_timestamp(self):
         return self[0].start_timestamp
 
-    @property
+    @_memoized
     def end_timestamp(self):
         return self[-1].end_timestamp
 
-class ParallelPerfResult(PerfList, PerfResult):
+    @_memoized
+    def average(self):
+        return PerfResult.average.fget(self)
+
+    @_memoized
+    def std_deviation(self):
+        return PerfResult.std_deviation.fget(self)
+
+    @_memoized
+    def _columns(self):
+        """Start and end timestamp columns of a sequence of PerfIntervals
+
+        None if the items aren't PerfIntervals or if they aren't ordered.
+        """
+        if not all(type(item) is PerfInterval for item in self):
+            return None
+
+        starts = [item._timestamp for item in self]
+        ends = [item._timestamp + item._duration for item in self]
+        if any(a > b for a, b in zip(starts, starts[1:])) or \
+           any(a > b for a, b in zip(ends, ends[1:])):
+            return None
+        return starts, ends
+
+    def time_slice(self, start, end):
+        columns = self._columns
+        if not columns:
+            return super(SequentialPerfResult, self).time_slice(start, end)
+
+        starts, ends = columns
+        # intervals ending after start up to the first starting at end
+        first = bisect_right(ends, start)
+        last = bisect_left(starts, end)
+        if first >= last:
+            raise EmptySlice(
+                "current start, end {} {}; request start, end {}, {}".format(
+                    self.start_timestamp, self.end_timestamp, start, end,
+                )
+            )
+
+        items = self[first:last]
+        items[0] = items[0].time_slice(start, end)
+        items[-1] = items[-1].time_slice(start, end)
+
+        result = self.__class__()
+        result.extend(items)
+        return result
+
+class AccumulatedPerfResult(SequentialPerfResult):
+    """Append-only SequentialPerfResult with running statistics
+
+    Used to aggregate the results of measurement iterations. The value,
+    duration and average of each item are computed once when it's appended
+    and the aggregated value, duration, average and std_deviation are kept
+    up to date (using Welford's algorithm for the variance), so they're
+    available in O(1) no matter how many iterations were added. Items must
+    not be modified after they're appended.
+    """
+    def __init__(self, iterable=[]):
+        super(AccumulatedPerfResult, self).__init__()
+        self._value_sum = 0
+        self._duration_sum = 0
+        self._averages_mean = 0.0
+        self._averages_m2 = 0.0
+        self.extend(iterable)
+
+    def __reduce_ex__(self, protocol):
+        # the running statistics are recomputed instead of relying on the
+        # default list subclass pickling which appends items before the
+        # instance attributes are restored
+        return self.__class__, (list(self),)
+
+    def append(self, item):
+        super(AccumulatedPerfResult, self).append(item)
+
+        self._value_sum += item.value
+        self._duration_sum += item.duration
+
+        delta = item.average - self._averages_mean
+        self._averages_mean += delta / len(self)
+        self._averages_m2 += delta * (item.average - self._averages_mean)
+
+    def extend(self, iterable):
+        for item in iterable:
+            self.append(item)
+
+    def _append_only(self, *args, **kwargs):
+        raise LnstError("{} only supports appending items."
+                        .format(self.__class__.__name__))
+
+    insert = _append_only
+    __setitem__ = _append_only
+    __delitem__ = _append_only
+    __add__ = _append_only
+    __iadd__ = _append_only
+    pop = _append_only
+    remove = _append_only
+    clear = _append_only
+    sort = _append_only
+    reverse = _append_only
+
     @property
     def value(self):
-        return sum([i.value for i in self])
+        return self._value_sum
 
     @property
     def duration(self):
-        min_start = min([item.start_timestamp for item in self])
-        max_end = max([item.end_timestamp for item in self])
-        return max_end - min_start
+        return self._duration_sum
+
+    @property
+    def std_deviation(self):
+        if len(self) <= 1:
+            return 0.0
+        return (self._averages_m2 / (len(self) - 1)) ** 0.5
+
+class ParallelPerfResult(PerfList, PerfResult):
+    @_memoized
+    def value(self):
+        return sum([i.value for i in self])
+
+    @_memoized
+    def duration(self):
+        return self.end_timestamp - self.start_timestamp
 
     @property
     def unit(self):
@@ -213,14 +507,22 @@ class ParallelPerfResult(PerfList, PerfResult):
         else:
             return None
 
-    @property
+    @_memoized
     def start_timestamp(self):
         return min([i.start_timestamp for i in self])
 
-    @property
+    @_memoized
     def end_timestamp(self):
         return max([i.end_timestamp for i in self])
 
+    @_memoized
+    def average(self):
+        return PerfResult.average.fget(self)
+
+    @_memoized
+    def std_deviation(self):
+        return PerfResult.std_deviation.fget(self)
+
 def result_averages_difference(a, b):
     if a is None or b is None:
         return None
@@ -9,6 +9,7 @@ def pin_dev_interrupts(dev, cpus, policy=None):
 
     intrs = get_dev_interrupts(dev)
 
+    writes = []
     for i, intr in enumerate(intrs):
         try:
             if policy in [ "round-robin", None ]:
@@ -16,12 +17,13 @@ def pin_dev_interrupts(dev, cpus, policy=None):
             elif policy == "all":
                 cpu = ",".join([str(cpu) for cpu in cpus])
 
-            netns.run(
-                "echo -n {} > /proc/irq/{}/smp_affinity_list".format(cpu, intr)
-            )
+            writes.append(("/proc/irq/{}/smp_affinity_list".format(intr), cpu))
         except ValueError:
             pass
 
+    if writes:
+        netns.run_batch(writes)
+
 def check_cpu_validity(host, cpus):
     cpu_info = host.run("lscpu", job_level=ResultLevel.DEBUG).stdout
     regex = r"CPU\(s\): *([0-9]*)"
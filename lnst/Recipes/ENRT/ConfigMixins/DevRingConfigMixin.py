@@ -1,4 +1,4 @@
-from json import loads
+from lnst.Common.DeviceError import DeviceError
 from lnst.Common.Parameters import DictParam
 from lnst.Recipes.ENRT.ConfigMixins.BaseHWConfigMixin import BaseHWConfigMixin
 
@@ -27,6 +27,8 @@ class DevRingConfigMixin(BaseHWConfigMixin):
             },
         }
 
+    A device whose ring settings can't be read or set is reported as a
+    failed result and the recipe continues, like a failed ethtool job.
     """
     dev_ring_config = DictParam(mandatory=False)
 
@@ -43,23 +45,30 @@ class DevRingConfigMixin(BaseHWConfigMixin):
         device_settings = self._parse_device_settings(self.params.dev_ring_config)
         for device, ring_configs in device_settings.items():
             # Get original ring config
-            ethtool_job = device.host.run(f"ethtool --json -g {device.name}")
-            original_config = process_ring_settings_output(
-                ethtool_job.stdout, [configured for configured in ring_configs.keys()]
-            )
+            try:
+                ring_settings = device.ring_settings
+            except DeviceError as e:
+                self.add_result(
+                    False, f"Failed to get ring settings of {device.name}: {e}"
+                )
+                continue
+
+            original_config = {
+                configured: ring_settings[configured]
+                for configured in ring_configs.keys()
+            }
 
             hw_config["dev_ring_config"][device] = {
                 "original": original_config,
             }
 
             # Set ring settings
-            device.host.run(
-                f"ethtool -G {device.name} "
-                + " ".join(
-                    ring_cfg_name + " " + str(ring_cfg_value)
-                    for ring_cfg_name, ring_cfg_value in ring_configs.items()
+            try:
+                device.set_ring_settings(ring_configs)
+            except DeviceError as e:
+                self.add_result(
+                    False, f"Failed to set ring settings of {device.name}: {e}"
                 )
-            )
 
             hw_config["dev_ring_config"][device]["configured"] = ring_configs
 
@@ -69,14 +78,18 @@ class DevRingConfigMixin(BaseHWConfigMixin):
         for dev, dev_ring_config in dev_ring_config.items():
             configured_config = dev_ring_config.get("configured", {})
             original_config = dev_ring_config.get("original", {})
-            dev.host.run(
-                f"ethtool -G {dev.name} "
-                + " ".join(
-                    ring_cfg_name + " " + str(ring_cfg_value)
-                    for ring_cfg_name, ring_cfg_value in original_config.items()
-                    if ring_cfg_name in configured_config
+            try:
+                dev.set_ring_settings(
+                    {
+                        ring_cfg_name: ring_cfg_value
+                        for ring_cfg_name, ring_cfg_value in original_config.items()
+                        if ring_cfg_name in configured_config
+                    }
+                )
+            except DeviceError as e:
+                self.add_result(
+                    False, f"Failed to restore ring settings of {dev.name}: {e}"
                 )
-            )
 
         super().hw_deconfig(config)
 
@@ -101,22 +114,3 @@ class DevRingConfigMixin(BaseHWConfigMixin):
 
         return desc
 
-
-def process_ring_settings_output(output, configured_keys):
-    # $ ethtool --json -g enp0s31f6
-    # [ {
-    #         "ifname": "enp0s31f6",
-    #         "rx-max": 4096,
-    #         "tx-max": 4096,
-    #         "rx": 256,
-    #         "tx": 256,
-    #         "tx-push": false,
-    #         "rx-push": false
-    # } ]
-
-    output = loads(output)[0]  # just single inf
-    result = {}
-    for key in configured_keys:
-        result[key] = output[key]
-
-    return result
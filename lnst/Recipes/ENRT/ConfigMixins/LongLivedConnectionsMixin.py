@@ -71,11 +71,14 @@ class LongLivedConnectionsMixin(BasePerfTestTweakMixin):
                 ipv4 = next(ipv4_addr)
                 ipv6 = next(ipv6_addr)
 
-                host.eth0.ip_add(ipv4)
-                host.eth0.ip_add(ipv6)
                 config.long_lived_ips[host]["ipv4"].append(ipv4)
                 config.long_lived_ips[host]["ipv6"].append(ipv6)
 
+            host.eth0.ip_add_bulk(
+                [(ip, None) for ip in config.long_lived_ips[host]["ipv4"] +
+                 config.long_lived_ips[host]["ipv6"]]
+            )
+
         host1.eth0.up()
         host2.eth0.up()
 
@@ -1,118 +1,114 @@
-import re
-import time
 import signal
-from time import sleep
+import operator
+from array import array
 from lnst.Common.Parameters import IntParam
+from lnst.Common.Sampler import Sampler, FileSource
 from lnst.Tests.BaseTestModule import BaseTestModule, InterruptException
 
+# columns of the cpu lines in /proc/stat
+CPU_STAT_FIELDS = ["user", "nice", "system", "idle", "iowait", "irq",
+                   "softirq", "steal", "guest", "guest_nice"]
+
 def sigint_handler(signum, frame):
     raise InterruptException()
 
 class CPUStatMonitor(BaseTestModule):
+    """Samples the cpu lines of /proc/stat
+
+    The result data contains the list of cpus, the fields and the sampling
+    timestamps, durations and jitter. The counter deltas are stored in a
+    single packed "values" array of shape cpus x fields x samples, so the
+    series of one field of one cpu is contiguous.
+    """
     #number of miliseconds to sleep between each sample
     interval = IntParam(default=1000)
 
     def run(self):
         self._res_data = {}
 
-        raw_samples = []
+        self._cpus = None
+        self._previous = None
+        sampler = Sampler(interval=self.params.interval / float(1000))
+        source = sampler.add_source(FileSource("/proc/stat",
+                                               self._parse_stat))
         old_handler = None
         try:
             old_handler = signal.signal(signal.SIGINT, sigint_handler)
-            with open("/proc/stat") as stat:
-                while True:
-                    stat.seek(0)
-                    timestamp = time.time()
-                    stat_lines = "".join(
-                        [l for l in stat.readlines() if l.startswith('cpu')]
-                    )
-                    raw_samples.append({
-                        "timestamp": timestamp,
-                        "stat": stat_lines
-                        })
-                    sleep(self.params.interval / float(1000))
+            sampler.run()
         except InterruptException:
             pass
         finally:
             if old_handler is not None:
                 signal.signal(signal.SIGINT, old_handler)
 
-        self._res_data["raw_data"] = raw_samples
-        self._res_data["data"] = self._process_samples(raw_samples)
-
-        return True
+        # the interrupt may come in the middle of recording a sample
+        cpus = self._cpus or []
+        row = len(cpus) * len(CPU_STAT_FIELDS)
+        samples = min(len(source.timestamps), len(source.jitter))
+        if row:
+            samples = min(samples, len(source.values) // row)
 
-    def _process_samples(self, samples):
-        result = []
-        prev_sample = samples[0]
-        for sample in samples[1:]:
-            parsed_prev = self._parse_stat_lines(prev_sample["stat"])
-            parsed_cur = self._parse_stat_lines(sample["stat"])
+        self._res_data["data"] = self._process_samples(
+            cpus, source.timestamps[:samples], source.values[:samples * row])
+        self._res_data["data"]["jitter"] = source.jitter[:samples][:-1]
 
-            interval = self._subtract_nested_dicts(parsed_cur, parsed_prev)
-            interval["duration"] = (sample["timestamp"] -
-                                    prev_sample["timestamp"])
-            interval["timestamp"] = prev_sample["timestamp"]
-
-            result.append(interval)
-
-            prev_sample = sample
-        return result
+        return True
 
-    def _subtract_nested_dicts(self, first, second):
-        result = {}
-        for key, val in list(first.items()):
-            if isinstance(val, dict):
-                result[key] = self._subtract_nested_dicts(val, second[key])
+    def _parse_stat(self, stat):
+        sample = self._read_cpu_counters(stat)
+        if self._cpus is None:
+            self._cpus = list(sample.keys())
+        self._previous = self._align_sample(sample, self._cpus,
+                                            self._previous)
+        return self._previous
+
+    def _read_cpu_counters(self, stat):
+        sample = {}
+        # the cpu lines come first, the rest including the large intr line
+        # is skipped
+        for line in stat.partition("\nintr")[0].splitlines():
+            if not line.startswith("cpu"):
+                break
+            fields = line.split()
+            values = [int(value) for value in fields[1:len(CPU_STAT_FIELDS)+1]]
+            values.extend([0] * (len(CPU_STAT_FIELDS) - len(values)))
+            sample[fields[0]] = values
+        return sample
+
+    def _align_sample(self, sample, cpus, previous):
+        if len(sample) == len(cpus) and all(cpu in sample for cpu in cpus):
+            return [value for cpu in cpus for value in sample[cpu]]
+
+        # a cpu went offline, its counters are kept the same so that its
+        # deltas are zero, new cpus are ignored
+        row = len(CPU_STAT_FIELDS)
+        aligned = []
+        for i, cpu in enumerate(cpus):
+            if cpu in sample:
+                aligned.extend(sample[cpu])
+            elif previous:
+                aligned.extend(previous[i*row:(i+1)*row])
             else:
-                result[key] = val - second[key]
-        return result
-
-    def _parse_stat_lines(self, stat):
-        result = {}
-        for line in stat.split("\n"):
-            cpu_data = self._parse_cpu_stats(line)
-            if cpu_data:
-                result[cpu_data[0]] = cpu_data[1]
-                continue
-
-            intr_data = self._parse_intr_stats(line)
-            if intr_data:
-                result[intr_data[0]] = intr_data[1]
-                continue
-
-            m = re.match(r"^(.*?) (\d+)$", line)
-            if m:
-                result[m.group(1)] = int(m.group(2))
-        return result
-
-    def _parse_cpu_stats(self, stat_line):
-        result = {}
-        m = re.match(r"^(cpu\d*)\s+(\d+) (\d+) (\d+) (\d+) (\d+) (\d+) (\d+) (\d+) (\d+) (\d+)$",
-                     stat_line)
-        if m:
-            cpu = m.group(1)
-            result["user"] = int(m.group(2))
-            result["nice"] = int(m.group(3))
-            result["system"] = int(m.group(4))
-            result["idle"] = int(m.group(5))
-            result["iowait"] = int(m.group(6))
-            result["irq"] = int(m.group(7))
-            result["softirq"] = int(m.group(8))
-            result["steal"] = int(m.group(9))
-            result["guest"] = int(m.group(10))
-            result["guest_nice"] = int(m.group(11))
-            return cpu, result
-        else:
-            return None
-
-    def _parse_intr_stats(self, stat_line):
-        result = {}
-        m = re.match(r"^(intr|softirq) (\d+) (.*)$", stat_line)
-        if m:
-            result["total"] = int(m.group(2))
-            for i, irq in enumerate(m.group(3).split(" ")):
-                result[i] = int(irq)
-            return m.group(1), result
-        else:
-            return None
+                aligned.extend([0] * row)
+        return aligned
+
+    def _process_samples(self, cpus, timestamps, counters):
+        row = len(cpus) * len(CPU_STAT_FIELDS)
+        deltas = array("q")
+        durations = array("d")
+        if len(timestamps) > 1:
+            deltas = array("q", map(operator.sub, counters[row:],
+                                    counters[:-row]))
+            durations = array("d", map(operator.sub, timestamps[1:],
+                                       timestamps[:-1]))
+
+        # transpose from samples x cpus x fields to cpus x fields x samples
+        values = array("q")
+        for i in range(row):
+            values.extend(deltas[i::row])
+
+        return {"cpus": cpus,
+                "fields": list(CPU_STAT_FIELDS),
+                "timestamps": timestamps[:-1],
+                "durations": durations,
+                "values": values}
@@ -1,7 +1,10 @@
+import os
 import logging
 import signal
 import subprocess
 import json
+import tempfile
+from array import array
 from json.decoder import JSONDecodeError
 from lnst.Common.Parameters import (
     IntParam,
@@ -15,8 +18,115 @@ from lnst.Common.Utils import is_installed
 from lnst.Tests.BaseTestModule import BaseTestModule, TestModuleError
 
 
+class IperfStreamParser(object):
+    """Incremental parser of iperf3 json events
+
+    Consumes the "start", "interval" and "end" events one by one, as
+    printed by iperf3 --json-stream, and keeps only the data the
+    measurements use - the bytes and seconds of every stream in every
+    interval are stored in packed per stream arrays instead of the
+    complete interval dictionaries.
+    """
+    def __init__(self, progress=False):
+        self._progress = progress
+        self.error = None
+        self.timestamp = None
+        self.duration = None
+        self.cpu_utilization = None
+        self.end_streams = None
+        self.interval_starts = array("d")
+        self.stream_bytes = []
+        self.stream_seconds = []
+
+    def feed_line(self, line):
+        line = line.strip()
+        if not line:
+            return
+        event = json.loads(line)
+        self.feed(event["event"], event["data"])
+
+    def feed(self, event, data):
+        if event == "start":
+            self.timestamp = data["timestamp"]["timesecs"]
+            self.duration = data["test_start"]["duration"]
+        elif event == "interval":
+            self._add_interval(data)
+        elif event == "end":
+            self.end_streams = len(data["streams"])
+            cpu = data.get("cpu_utilization_percent")
+            if cpu is not None:
+                self.cpu_utilization = cpu["host_total"]
+        elif event == "error":
+            self.error = data
+
+    def feed_report(self, report):
+        """Feeds a complete json report as printed by iperf3 -J"""
+        if "start" in report:
+            self.feed("start", report["start"])
+        for interval in report.get("intervals", []):
+            self.feed("interval", interval)
+        if "end" in report:
+            self.feed("end", report["end"])
+        if "error" in report:
+            self.feed("error", report["error"])
+
+    def _add_interval(self, data):
+        streams = data["streams"]
+        while len(self.stream_bytes) < len(streams):
+            self.stream_bytes.append(array("q"))
+            self.stream_seconds.append(array("d"))
+
+        self.interval_starts.append(data["sum"]["start"])
+        for i, stream in enumerate(streams):
+            self.stream_bytes[i].append(int(stream["bytes"]))
+            self.stream_seconds[i].append(stream["seconds"])
+
+        if self._progress:
+            logging.info("iperf interval {:.2f}-{:.2f}s: {:.2f} Mbits/sec".format(
+                data["sum"]["start"], data["sum"]["end"],
+                data["sum"]["bits_per_second"] / 1e6))
+
+    def is_complete(self):
+        return (
+            self.timestamp is not None
+            and self.end_streams is not None
+            and len(self.interval_starts) > 0
+        )
+
+    def get_data(self):
+        return {"timestamp": self.timestamp,
+                "duration": self.duration,
+                "cpu_utilization_percent": self.cpu_utilization,
+                "interval_starts": self.interval_starts,
+                "stream_bytes": self.stream_bytes,
+                "stream_seconds": self.stream_seconds}
+
+
+def json_stream_supported():
+    """Checks whether the installed iperf3 supports --json-stream (3.17+)"""
+    global _json_stream_supported
+    if _json_stream_supported is None:
+        try:
+            res = subprocess.run(["iperf3", "--help"], capture_output=True,
+                                 text=True)
+            _json_stream_supported = "--json-stream" in res.stdout + res.stderr
+        except OSError:
+            _json_stream_supported = False
+    return _json_stream_supported
+
+_json_stream_supported = None
+
+
 class IperfBase(BaseTestModule):
+    """Base of the iperf3 test modules
+
+    The result data doesn't contain the iperf3 json report, it's parsed on
+    the agent by IperfStreamParser which is also fed by iperf3 line by
+    line when --json-stream is supported. See IperfStreamParser.get_data
+    for the format.
+    """
     mptcp = BoolParam(default=False)
+    progress = BoolParam(default=False)
 
     def run(self):
         self._res_data = {}
@@ -25,44 +135,58 @@ class IperfBase(BaseTestModule):
             logging.error(self._res_data["msg"])
             return False
 
+        json_stream = json_stream_supported()
         cmd = self._compose_cmd()
+        if json_stream:
+            cmd += " --json-stream"
 
         logging.debug("compiled command: %s" % cmd)
         logging.debug("running as {} ...".format(self._role))
 
-        server = subprocess.Popen(cmd, shell=True, stdout=subprocess.PIPE,
-                                  stderr=subprocess.PIPE, close_fds=True)
-
-        try:
-            stdout, stderr = server.communicate()
-        except KeyboardInterrupt:
-            server.send_signal(signal.SIGINT)
-        finally:
-            stdout, stderr = server.communicate()
-            stdout = stdout.decode().strip()
-            stderr = stderr.decode().strip()
+        parser = IperfStreamParser(progress=self.params.progress)
+        with tempfile.TemporaryFile() as stderr_file:
+            server = subprocess.Popen(cmd, shell=True, stdout=subprocess.PIPE,
+                                      stderr=stderr_file, close_fds=True)
+
+            output = bytearray()
+            try:
+                stdout = self._read_output(server, parser, json_stream, output)
+            except KeyboardInterrupt:
+                server.send_signal(signal.SIGINT)
+                try:
+                    stdout = self._read_output(server, parser, json_stream,
+                                               output)
+                except JSONDecodeError:
+                    server.kill()
+                    stdout = None
+            except JSONDecodeError:
+                server.kill()
+                stdout = None
+            finally:
+                server.stdout.close()
+                server.wait()
+                stderr_file.seek(0)
+                stderr = stderr_file.read().decode().strip()
 
         if server.returncode > 0:
             msg = f"iperf {self._role} returncode = {server.returncode}"
             logging.error(msg)
             logging.error(f"iperf stderr: {stderr}")
-            logging.debug(f"iperf stdout: {stdout}")
+            if parser.error:
+                logging.error(f"iperf error: {parser.error}")
             self._res_data["msg"] = msg
             self._res_data["stderr"] = stderr
             return False
 
-        try:
-            self._res_data["data"] = json.loads(stdout)
-        except JSONDecodeError:
+        if stdout is None:
             msg = "Error while parsing the iperf json output"
             logging.error(msg)
             logging.error(f"iperf stderr: {stderr}")
-            logging.debug(f"iperf stdout: {stdout}")
             self._res_data["msg"] = msg
             self._res_data["stderr"] = stderr
             return False
 
-        if not self._is_json_complete(self._res_data["data"]):
+        if not parser.is_complete():
             msg = "Iperf provided incomplete json data"
             logging.error(msg)
             logging.error(f"iperf stderr: {stderr}")
@@ -71,16 +195,35 @@ class IperfBase(BaseTestModule):
             self._res_data["stderr"] = stderr
             return False
 
+        self._res_data["data"] = parser.get_data()
         return True
 
     @staticmethod
-    def _is_json_complete(data: dict) -> bool:
-        return (
-            "start" in data
-            and "end" in data
-            and len(data["intervals"]) > 0
-            and "streams" in data["end"]
-        )
+    def _read_output(process, parser, json_stream, output):
+        """Feeds the iperf3 output to the parser
+
+        Without json_stream the report is collected in the output bytearray
+        first, it keeps what was read before a KeyboardInterrupt so that the
+        reading can be resumed.
+
+        Returns the unparsed remainder of the output, this is only used for
+        logging purposes so it's empty in the streaming case.
+        """
+        if json_stream:
+            for line in process.stdout:
+                parser.feed_line(line.decode())
+            return ""
+
+        fd = process.stdout.fileno()
+        while True:
+            data = os.read(fd, 65536)
+            if not data:
+                break
+            output.extend(data)
+
+        stdout = output.decode().strip()
+        parser.feed_report(json.loads(stdout))
+        return stdout
 
 
 class IperfServer(IperfBase):
@@ -1,10 +1,12 @@
 import csv
 import logging
+import operator
 import pathlib
 import re
 import subprocess
 import time
 import tempfile
+from array import array
 from typing import Dict, TextIO, Union
 
 from lnst.Common.Parameters import HostnameOrIpParam, StrParam, IntParam, IpParam, ChoiceParam
@@ -15,6 +17,10 @@ NEPER_OUT_RE = re.compile(r"^(?P<key>.*)=(?P<value>.*)$", flags=re.M)
 NEPER_PATH = pathlib.Path('/root/neper')
 
 
+def _deltas(typecode: str, values: array) -> array:
+    return array(typecode, map(operator.sub, values[1:], values[:-1]))
+
+
 class NeperBase(BaseTestModule):
     _supported_workloads = set(['tcp_rr', 'tcp_crr', 'udp_rr'])
     workload = ChoiceParam(type=StrParam, choices=_supported_workloads,
@@ -44,6 +50,74 @@ class NeperBase(BaseTestModule):
                 data[k] = v
         return data
 
+    def _parse_samples(self, sample_file: TextIO, start_time: float) -> Dict:
+        """
+        Groups the rows of the samples file by the (tid, flow_id) of the
+        flow and converts them to the intervals between the consecutive
+        samples of each flow. The intervals are returned as compact arrays
+        per flow:
+            * timestamps - interval start, neper uses CLOCK_MONOTONIC, it's
+              converted to unix time relative to start_time
+            * durations
+            * transactions - transactions done in the interval
+            * cpu - utime + stime of the flow's thread in the interval
+            * latency - the latency_* columns of the sample ending the
+              interval by their name without the "latency_" prefix
+        """
+        reader = csv.reader(sample_file)
+        header = next(reader, None)
+        if header is None:
+            return {"flows": [], "latency_columns": []}
+
+        col = {name: i for i, name in enumerate(header)}
+        tid_col, flow_col = col["tid"], col["flow_id"]
+        time_col, trans_col = col["time"], col["transactions"]
+        utime_col, stime_col = col["utime"], col["stime"]
+        latency_cols = [(name[len("latency_"):], i)
+                        for name, i in col.items()
+                        if name.startswith("latency_")]
+
+        neper_start = None
+        flows = {}
+        for row in reader:
+            if not row:
+                continue
+            if neper_start is None:
+                neper_start = float(row[time_col])
+
+            key = (int(row[tid_col]), int(row[flow_col]))
+            flow = flows.get(key)
+            if flow is None:
+                flow = flows[key] = {
+                    "time": array("d"),
+                    "transactions": array("q"),
+                    "cpu": array("d"),
+                    "latency": {name: array("d") for name, _ in latency_cols},
+                }
+            flow["time"].append(float(row[time_col]))
+            flow["transactions"].append(int(row[trans_col]))
+            flow["cpu"].append(float(row[utime_col]) + float(row[stime_col]))
+            for name, i in latency_cols:
+                flow["latency"][name].append(float(row[i]))
+
+        offset = start_time - (neper_start or 0)
+        results = []
+        for (tid, flow_id), flow in sorted(flows.items()):
+            times = flow["time"]
+            results.append({
+                "tid": tid,
+                "flow_id": flow_id,
+                "timestamps": array("d", (t + offset for t in times[:-1])),
+                "durations": _deltas("d", times),
+                "transactions": _deltas("q", flow["transactions"]),
+                "cpu": _deltas("d", flow["cpu"]),
+                "latency": {name: values[1:]
+                            for name, values in flow["latency"].items()},
+            })
+
+        return {"flows": results,
+                "latency_columns": [name for name, _ in latency_cols]}
+
     def is_crr_server(self):
         return self._role == "server" and self.params.workload == "tcp_crr"
 
@@ -88,7 +162,8 @@ class NeperBase(BaseTestModule):
                 return False
 
             if not self.is_crr_server():
-                self._res_data["samples"] = [r for r in csv.DictReader(sf)]
+                self._res_data["samples"] = self._parse_samples(
+                    sf, self._res_data["start_time"])
 
         return True
 
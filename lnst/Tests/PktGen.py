@@ -3,10 +3,10 @@ import time
 import logging
 from dataclasses import dataclass, field
 from subprocess import Popen, check_output, CalledProcessError
-from threading import Thread
-from typing import Iterator, Union
+from typing import Union
 
 from lnst.Common.Utils import kmod_loaded
+from lnst.Common.Sampler import Sampler, FileSource
 from lnst.Common.IpAddress import Ip4Address
 from lnst.Tests.BaseTestModule import BaseTestModule, TestModuleError
 from lnst.Common.Parameters import (
@@ -18,102 +18,91 @@ from lnst.Common.Parameters import (
 )
 from lnst.Devices.Device import Device
 
+# the counters of the Current section
+_CURRENT_RE = re.compile(
+    r"Current:.*?\bsofar:\s*(\d+).*?\berrors:\s*(\d+)", re.DOTALL
+)
+
 
 class PktGenResultsSampler:
     def __init__(self, devs: list[str], duration: int) -> None:
         """
         PktGen output is just a table with current stats of devices. Therefore,
-        each device has a separate thread that captures current status of device
+        a single Sampler thread captures current status of all the devices
         each second for `duration`.
         """
         self._devs = devs
         self._duration = duration
 
-        self._sampling_threads: list[Thread] = []
-        self._raw_samples = {}
+        self._params: dict[str, str] = {}
+        self._sampler = Sampler(interval=1, count=duration + 1)
+        # ^^^ +1 because first sample is "empty"
+        self._sources = {
+            device: self._sampler.add_source(
+                FileSource(f"/proc/net/pktgen/{device}", self._parse_current)
+            )
+            for device in devs
+        }
 
     def start_sampling(self):
         """
         This is a separate method just to emphasize that pktgen
         needs to be started immediately after the start of sampling.
         """
-        self._setup_capturing()
-
-        for thread in self._sampling_threads:
-            thread.start()
-
-    def _setup_capturing(self):
         for device in self._devs:
-            thread = Thread(target=self._read_dev_samples, args=(device,))
-            self._sampling_threads.append(thread)
-
-    def _read_dev_samples(self, device: str):
-        self._raw_samples[device] = []
+            # params don't change while pktgen runs, only the first output
+            # is kept
+            with open(f"/proc/net/pktgen/{device}", "r") as f:
+                self._params[device], _ = self._split_output(f.read())
 
-        for _ in range(0, self._duration + 1):  # +1 because first sample is "empty"
-            with open(f"/proc/net/pktgen/{device}", "r") as file:
-                self._raw_samples[device].append((time.time(), file.read()))
-                # TODO: ^^^ when upgrading to python interpreter without GIL check thread safety
-                # NOTE: samples are saved at it's end => the timestamp represents ending time, not the start
-            time.sleep(1)
+        self._sampler.start()
 
     @property
     def device_samples(self) -> dict[str, list[dict[str, Union[float, int, dict]]]]:
-        for thread in self._sampling_threads:
-            thread.join(timeout=2)
+        self._sampler.join(timeout=2)
+        self._sampler.stop()
 
         samples = {}
-        for device in self._devs:
+        for device, source in self._sources.items():
             samples[device] = []
             packets_sofar = 0
-            start_timestamp = self._raw_samples[device][0][0]  # first "empty" sample
-            # NOTE: sample's timestamp represent the end of sampling
-            # so each sample actually starts at the timestamp of previous sample
-
-            for timestamp, raw_sample in self._raw_samples[device][
-                1:
-            ]:  # ignore first empty sample
-                params, current = self._split_output(raw_sample)
-                current = self._parse_values(current)
-
-                packets = int(current["sofar"]) - packets_sofar
+            sofar = source.series(0)
+            errors = source.series(1)
+            # NOTE: samples are saved at it's end => the timestamp represents
+            # ending time, so each sample actually starts at the timestamp of
+            # previous sample, the first "empty" sample is only the start
+            for i in range(1, len(source)):
+                start_timestamp = source.timestamps[i - 1]
+                packets = sofar[i] - packets_sofar
 
                 samples[device].append(
                     {
                         "timestamp": start_timestamp,
-                        "duration": timestamp - start_timestamp,
+                        "duration": source.timestamps[i] - start_timestamp,
                         "packets": packets,
-                        "errors": int(current["errors"]),
-                        "params": params,
+                        "errors": errors[i],
+                        "jitter": source.jitter[i],
+                        "params": self._params[device],
                     }
                 )
                 packets_sofar += packets
-                start_timestamp = timestamp
 
         return samples
 
-    def _read_dev_outputs(self) -> Iterator[tuple[str, str]]:
-        for device in self._devs:
-            output = ""
-            with open(f"/proc/net/pktgen/{device}", "r") as f:
-                output = f.readlines()
-            yield device, "\n".join(output)
+    def _parse_current(self, output: str) -> tuple[int, int]:
+        match = _CURRENT_RE.search(output)
+        if not match:
+            raise TestModuleError(f"Could not parse pktgen device output: {output}")
+
+        return int(match.group(1)), int(match.group(2))
 
     def _split_output(self, output: str) -> tuple:
         match = re.search(r"Params:(.+)Current:(.+)Result:\s(?:\w+)", output, re.DOTALL)
         if not match:
-            raise TestModuleError(f"Could not parse pktgen devide output: {output}")
+            raise TestModuleError(f"Could not parse pktgen device output: {output}")
 
         return match.groups()
 
-    def _parse_values(self, params) -> dict[str, str]:
-        values = {}
-
-        for key, value in re.findall(r"(\w+):?\s(\S+)", params, re.MULTILINE):
-            values[key.lower()] = value
-
-        return values
-
 
 @dataclass
 class PktgenDevice:
@@ -3,8 +3,8 @@ import time
 import signal
 import logging
 from subprocess import Popen, PIPE
-from threading import Thread
 from lnst.Devices.Device import Device
+from lnst.Common.Sampler import Sampler, LineSource
 
 from lnst.Tests.BaseTestModule import BaseTestModule, TestModuleError
 from lnst.Common.Parameters import (
@@ -14,41 +14,32 @@ from lnst.Common.Parameters import (
     DeviceParam,
 )
 
+_SUMMARY_RE = re.compile(r"Summary\s+([\d,]+)\srx/s\s+([\d,]+)\serr(,drop)?/s?")
+
 
 class XDPBenchOutputParser:
     def __init__(self, process: Popen):
         self._process = process
-        self._raw_samples = []
-        self._capturing_start = 0
+        self._sampler = Sampler()
+        self._source = self._sampler.add_source(
+            LineSource(process.stdout, self._parse_sample)
+        )
 
     def start_sampling(self):
-        thread = Thread(target=self._capture_output)
-        thread.start()
-        self._capturing_start = time.time()
-
-    def _capture_output(self):
-        try:
-            for sample in iter(self._process.stdout.readline, ""):
-                self._raw_samples.append((time.time(), sample.decode()))
-        except ValueError:
-            pass  # .readline raises exception on killing xdp-bench subprocess
+        self._sampler.start()
 
     def parse_output(self) -> list[dict]:
+        self._sampler.join()  # ends when xdp-bench closes its stdout
         _, stderr = self._process.communicate()
 
         logging.debug("Stderr of xdp-bench:")
         logging.debug(str(stderr))
 
         results = []
-        previous_timestamp = self._capturing_start
+        previous_timestamp = self._sampler.start_time
 
-        for timestamp, sample in self._raw_samples:
-            try:
-                rx, err = self._parse_line(sample)
-            except ValueError:
-                if sample:  # ignore empty lines
-                    logging.error(f"Could not parse line: '{sample}'")
-                continue
+        for i, timestamp in enumerate(self._source.timestamps):
+            rx, err = self._source.sample(i)
 
             duration = timestamp - previous_timestamp
             results.append(
@@ -62,8 +53,16 @@ class XDPBenchOutputParser:
 
         return results
 
+    def _parse_sample(self, line: str):
+        try:
+            return self._parse_line(line)
+        except ValueError:
+            if line.strip():  # ignore empty lines
+                logging.error(f"Could not parse line: '{line}'")
+            return None
+
     def _parse_line(self, line: str) -> tuple:
-        match = re.search(r"Summary\s+([\d,]+)\srx/s\s+([\d,]+)\serr(,drop)?/s?", line)
+        match = _SUMMARY_RE.search(line)
 
         if not match:  # skip summary line at the end + corrupted lines
             raise ValueError("Invalid line format")
@@ -0,0 +1,186 @@
+import threading
+from contextlib import contextmanager
+from unittest import TestCase, mock
+
+import pyroute2
+
+from lnst.Agent import InterfaceManager as InterfaceManagerModule
+from lnst.Agent.DeviceStateManager import DeviceStateManager
+from lnst.Agent.InterfaceManager import InterfaceManager
+from lnst.Common.DeviceError import DeviceConfigError, DeviceDeleted, DeviceDisabled
+
+
+class InterfaceManagerMock(object):
+    def __init__(self):
+        self.batch_depth = 0
+
+    def get_ipr(self):
+        pass
+
+    @contextmanager
+    def netlink_batch(self):
+        self.batch_depth += 1
+        try:
+            yield
+        finally:
+            self.batch_depth -= 1
+
+
+class DeviceMock(object):
+    def __init__(self, if_manager, ifindex, barrier=None, error=None):
+        self.ifindex = ifindex
+        self.name = "eth%d" % ifindex
+        self.driver = "mock"
+        self.is_down = False
+        self.restored = None
+        self.in_batch = []
+        self._cleanup_data = None
+        self._if_manager = if_manager
+        self._barrier = barrier
+        self._error = error
+
+    def _work(self):
+        self.in_batch.append(self._if_manager.batch_depth > 0)
+        if self._barrier is not None:
+            # all devices have to be processed at the same time to pass
+            self._barrier.wait()
+        if self._error is not None:
+            raise self._error
+
+    def down(self):
+        self.is_down = True
+
+    def store_cleanup_data(self):
+        self._work()
+        self._cleanup_data = {"ifindex": self.ifindex}
+
+    def restore_original_data(self):
+        self._work()
+        self.restored = self._cleanup_data
+
+
+class DeletedDeviceMock(DeviceMock):
+    # the remote Device raises DeviceDeleted on any attribute access
+    deleted = False
+
+    def __getattribute__(self, name):
+        if name == "_cleanup_data" and object.__getattribute__(self, "deleted"):
+            raise DeviceDeleted("Device was deleted.")
+        return super().__getattribute__(name)
+
+    def __setattr__(self, name, value):
+        if name == "_cleanup_data" and self.deleted:
+            raise DeviceDeleted("Device was deleted.")
+        super().__setattr__(name, value)
+
+
+class IPRouteMock(object):
+    def __init__(self):
+        self.closed = False
+
+    def close(self):
+        self.closed = True
+
+
+class IprDeviceMock(DeviceMock):
+    def _work(self):
+        self.ipr = self._if_manager.get_ipr()
+        # all devices have to be processed at the same time
+        self._barrier.wait()
+
+
+class DeviceStateManagerTest(TestCase):
+    def setUp(self):
+        self.if_manager = InterfaceManagerMock()
+        self.manager = DeviceStateManager(self.if_manager, max_workers=4)
+
+    def tearDown(self):
+        self.manager.shutdown()
+
+    def _devices(self, count, **kwargs):
+        barrier = threading.Barrier(count, timeout=5)
+        return [DeviceMock(self.if_manager, i, barrier, **kwargs)
+                for i in range(1, count + 1)]
+
+    def test_concurrent_snapshot(self):
+        devices = self._devices(4)
+        self.manager.snapshot(devices)
+
+        for device in devices:
+            self.assertTrue(device.is_down)
+            self.assertEqual(device._cleanup_data, {"ifindex": device.ifindex})
+            self.assertEqual(device.in_batch, [True])
+
+        timings = self.manager.get_timings()
+        self.assertEqual(sorted(timings), [1, 2, 3, 4])
+        self.assertEqual(timings[1]["name"], "eth1")
+        self.assertIn("snapshot", timings[1])
+
+    def test_concurrent_restore(self):
+        devices = self._devices(4)
+        self.manager.snapshot(devices)
+
+        held = self.manager.hold_restore(devices)
+        self.assertEqual([device for device, _ in held], devices)
+        for device in devices:
+            self.assertIsNone(device._cleanup_data)
+
+        self.manager.restore(held)
+        for device in devices:
+            self.assertEqual(device.restored, {"ifindex": device.ifindex})
+            self.assertEqual(device.in_batch, [True, True])
+        self.assertIn("restore", self.manager.get_timings()[1])
+
+    def test_deleted_devices_are_skipped(self):
+        device = DeviceMock(self.if_manager, 1)
+        deleted = DeletedDeviceMock(self.if_manager, 2)
+        device._cleanup_data = {"ifindex": 1}
+        deleted.deleted = True
+
+        held = self.manager.hold_restore([device, deleted])
+        self.assertEqual(held, [(device, {"ifindex": 1})])
+
+        self.manager.restore(held + [(deleted, {"ifindex": 2})])
+        self.assertEqual(device.restored, {"ifindex": 1})
+        self.assertIsNone(deleted.restored)
+
+    def test_errors(self):
+        devices = self._devices(2)
+        devices += [DeviceMock(self.if_manager, 3,
+                               error=DeviceConfigError("failed")),
+                    DeviceMock(self.if_manager, 4,
+                               error=DeviceDisabled("disabled"))]
+
+        with self.assertRaises(DeviceConfigError):
+            self.manager.snapshot(devices)
+        # the error doesn't stop the other devices
+        for device in devices[:2]:
+            self.assertEqual(device._cleanup_data, {"ifindex": device.ifindex})
+
+
+class DeviceStateManagerIPRouteTest(TestCase):
+    def setUp(self):
+        with mock.patch.object(InterfaceManagerModule, "IPRSocket"):
+            self.if_manager = InterfaceManager(None)
+        # the netlink socket is mocked, there's nothing to refresh
+        self.if_manager.refresh_devices = lambda ifindexes: None
+        self.manager = DeviceStateManager(self.if_manager, max_workers=4)
+
+    def tearDown(self):
+        self.manager.shutdown()
+
+    def test_workers_dont_share_ipr(self):
+        barrier = threading.Barrier(4, timeout=5)
+        devices = [IprDeviceMock(self.if_manager, i, barrier)
+                   for i in range(1, 5)]
+
+        with mock.patch.object(pyroute2, "IPRoute", IPRouteMock):
+            self.manager.snapshot(devices)
+
+            handles = [device.ipr for device in devices]
+            self.assertEqual(len(set(map(id, handles))), 4)
+            self.assertNotIn(self.if_manager.get_ipr(), handles)
+
+            self.if_manager.close_ipr()
+            for ipr in handles:
+                self.assertTrue(ipr.closed)
@@ -0,0 +1,38 @@
+from types import SimpleNamespace
+from unittest import TestCase, mock
+
+from lnst.Agent import InterfaceManager as InterfaceManagerModule
+from lnst.Agent.InterfaceManager import InterfaceManager
+from lnst.Common.DeviceError import DeviceNotFound
+
+
+class InterfaceManagerStatsTest(TestCase):
+    def setUp(self):
+        with mock.patch.object(InterfaceManagerModule, "IPRSocket"):
+            self.if_manager = InterfaceManager(None)
+        # the netlink socket is mocked, no events are ever received
+        self.if_manager.pull_netlink_messages_into_queue = lambda: None
+        self.device = SimpleNamespace(ifindex=1, name="eth1", hwaddr="hw1")
+        self.if_manager._devices[1] = self.device
+
+    def _stats(self):
+        stats = self.if_manager.get_stats()
+        return stats["dumps_avoided"], stats["full_dumps"]
+
+    def test_lookups(self):
+        self.assertIs(self.if_manager.get_device(1), self.device)
+        self.assertIs(self.if_manager.get_device_by_name("eth1"), self.device)
+        self.if_manager.get_devices()
+        self.assertEqual(self._stats(), (3, 0))
+
+    def test_missing_device_is_a_full_dump(self):
+        with self.assertRaises(DeviceNotFound):
+            self.if_manager.get_device(2)
+        with self.assertRaises(DeviceNotFound):
+            self.if_manager.get_device_by_name("eth2")
+        self.assertEqual(self._stats(), (0, 2))
+
+    def test_batch_refresh(self):
+        with self.if_manager.netlink_batch():
+            pass
+        self.assertEqual(self._stats(), (0, 0))
@@ -0,0 +1,140 @@
+import time
+from unittest import TestCase
+
+from lnst.Agent.JobWorkerPool import JobWorker, JobWorkerPool
+
+
+class WorkerMock(object):
+    def __init__(self, state):
+        self.state = state
+        self.signalled = False
+        self.alive = True
+        self.stopped = False
+
+    def is_alive(self):
+        return self.alive
+
+    def stop(self):
+        self.stopped = True
+
+    def reap(self):
+        return True
+
+
+class PoolMock(JobWorkerPool):
+    def __init__(self, max_idle):
+        self.state = 0
+        self.forked = []
+        super().__init__(None, max_idle, lambda: self.state, None, None)
+
+    def _fork_worker(self, state):
+        worker = WorkerMock(state)
+        self.forked.append(worker)
+        return worker
+
+
+class JobWorkerPoolTest(TestCase):
+    def test_no_prefork_without_demand(self):
+        pool = PoolMock(max_idle=2)
+        pool.prefork()
+        self.assertEqual(pool.forked, [])
+
+    def test_prefork_and_reuse(self):
+        pool = PoolMock(max_idle=2)
+        worker = pool.acquire()
+        self.assertEqual(len(pool.forked), 1)
+
+        # one job was started, one worker is kept ready
+        pool.prefork()
+        pool.prefork()
+        self.assertEqual(len(pool.forked), 2)
+
+        pool.release(worker)
+        self.assertFalse(worker.stopped)
+        self.assertIs(pool.acquire(), worker)
+        self.assertEqual(len(pool.forked), 2)
+
+    def test_prefork_is_limited_by_max_idle(self):
+        pool = PoolMock(max_idle=2)
+        workers = [pool.acquire() for _ in range(4)]
+        for _ in range(4):
+            pool.prefork()
+        self.assertEqual(len(pool.forked), 6)
+
+        for worker in workers:
+            pool.release(worker)
+        self.assertEqual([worker.stopped for worker in workers],
+                         [True, True, True, True])
+
+    def test_state_change_retires_workers(self):
+        pool = PoolMock(max_idle=2)
+        worker = pool.acquire()
+        pool.prefork()
+        idle = pool.forked[-1]
+
+        pool.state = 1
+        pool.release(worker)
+        self.assertTrue(worker.stopped)
+
+        # no demand in the new state yet
+        pool.prefork()
+        self.assertTrue(idle.stopped)
+        self.assertEqual(len(pool.forked), 2)
+
+        new_worker = pool.acquire()
+        self.assertNotIn(new_worker, (worker, idle))
+        self.assertEqual(new_worker.state, 1)
+
+    def test_signalled_worker_isnt_reused(self):
+        pool = PoolMock(max_idle=2)
+        worker = pool.acquire()
+        worker.signalled = True
+        pool.release(worker)
+
+        self.assertTrue(worker.stopped)
+        self.assertIsNot(pool.acquire(), worker)
+
+    def test_dead_worker_isnt_reused(self):
+        pool = PoolMock(max_idle=2)
+        worker = pool.acquire()
+        pool.release(worker)
+        worker.alive = False
+
+        self.assertIsNot(pool.acquire(), worker)
+        self.assertTrue(worker.stopped)
+
+    def test_disabled_pool(self):
+        pool = PoolMock(max_idle=0)
+        self.assertIsNone(pool.acquire())
+        pool.prefork()
+        self.assertEqual(pool.forked, [])
+
+
+class LogCtlMock(object):
+    def disable_logging(self):
+        pass
+
+    def set_connection(self, connection):
+        pass
+
+    def cancel_connection(self):
+        pass
+
+    def send_data(self, connection, data):
+        connection.send(data)
+
+
+class JobWorkerTest(TestCase):
+    def test_stop_doesnt_wait_for_the_worker(self):
+        worker = JobWorker(LogCtlMock(), None, None, None)
+        self.assertTrue(worker.is_alive())
+
+        start = time.monotonic()
+        worker.stop()
+        self.assertLess(time.monotonic() - start, 0.5)
+
+        deadline = time.monotonic() + 5
+        while not worker.reap():
+            self.assertLess(time.monotonic(), deadline)
+            time.sleep(0.01)
+        self.assertFalse(worker.is_alive())
@@ -0,0 +1,89 @@
+import threading
+from unittest import TestCase
+
+from lnst.Agent.RpcDispatcher import RpcDispatcher
+
+
+class ServerHandlerMock(object):
+    def __init__(self):
+        self.connections = {}
+
+    def add_connection(self, connection_id, connection):
+        self.connections[connection_id] = connection
+
+
+class RpcDispatcherTest(TestCase):
+    def setUp(self):
+        self.server_handler = ServerHandlerMock()
+        self.dispatcher = RpcDispatcher(self.server_handler, max_workers=4)
+        self.responses = []
+
+    def _respond(self, response):
+        self.responses.append(response)
+
+    def _process_until(self, count):
+        # what the event loop of the Agent does on the wakeup message
+        wakeup, = self.server_handler.connections.values()
+        while len(self.responses) < count:
+            self.assertTrue(wakeup.poll(5), "worker call didn't finish")
+            wakeup.recv()
+            self.dispatcher.process_completed()
+
+    def test_safe_calls_run_concurrently(self):
+        barrier = threading.Barrier(3, timeout=5)
+
+        def call(i):
+            barrier.wait()
+            return i
+
+        for i in range(3):
+            self.dispatcher.dispatch("call", lambda i=i: call(i),
+                                     self._respond, True)
+        self._process_until(3)
+
+        self.assertEqual(sorted(self.responses), [0, 1, 2])
+
+    def test_unsafe_call_waits_for_worker_calls(self):
+        release = threading.Event()
+        executed = []
+
+        def slow_call():
+            release.wait(5)
+            executed.append("slow")
+            return "slow"
+
+        def unsafe_call():
+            executed.append("unsafe")
+            return "unsafe"
+
+        def fast_call():
+            executed.append("fast")
+            return "fast"
+
+        self.dispatcher.dispatch("slow", slow_call, self._respond, True)
+        self.dispatcher.dispatch("unsafe", unsafe_call, self._respond, False)
+        # received after the unsafe call, it's queued behind it
+        self.dispatcher.dispatch("fast", fast_call, self._respond, True)
+
+        self.assertEqual(executed, [])
+        self.assertEqual(self.responses, [])
+
+        release.set()
+        self._process_until(3)
+
+        self.assertEqual(executed, ["slow", "unsafe", "fast"])
+        self.assertEqual(self.responses, ["slow", "unsafe", "fast"])
+
+    def test_stats(self):
+        self.dispatcher.dispatch("inline", lambda: None, self._respond, False)
+        self.dispatcher.dispatch("worker", lambda: None, self._respond, True)
+        self._process_until(2)
+
+        stats = self.dispatcher.get_stats()
+        self.assertEqual(sorted(stats), ["inline", "worker"])
+        for name in ("inline", "worker"):
+            self.assertEqual(stats[name]["latency"]["count"], 1)
+            self.assertEqual(stats[name]["execution"]["count"], 1)
+
+        self.dispatcher.reset_stats()
+        self.assertEqual(self.dispatcher.get_stats(), {})
@@ -0,0 +1,103 @@
+from unittest import TestCase
+
+from pyroute2.netlink.exceptions import NetlinkError
+from pyroute2.netlink.generic.ethtool import ethtool_rings_msg
+
+from lnst.Common.EthtoolNetlink import EthtoolMarshal, EthtoolNetlink
+from lnst.Common.EthtoolNetlink import SETTINGS_PARTS, ETHTOOL_MSG_RINGS_SET
+from tests.Common import ethtool_netlink_data as data
+
+
+def parse_replies(buffer):
+    marshal = EthtoolMarshal()
+    marshal.family_id = data.FAMILY_ID
+    return list(marshal.parse(buffer))
+
+
+def parse_part(part, msg):
+    return SETTINGS_PARTS[part][4](msg)
+
+
+class EthtoolNetlinkParseTest(TestCase):
+    def test_coalesce(self):
+        msg, = parse_replies(data.COALESCE_REPLY)
+        coalesce = parse_part("coalesce", msg)
+
+        self.assertEqual(coalesce["rx-usecs"], 0)
+        self.assertEqual(coalesce["rx-frames"], 1)
+        self.assertEqual(coalesce["tx-frames"], 1)
+        self.assertIs(coalesce["adaptive-rx"], False)
+        # not reported by the driver
+        self.assertIsNone(coalesce["rx-usecs-irq"])
+        self.assertIsNone(coalesce["adaptive-tx"])
+
+    def test_error_reply(self):
+        msg, = parse_replies(data.PAUSE_REPLY)
+        self.assertIsInstance(msg["header"]["error"], NetlinkError)
+        self.assertEqual(msg["header"]["error"].code, 95)
+
+    def test_rings(self):
+        msg, = parse_replies(data.RINGS_REPLY)
+        rings = parse_part("rings", msg)
+
+        self.assertEqual(rings["rx"], 256)
+        self.assertEqual(rings["rx-max"], 256)
+        self.assertEqual(rings["tx"], 256)
+        self.assertEqual(rings["tx-max"], 256)
+        self.assertIs(rings["tx-push"], False)
+        self.assertIsNone(rings["rx-jumbo"])
+
+    def test_channels(self):
+        msg, = parse_replies(data.CHANNELS_REPLY)
+        channels = parse_part("channels", msg)
+
+        self.assertEqual(channels["combined"], 1)
+        self.assertEqual(channels["combined-max"], 1)
+        self.assertIsNone(channels["rx"])
+        self.assertIsNone(channels["rx-max"])
+
+    def test_features(self):
+        msg, = parse_replies(data.FEATURES_REPLY)
+        features = parse_part("features", msg)
+
+        self.assertIs(features["rx-gro"], True)
+        self.assertIs(features["tx-tcp-segmentation"], True)
+        self.assertIs(features["rx-gro-list"], False)
+        self.assertIs(features["tx-nocache-copy"], False)
+        self.assertNotIn("loopback", features)
+
+    def test_linkmodes(self):
+        msg, = parse_replies(data.LINKMODES_REPLY)
+        linkmodes = parse_part("linkmodes", msg)
+
+        self.assertEqual(linkmodes, {"speed": None, "autoneg": False,
+                                     "duplex": 255})
+
+    def test_replies_are_parsed_by_their_command(self):
+        replies = [data.COALESCE_REPLY, data.PAUSE_REPLY, data.RINGS_REPLY,
+                   data.CHANNELS_REPLY, data.FEATURES_REPLY,
+                   data.LINKMODES_REPLY]
+        msgs = parse_replies(b"".join(replies))
+
+        self.assertEqual(len(msgs), 6)
+        self.assertIsInstance(msgs[1]["header"]["error"], NetlinkError)
+        for part, msg in zip(("coalesce", "rings", "channels", "features",
+                              "linkmodes"),
+                             msgs[:1] + msgs[2:]):
+            self.assertIsInstance(msg, SETTINGS_PARTS[part][0])
+        self.assertEqual(parse_part("rings", msgs[2])["rx"], 256)
+
+
+class EthtoolNetlinkRequestTest(TestCase):
+    def test_set_rings_message(self):
+        ethtool = object.__new__(EthtoolNetlink)
+        msg = ethtool._message("rings", 4, [("ETHTOOL_A_RINGS_RX", 1024)],
+                               set_request=True)
+        msg.encode()
+
+        decoded = ethtool_rings_msg(msg.data)
+        decoded.decode()
+        self.assertEqual(decoded["cmd"], ETHTOOL_MSG_RINGS_SET)
+        self.assertEqual(decoded.get_attr("ETHTOOL_A_RINGS_RX"), 1024)
+        header = decoded.get_attr("ETHTOOL_A_RINGS_HEADER")
+        self.assertEqual(header.get_attr("ETHTOOL_A_HEADER_DEV_INDEX"), 4)
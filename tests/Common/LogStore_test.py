@@ -0,0 +1,79 @@
+import os
+import pickle
+import logging
+import tempfile
+from unittest import TestCase
+
+from lnst.Common.LogStore import LogStore
+
+
+def make_record(msg):
+    return logging.makeLogRecord({"msg": msg, "levelno": logging.INFO,
+                                  "levelname": "INFO"})
+
+
+class LogStoreTest(TestCase):
+    def setUp(self):
+        self._tmp = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self._tmp.name, "export_logs")
+
+    def tearDown(self):
+        self._tmp.cleanup()
+
+    def _messages(self, view, source):
+        return [record.msg for record in view[source]]
+
+    def test_views_keep_their_generation(self):
+        store = LogStore(self.path)
+
+        store.reset_source("agent1")
+        first_run = store.view()
+        for i in range(10):
+            store.append("agent1", make_record("first %d" % i))
+
+        store.reset_source("agent1")
+        second_run = store.view()
+        for i in range(5):
+            store.append("agent1", make_record("second %d" % i))
+
+        self.assertEqual(self._messages(first_run, "agent1"),
+                         ["first %d" % i for i in range(10)])
+        self.assertEqual(self._messages(second_run, "agent1"),
+                         ["second %d" % i for i in range(5)])
+
+    def test_pickled_view_keeps_its_generation(self):
+        store = LogStore(self.path)
+        store.reset_source("agent1")
+        store.append("agent1", make_record("first"))
+        view = store.view()
+        store.reset_source("agent1")
+        store.append("agent1", make_record("second"))
+
+        view = pickle.loads(pickle.dumps(view))
+        self.assertEqual(self._messages(view, "agent1"), ["first"])
+
+    def test_sources_added_later_are_not_in_older_views(self):
+        store = LogStore(self.path)
+        store.reset_source("controller")
+        view = store.view()
+        store.reset_source("agent1")
+        store.append("agent1", make_record("later"))
+
+        self.assertEqual(list(view), ["controller"])
+
+    def test_max_size_removes_oldest_segments(self):
+        store = LogStore(self.path, chunk_size=1, max_size=4096)
+        for i in range(200):
+            store.append("agent1", make_record(os.urandom(64).hex()))
+        store.flush()
+
+        segments = [name for name in os.listdir(self.path)
+                    if name.startswith("segment-")]
+        size = sum(os.path.getsize(os.path.join(self.path, name))
+                   for name in segments)
+        self.assertLessEqual(size, 4096 + store.segment_size)
+
+        records = store.view()["agent1"]
+        self.assertLess(len(records), 200)
+        # all the indexed chunks are still readable
+        self.assertEqual(len(list(records)), len(records))
@@ -0,0 +1,57 @@
+import os
+import logging
+from multiprocessing import Pipe
+from unittest import TestCase
+
+from lnst.Common.LoggingHandler import TransmitHandler, unpack_log_batch
+
+
+def make_record(msg):
+    return logging.makeLogRecord({"msg": msg, "levelno": logging.INFO,
+                                  "levelname": "INFO"})
+
+
+class TransmitHandlerTest(TestCase):
+    def test_stop_sends_buffered_records(self):
+        parent, child = Pipe()
+        handler = TransmitHandler(child, flush_interval=60)
+        for i in range(3):
+            handler.emit(make_record("record %d" % i))
+
+        handler.stop()
+
+        batch = parent.recv()
+        self.assertEqual([r["msg"] for r in unpack_log_batch(batch)],
+                         ["record 0", "record 1", "record 2"])
+        self.assertEqual(handler.dropped, 0)
+
+    def test_stop_counts_unsent_records_as_dropped(self):
+        parent, child = Pipe()
+        handler = TransmitHandler(child, flush_interval=60)
+        for i in range(3):
+            handler.emit(make_record("record %d" % i))
+        parent.close()
+        child.close()
+
+        handler.stop()
+
+        self.assertEqual(handler.dropped, 3)
+
+    def test_stop_in_forked_child_doesnt_send(self):
+        parent, child = Pipe()
+        handler = TransmitHandler(child, flush_interval=60)
+        handler.emit(make_record("before fork"))
+
+        pid = os.fork()
+        if pid == 0:
+            handler.stop()
+            os._exit(0)
+        _, status = os.waitpid(pid, 0)
+        self.assertEqual(status, 0)
+
+        self.assertFalse(parent.poll(0.1))
+        handler.flush()
+        batch = parent.recv()
+        self.assertEqual([r["msg"] for r in unpack_log_batch(batch)],
+                         ["before fork"])
+        self.assertFalse(parent.poll(0.1))
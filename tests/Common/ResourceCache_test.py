@@ -0,0 +1,68 @@
+import io
+import os
+import tarfile
+import tempfile
+from unittest import TestCase
+
+from lnst.Common.ResourceCache import ResourceCache
+from lnst.Common.Utils import sha256sum
+
+
+class ResourceCacheTest(TestCase):
+    def setUp(self):
+        self._tmp = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self._tmp.name, "cache")
+
+    def tearDown(self):
+        self._tmp.cleanup()
+
+    def _file(self, data):
+        fd, path = tempfile.mkstemp(dir=self._tmp.name)
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        return path
+
+    def _archive(self, files):
+        path = os.path.join(self._tmp.name, "bundle.tar.gz")
+        digests = []
+        with tarfile.open(path, "w:gz") as archive:
+            for data in files:
+                digest = sha256sum(self._file(data))
+                info = tarfile.TarInfo(digest)
+                info.size = len(data)
+                archive.addfile(info, io.BytesIO(data))
+                digests.append(digest)
+        return path, digests
+
+    def test_lru_eviction(self):
+        cache = ResourceCache(self.path, 0, size_limit=20)
+        first = cache.add_file_entry(self._file(b"a" * 10), "first")
+        second = cache.add_file_entry(self._file(b"b" * 10), "second")
+        cache.renew_entry(first)
+
+        third = cache.add_file_entry(self._file(b"c" * 10), "third")
+        self.assertTrue(cache.query(first))
+        self.assertFalse(cache.query(second))
+        self.assertTrue(cache.query(third))
+
+    def test_synced_entries_are_kept(self):
+        cache = ResourceCache(self.path, 0, size_limit=20)
+        cached = cache.add_file_entry(self._file(b"a" * 10), "cached")
+
+        archive_path, digests = self._archive([b"b" * 10, b"c" * 10])
+        names = {digest: "res%d" % i for i, digest in enumerate(digests)}
+        added = cache.add_archive_entries(archive_path, names, keep=[cached])
+
+        # the limit is exceeded rather than evicting what the sync loads
+        self.assertEqual(added, digests)
+        for digest in [cached] + digests:
+            self.assertTrue(cache.query(digest))
+
+    def test_index_persists(self):
+        cache = ResourceCache(self.path, 0)
+        digest = cache.add_file_entry(self._file(b"a"), "res")
+
+        cache = ResourceCache(self.path, 0)
+        self.assertTrue(cache.query(digest))
+        self.assertEqual(cache.get_path(digest),
+                         os.path.join(self.path, digest))
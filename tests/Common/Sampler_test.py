@@ -0,0 +1,63 @@
+import os
+import tempfile
+from unittest import TestCase
+
+from lnst.Common.Sampler import Sampler, FileSource, LineSource
+
+
+def parse_ints(raw):
+    raw = raw.strip()
+    if not raw:
+        return None
+    return [int(value) for value in raw.split()]
+
+
+class SamplerTest(TestCase):
+    def test_count_ticks(self):
+        with tempfile.NamedTemporaryFile("w") as f:
+            f.write("1 2\n")
+            f.flush()
+
+            sampler = Sampler(interval=0.05, count=5)
+            source = sampler.add_source(FileSource(f.name, parse_ints))
+            sampler.run()
+
+        self.assertEqual(len(source), 5)
+        self.assertEqual(source.width, 2)
+        self.assertEqual(source.sample(4), [1, 2])
+        self.assertEqual(list(source.series(1)), [2] * 5)
+        self.assertTrue(all(jitter >= 0 for jitter in source.jitter))
+        self.assertEqual(list(source.timestamps), sorted(source.timestamps))
+
+    def test_partial_lines(self):
+        read_fd, write_fd = os.pipe()
+        sampler = Sampler(interval=0.01)
+        source = sampler.add_source(LineSource(read_fd, parse_ints))
+        sampler.start()
+
+        os.write(write_fd, b"1 2\n3")
+        os.write(write_fd, b" 4\n5 ")
+        # the last line isn't terminated, it's parsed at the end of stream
+        os.write(write_fd, b"6")
+        os.close(write_fd)
+
+        sampler.join(5)
+        os.close(read_fd)
+
+        self.assertTrue(source.eof)
+        self.assertEqual([source.sample(i) for i in range(len(source))],
+                         [[1, 2], [3, 4], [5, 6]])
+        self.assertEqual(list(source.jitter), [0.0] * 3)
+
+    def test_error_is_raised_by_join(self):
+        read_fd, write_fd = os.pipe()
+        sampler = Sampler(interval=0.01)
+        sampler.add_source(LineSource(read_fd, parse_ints))
+        sampler.start()
+
+        os.write(write_fd, b"1 2\n3\n")
+        os.close(write_fd)
+
+        with self.assertRaises(ValueError):
+            sampler.join(5)
+        os.close(read_fd)
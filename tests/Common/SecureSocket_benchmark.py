@@ -0,0 +1,69 @@
+"""
+Compares the throughput of the SecureSocket wire format versions.
+
+Run from the repository root:
+    python -m tests.Common.SecureSocket_benchmark [--mac] [--size BYTES]
+"""
+
+import os
+import time
+import socket
+import argparse
+import threading
+
+from lnst.Common.SecureSocket import SecureSocket, WIRE_VERSIONS
+
+
+def measure(wire_version, payload_size, count, mac_key):
+    first, second = socket.socketpair()
+    sender, receiver = SecureSocket(first), SecureSocket(second)
+    for sock in (sender, receiver):
+        sock._set_wire_version(wire_version)
+        sock._current_write_spec["mac_key"] = mac_key
+        sock._current_read_spec["mac_key"] = mac_key
+
+    msg = {"type": "result", "result": os.urandom(payload_size)}
+
+    def receive():
+        for _ in range(count):
+            receiver.recv_msg()
+
+    reader = threading.Thread(target=receive)
+    start = time.perf_counter()
+    reader.start()
+    for _ in range(count):
+        sender.send_msg(msg)
+    reader.join()
+    duration = time.perf_counter() - start
+
+    sender.close()
+    receiver.close()
+    return duration
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--mac", action="store_true",
+                        help="sign the messages with a HMAC")
+    parser.add_argument("--size", type=int, action="append",
+                        help="payload size in bytes, can be repeated")
+    parser.add_argument("--total", type=int, default=256 * 1024 * 1024,
+                        help="total amount of payload bytes per run")
+    args = parser.parse_args()
+
+    mac_key = os.urandom(32) if args.mac else None
+    sizes = args.size or [64, 4 * 1024, 64 * 1024, 1024 * 1024, 16 * 1024 * 1024]
+
+    print("{:>12} {:>8} {:>12} {:>12}".format("size", "version",
+                                             "msgs/s", "MiB/s"))
+    for size in sizes:
+        count = max(args.total // max(size, 1024), 1)
+        for version in WIRE_VERSIONS:
+            duration = measure(version, size, count, mac_key)
+            print("{:>12} {:>8} {:>12.0f} {:>12.1f}".format(
+                size, version, count / duration,
+                count * size / duration / 2**20))
+
+
+if __name__ == "__main__":
+    main()
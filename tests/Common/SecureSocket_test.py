@@ -0,0 +1,84 @@
+import os
+import socket
+import threading
+from collections import namedtuple, OrderedDict
+from unittest import TestCase
+
+from lnst.Common.SecureSocket import SecureSocket, SecSocketException
+from lnst.Common.SecureSocket import OUT_OF_BAND_THRESHOLD
+from lnst.Common.SecureSocket import FRAME_HEADER, FRAME_MAGIC, FRAME_MAX_BODY_SIZE
+
+Point = namedtuple("Point", ["x", "y"])
+
+
+def socket_pair(wire_version, mac_key=None):
+    first, second = socket.socketpair()
+    sockets = (SecureSocket(first), SecureSocket(second))
+    for sock in sockets:
+        sock._set_wire_version(wire_version)
+        sock._current_write_spec["mac_key"] = mac_key
+        sock._current_read_spec["mac_key"] = mac_key
+    return sockets
+
+
+class SecureSocketTest(TestCase):
+    messages = [
+        {"type": "command", "method_name": "foo", "args": [1, "a"],
+         "kwargs": {"b": None}},
+        {"type": "result", "result": b"x" * 10},
+        {"type": "result", "result": {"data": os.urandom(OUT_OF_BAND_THRESHOLD),
+                                      "other": [os.urandom(3 * OUT_OF_BAND_THRESHOLD)]}},
+    ]
+
+    def _round_trip(self, sender, receiver):
+        received = []
+        reader = threading.Thread(
+            target=lambda: received.extend(receiver.recv_msg()
+                                           for _ in self.messages))
+        reader.start()
+        for msg in self.messages:
+            sender.send_msg(msg)
+        reader.join()
+        self.assertEqual(received, self.messages)
+
+    def test_v1_round_trip(self):
+        self._round_trip(*socket_pair(1))
+
+    def test_v2_round_trip(self):
+        self._round_trip(*socket_pair(2))
+
+    def test_v2_round_trip_signed(self):
+        self._round_trip(*socket_pair(2, mac_key=os.urandom(32)))
+
+    def test_v2_drops_forged_frame(self):
+        sender, receiver = socket_pair(2, mac_key=os.urandom(32))
+        forger, _ = socket_pair(2, mac_key=os.urandom(32))
+        forger._socket = sender._socket
+
+        forger.send_msg({"type": "forged"})
+        sender.send_msg({"type": "genuine"})
+        self.assertEqual(receiver.recv_msg(), {"type": "genuine"})
+
+    def test_v2_disconnect(self):
+        sender, receiver = socket_pair(2)
+        sender.close()
+        with self.assertRaises(SecSocketException):
+            receiver.recv_msg()
+
+    def test_v2_keeps_container_types(self):
+        sender, receiver = socket_pair(2)
+        msg = {"point": Point(1, os.urandom(OUT_OF_BAND_THRESHOLD)),
+               "ordered": OrderedDict([("a", 1)])}
+
+        sender.send_msg(msg)
+        received = receiver.recv_msg()
+        self.assertIsInstance(received["point"], Point)
+        self.assertIsInstance(received["ordered"], OrderedDict)
+        self.assertEqual(received, msg)
+
+    def test_v2_rejects_oversized_frame(self):
+        sender, receiver = socket_pair(2)
+        sender._socket.sendall(FRAME_HEADER.pack(FRAME_MAGIC, 2, 0,
+                                                 FRAME_MAX_BODY_SIZE + 1))
+        with self.assertRaises(SecSocketException):
+            receiver.recv_msg()
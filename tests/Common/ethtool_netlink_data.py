@@ -0,0 +1,121 @@
+"""
+Replies of the ethtool netlink family captured from a virtio_net device,
+used by the EthtoolNetlink tests. The pause reply is an EOPNOTSUPP error.
+"""
+
+# the family id the replies were captured with
+FAMILY_ID = 21
+
+COALESCE_REPLY = bytes.fromhex(
+    "5400000015000000ff000000d66100001401000018000180080001000400000009000200"
+    "657468300000000008000200000000000800030001000000080006000000000008000700"
+    "0100000005000b0000000000"
+)
+
+PAUSE_REPLY = bytes.fromhex(
+    "340000000200000000010000d6610000a1ffffff200000001500010000010000d6610000"
+    "150100000c0001800800010004000000"
+)
+
+RINGS_REPLY = bytes.fromhex(
+    "5c0000001500000001010000d66100001001000018000180080001000400000009000200"
+    "657468300000000008000200000100000800060000010000080005000001000008000900"
+    "0001000005000d000000000005000e0000000000"
+)
+
+CHANNELS_REPLY = bytes.fromhex(
+    "3c0000001500000002010000d66100001201000018000180080001000400000009000200"
+    "657468300000000008000500010000000800090001000000"
+)
+
+FEATURES_REPLY = bytes.fromhex(
+    "840b00001500000003010000d66100000b01000018000180080001000400000009000200"
+    "6574683000000000dc0802800800020040000000d0080380280001800800010000000000"
+    "1600020074782d736361747465722d676174686572000000040003002400018008000100"
+    "010000001500020074782d636865636b73756d2d69707634000000001400018008000100"
+    "0200000005000200000000002c00018008000100030000001b00020074782d636865636b"
+    "73756d2d69702d67656e6572696300000400030024000180080001000400000015000200"
+    "74782d636865636b73756d2d69707636000000001800018008000100050000000c000200"
+    "68696768646d61002c00018008000100060000001f00020074782d736361747465722d67"
+    "61746865722d667261676c69737400002400018008000100070000001600020074782d76"
+    "6c616e2d68772d696e736572740000002400018008000100080000001500020072782d76"
+    "6c616e2d68772d7061727365000000002000018008000100090000001300020072782d76"
+    "6c616e2d66696c746572000020000180080001000a00000014000200766c616e2d636861"
+    "6c6c656e676564002c000180080001000b0000001c00020074782d67656e657269632d73"
+    "65676d656e746174696f6e000400030014000180080001000c0000000500020000000000"
+    "14000180080001000d00000005000200000000001c000180080001000e0000000b000200"
+    "72782d67726f00000400030018000180080001000f0000000b00020072782d6c726f0000"
+    "2800018008000100100000001800020074782d7463702d7365676d656e746174696f6e00"
+    "040003002000018008000100110000001200020074782d67736f2d726f62757374000000"
+    "2800018008000100120000001c00020074782d7463702d65636e2d7365676d656e746174"
+    "696f6e003400018008000100130000002100020074782d7463702d6d616e676c6569642d"
+    "7365676d656e746174696f6e00000000040003002c000180080001001400000019000200"
+    "74782d746370362d7365676d656e746174696f6e00000000040003002800018008000100"
+    "150000001900020074782d66636f652d7365676d656e746174696f6e0000000024000180"
+    "08000100160000001800020074782d6772652d7365676d656e746174696f6e002c000180"
+    "08000100170000001d00020074782d6772652d6373756d2d7365676d656e746174696f6e"
+    "000000002800018008000100180000001b00020074782d6970786970342d7365676d656e"
+    "746174696f6e00002800018008000100190000001b00020074782d6970786970362d7365"
+    "676d656e746174696f6e000028000180080001001a0000001c00020074782d7564705f74"
+    "6e6c2d7365676d656e746174696f6e0030000180080001001b0000002100020074782d75"
+    "64705f746e6c2d6373756d2d7365676d656e746174696f6e000000002000018008000100"
+    "1c0000001300020074782d67736f2d7061727469616c000030000180080001001d000000"
+    "2300020074782d74756e6e656c2d72656d6373756d2d7365676d656e746174696f6e0000"
+    "28000180080001001e0000001900020074782d736374702d7365676d656e746174696f6e"
+    "0000000024000180080001001f0000001800020074782d6573702d7365676d656e746174"
+    "696f6e001400018008000100200000000500020000000000240001800800010021000000"
+    "1800020074782d7564702d7365676d656e746174696f6e001c0001800800010022000000"
+    "1000020074782d67736f2d6c697374002c00018008000100230000001f00020074782d74"
+    "63702d61636365636e2d7365676d656e746174696f6e0000280001800800010024000000"
+    "1900020074782d636865636b73756d2d66636f652d637263000000002400018008000100"
+    "250000001500020074782d636865636b73756d2d73637470000000002400018008000100"
+    "260000001500020072782d6e7475706c652d66696c746572000000001c00018008000100"
+    "270000000f00020072782d68617368696e6700001c000180080001002800000010000200"
+    "72782d636865636b73756d002400018008000100290000001400020074782d6e6f636163"
+    "68652d636f707900040003001c000180080001002a0000000d0002006c6f6f706261636b"
+    "0000000018000180080001002b0000000b00020072782d66637300001800018008000100"
+    "2c0000000b00020072782d616c6c000028000180080001002d0000001b00020074782d76"
+    "6c616e2d737461672d68772d696e73657274000028000180080001002e0000001a000200"
+    "72782d766c616e2d737461672d68772d706172736500000024000180080001002f000000"
+    "1800020072782d766c616e2d737461672d66696c74657200200001800800010030000000"
+    "130002006c322d6677642d6f66666c6f6164000020000180080001003100000012000200"
+    "68772d74632d6f66666c6f6164000000200001800800010032000000130002006573702d"
+    "68772d6f66666c6f616400002800018008000100330000001b0002006573702d74782d63"
+    "73756d2d68772d6f66666c6f616400002c00018008000100340000001f00020072782d75"
+    "64705f74756e6e656c2d706f72742d6f66666c6f61640000240001800800010035000000"
+    "16000200746c732d68772d74782d6f66666c6f6164000000240001800800010036000000"
+    "16000200746c732d68772d72782d6f66666c6f61640000001c0001800800010037000000"
+    "0e00020072782d67726f2d687700000020000180080001003800000012000200746c732d"
+    "68772d7265636f72640000002000018008000100390000001000020072782d67726f2d6c"
+    "697374000400030024000180080001003a000000160002006d61637365632d68772d6f66"
+    "666c6f61640000002c000180080001003b0000001a00020072782d7564702d67726f2d66"
+    "6f7277617264696e670000000400030024000180080001003c000000180002006873722d"
+    "7461672d696e732d6f66666c6f61640024000180080001003d000000170002006873722d"
+    "7461672d726d2d6f66666c6f6164000020000180080001003e000000140002006873722d"
+    "6677642d6f66666c6f61640020000180080001003f000000140002006873722d6475702d"
+    "6f66666c6f616400ec000380040001000800020040000000dc0003802400018008000100"
+    "000000001600020074782d736361747465722d6761746865720000002800018008000100"
+    "030000001b00020074782d636865636b73756d2d69702d67656e65726963000028000180"
+    "080001000b0000001c00020074782d67656e657269632d7365676d656e746174696f6e00"
+    "18000180080001000e0000000b00020072782d67726f0000240001800800010010000000"
+    "1800020074782d7463702d7365676d656e746174696f6e00280001800800010014000000"
+    "1900020074782d746370362d7365676d656e746174696f6e000000005c01048004000100"
+    "08000200400000004c0103802400018008000100000000001600020074782d7363617474"
+    "65722d6761746865720000002800018008000100030000001b00020074782d636865636b"
+    "73756d2d69702d67656e6572696300001800018008000100050000000c00020068696768"
+    "646d610028000180080001000b0000001c00020074782d67656e657269632d7365676d65"
+    "6e746174696f6e0018000180080001000e0000000b00020072782d67726f000024000180"
+    "08000100100000001800020074782d7463702d7365676d656e746174696f6e0020000180"
+    "08000100110000001200020074782d67736f2d726f627573740000002800018008000100"
+    "140000001900020074782d746370362d7365676d656e746174696f6e000000001c000180"
+    "08000100280000001000020072782d636865636b73756d001c0001800800010037000000"
+    "0e00020072782d67726f2d68770000003400058004000100080002004000000024000380"
+    "20000180080001000a00000014000200766c616e2d6368616c6c656e67656400"
+)
+
+LINKMODES_REPLY = bytes.fromhex(
+    "800000001500000004010000d66100000401000018000180080001000400000009000200"
+    "657468300000000005000200000000003400038008000200790000001400040000000000"
+    "000000000000000000000000140005000000000000000000000000000000000008000500"
+    "ffffffff05000600ff00000005000a0000000000"
+)
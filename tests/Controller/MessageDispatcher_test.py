@@ -0,0 +1,88 @@
+import queue
+import threading
+import time
+from unittest import TestCase
+
+from lnst.Controller.MessageDispatcher import MessageDispatcher, RpcFuture
+
+
+class MachineMock(object):
+    def __init__(self, name):
+        self._name = name
+
+    def get_id(self):
+        return self._name
+
+    def get_mapped(self):
+        return True
+
+
+class QueueDispatcher(MessageDispatcher):
+    """Dispatcher receiving the messages put in its queue"""
+    def __init__(self):
+        super(QueueDispatcher, self).__init__(None)
+        self.messages = queue.Queue()
+        self.polls = 0
+
+    def check_connections(self, timeout=None):
+        self.polls += 1
+        try:
+            return [self.messages.get(timeout=timeout)]
+        except queue.Empty:
+            return []
+
+
+class RpcFutureTest(TestCase):
+    def setUp(self):
+        self.dispatcher = QueueDispatcher()
+        self.machine = MachineMock("m1")
+        self.dispatcher._machines[self.machine] = self.machine
+
+    def _future(self, request_id):
+        future = RpcFuture(self.dispatcher, self.machine, request_id)
+        self.dispatcher._pending_requests[request_id] = future
+        return future
+
+    def _reply(self, request_id, result):
+        self.dispatcher.messages.put((self.machine,
+                                      {"type": "result",
+                                       "request_id": request_id,
+                                       "result": result}))
+
+    def test_result_received_by_other_thread(self):
+        slow = self._future(0)
+        fast = self._future(1)
+        results = {}
+
+        def wait(name, future):
+            results[name] = (future.result(), time.monotonic())
+
+        threads = [threading.Thread(target=wait, args=("slow", slow)),
+                   threading.Thread(target=wait, args=("fast", fast))]
+        for thread in threads:
+            thread.start()
+
+        time.sleep(0.05)
+        self._reply(1, "fast result")
+        time.sleep(0.5)
+        replied = time.monotonic()
+        self._reply(0, "slow result")
+
+        for thread in threads:
+            thread.join(5)
+            self.assertFalse(thread.is_alive())
+
+        self.assertEqual(results["fast"][0], "fast result")
+        self.assertEqual(results["slow"][0], "slow result")
+        # the fast result isn't held back until the next message arrives
+        self.assertLess(results["fast"][1], replied)
+
+    def test_future_failed_without_message(self):
+        future = self._future(0)
+        failer = threading.Timer(
+            0.05, self.dispatcher._fail_pending_requests,
+            (self.machine, RuntimeError("disconnected")))
+        failer.start()
+
+        self.assertIsInstance(future.exception(), RuntimeError)
+        failer.join()
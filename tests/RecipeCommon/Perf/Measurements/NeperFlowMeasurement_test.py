@@ -0,0 +1,130 @@
+import io
+from types import SimpleNamespace
+from unittest import TestCase
+
+from lnst.RecipeCommon.Perf.Measurements.NeperFlowMeasurement import NeperFlowMeasurement
+from lnst.RecipeCommon.Perf.Measurements.Results.NeperFlowMeasurementResults import NeperFlowMeasurementResults
+from lnst.RecipeCommon.Perf.Measurements.Results.AggregatedNeperFlowMeasurementResults import (
+    AggregatedNeperFlowMeasurementResults,
+)
+from lnst.RecipeCommon.Perf.Results import ParallelPerfResult, SequentialPerfSeries
+from lnst.Tests.Neper import NeperClient
+
+# two threads, the first one runs two flows, the rows of the flows are
+# interleaved the way neper writes them
+SAMPLES = """\
+tid,flow_id,time,transactions,utime,stime,maxrss,minflt,majflt,nvcsw,nivcsw,latency_min,latency_mean,latency_max,latency_stddev
+0,0,100.0,0,0.0,0.0,1144,39,0,2,0,0.000000,0.000000,0.000000,-nan
+0,1,100.0,0,0.0,0.0,1144,39,0,2,0,0.000000,0.000000,0.000000,-nan
+1,2,100.5,0,0.1,0.0,1144,39,0,2,0,0.000000,0.000000,0.000000,-nan
+0,0,101.0,1000,0.2,0.3,1144,43,0,1000,0,0.000010,0.000020,0.000040,0.000005
+0,1,101.0,2000,0.2,0.3,1144,43,0,2000,0,0.000010,0.000030,0.000050,0.000005
+1,2,101.5,500,0.4,0.2,1144,43,0,500,0,0.000100,0.000200,0.000300,0.000050
+0,0,102.0,3000,0.6,0.5,1144,43,0,3000,0,0.000010,0.000040,0.000060,0.000005
+0,1,102.0,3000,0.6,0.5,1144,43,0,3000,0,nan,nan,nan,nan
+1,2,102.5,1500,0.7,0.4,1144,43,0,1500,0,0.000100,0.000400,0.000500,0.000050
+"""
+
+START_TIME = 1000.0
+
+
+def parse_samples():
+    neper = object.__new__(NeperClient)
+    return neper._parse_samples(io.StringIO(SAMPLES), START_TIME)
+
+
+def make_job(samples):
+    neper = SimpleNamespace(is_crr_server=lambda: False)
+    return SimpleNamespace(passed=True, what=neper, result={"samples": samples})
+
+
+class NeperSamplesTest(TestCase):
+    def test_samples_are_grouped_by_flow(self):
+        samples = parse_samples()
+
+        self.assertEqual(samples["latency_columns"],
+                         ["min", "mean", "max", "stddev"])
+        flows = samples["flows"]
+        self.assertEqual([(flow["tid"], flow["flow_id"]) for flow in flows],
+                         [(0, 0), (0, 1), (1, 2)])
+
+        first, second, third = flows
+        self.assertEqual(list(first["transactions"]), [1000, 2000])
+        self.assertEqual(list(second["transactions"]), [2000, 1000])
+        self.assertEqual(list(third["transactions"]), [500, 1000])
+        self.assertEqual(list(first["timestamps"]), [1000.0, 1001.0])
+        self.assertEqual(list(third["timestamps"]), [1000.5, 1001.5])
+        self.assertEqual(list(first["durations"]), [1.0, 1.0])
+        self.assertAlmostEqual(first["cpu"][0], 0.5)
+        self.assertEqual(list(first["latency"]["mean"]), [0.00002, 0.00004])
+
+    def test_job_samples(self):
+        measurement = object.__new__(NeperFlowMeasurement)
+        results, cpu_results, latency = measurement._parse_job_samples(
+            make_job(parse_samples()))
+
+        self.assertEqual(len(results), 3)
+        self.assertEqual(results.value, 7500)
+        # utime and stime are per thread, only the first flow of a thread
+        # is used for the cpu usage
+        self.assertEqual(len(cpu_results), 2)
+
+        self.assertEqual(sorted(latency), ["max", "mean", "min", "stddev"])
+        mean = latency["mean"]
+        self.assertEqual(len(mean), 3)
+        # the nan sample of the second flow is left out
+        self.assertEqual(len(mean[1]), 1)
+        self.assertAlmostEqual(mean[0].average, 0.00003)
+        self.assertAlmostEqual(mean[1].average, 0.00003)
+        self.assertAlmostEqual(mean[2].average, 0.0003)
+
+
+def make_series(values, timestamps, unit):
+    return SequentialPerfSeries(values, [1.0] * len(values), timestamps, unit)
+
+
+def make_results(timestamp):
+    timestamps = [timestamp, timestamp + 1, timestamp + 2]
+    results = NeperFlowMeasurementResults(None, True, flow=None)
+    for side in ("generator", "receiver"):
+        setattr(results, side + "_results", ParallelPerfResult(
+            [make_series([100, 100, 100], timestamps, "transactions")]))
+        setattr(results, side + "_cpu_stats", ParallelPerfResult(
+            [make_series([10, 10, 10], timestamps, "cpu_percent")]))
+        setattr(results, side + "_latency", {
+            "mean": ParallelPerfResult(
+                [make_series([0.1, 0.2, 0.3], timestamps, "seconds")]),
+            # only has a sample at the start
+            "max": ParallelPerfResult(
+                [make_series([0.5], timestamps[:1], "seconds")]),
+        })
+    return results
+
+
+class NeperFlowMeasurementResultsTest(TestCase):
+    def test_time_slice_keeps_latency(self):
+        results = make_results(1000.0)
+
+        result_slice = results.time_slice(1001.0, 1003.0)
+
+        self.assertIsInstance(result_slice, NeperFlowMeasurementResults)
+        self.assertEqual(result_slice.generator_results.value, 200)
+        for latency in (result_slice.generator_latency,
+                        result_slice.receiver_latency):
+            self.assertEqual(list(latency), ["mean"])
+            self.assertAlmostEqual(latency["mean"].value, 0.5)
+
+    def test_aggregation_keeps_latency(self):
+        aggregated = AggregatedNeperFlowMeasurementResults(None, flow=None)
+        aggregated.add_results(make_results(1000.0))
+        aggregated.add_results(make_results(2000.0))
+
+        other = AggregatedNeperFlowMeasurementResults(None, flow=None)
+        other.add_results(make_results(3000.0))
+        aggregated.add_results(other)
+
+        self.assertEqual(len(aggregated.individual_results), 3)
+        for latency in (aggregated.generator_latency,
+                        aggregated.receiver_latency):
+            self.assertEqual(sorted(latency), ["max", "mean"])
+            self.assertEqual(len(latency["mean"]), 3)
@@ -0,0 +1,33 @@
+from types import SimpleNamespace
+from unittest import TestCase
+
+from lnst.RecipeCommon.Perf.Measurements.StatCPUMeasurement import StatCPUMeasurement
+
+
+def make_job(timestamps, values):
+    data = {"cpus": ["cpu", "cpu0"],
+            "fields": ["user", "system"],
+            "timestamps": timestamps,
+            "durations": [1.0] * len(timestamps),
+            "values": values}
+    return SimpleNamespace(host="host1", passed=True, result={"data": data})
+
+
+class StatCPUMeasurementTest(TestCase):
+    def setUp(self):
+        self.measurement = StatCPUMeasurement([])
+
+    def test_single_sample(self):
+        job = make_job([], [])
+        self.assertEqual(self.measurement._process_job(job), [])
+
+    def test_series_per_cpu_and_field(self):
+        # cpu.user, cpu.system, cpu0.user, cpu0.system, two samples each
+        job = make_job([100.0, 101.0], [1, 2, 3, 4, 5, 6, 7, 8])
+        results = self.measurement._process_job(job)
+
+        self.assertEqual([result.cpu for result in results], ["cpu", "cpu0"])
+        self.assertEqual(results[0]._data["user"].value, 1 + 2)
+        self.assertEqual(results[1]._data["system"].value, 7 + 8)
+        self.assertEqual(results[1].start_timestamp, 100.0)
+        self.assertEqual(results[1].end_timestamp, 102.0)